@@ -0,0 +1,76 @@
+// Per-message overhead of the non-streaming path of pages/api/chat.ts, before and after it stopped
+// spawning "python3 main.py" for every message:
+//
+//     node benchmark_chat.mjs [--requests 50]
+//
+// A stub router that answers immediately listens on port 8080 (the URL hardcoded in main.py), so the
+// real router must not be running. Only the forwarding overhead is measured, not the model.
+import { spawn } from "child_process";
+import http from "http";
+
+const PORT = 8080;
+const PYTHON = process.env.PYTHON_EXECUTABLE || "python3";
+const argIndex = process.argv.indexOf("--requests");
+const REQUESTS = argIndex > 0 ? Number(process.argv[argIndex + 1]) : 50;
+
+const stubRouter = http.createServer((req, res) => {
+  req.resume();
+  req.on("end", () => {
+    res.writeHead(200, { "Content-Type": "application/json" });
+    res.end(JSON.stringify({ response: "Antwort des Stub-Routers." }));
+  });
+});
+
+// Before: one Python process per message, its stdout scraped for the JSON answer.
+const viaProcess = () =>
+  new Promise((resolve, reject) => {
+    const child = spawn(PYTHON, ["./main.py", "Wie zitiere ich richtig?", "benchmark"]);
+    let output = "";
+    child.stdout.on("data", (data) => (output += data.toString()));
+    child.on("error", reject);
+    child.on("close", (code) => {
+      const jsonMatch = output.match(/\{.*\}/);
+      if (code !== 0 || !jsonMatch) {
+        reject(new Error(`main.py failed with code ${code}`));
+        return;
+      }
+      resolve(JSON.parse(jsonMatch[0]).message);
+    });
+  });
+
+// After: the API route calls the router directly over a kept-alive connection.
+const viaFetch = async () => {
+  const response = await fetch(`http://localhost:${PORT}/process/`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ text: "Wie zitiere ich richtig?", session_id: "benchmark" }),
+  });
+  return (await response.json()).response;
+};
+
+const percentile = (sorted, q) => sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+
+const measure = async (run) => {
+  await run(); // warm-up
+  const timings = [];
+  for (let i = 0; i < REQUESTS; i++) {
+    const start = process.hrtime.bigint();
+    await run();
+    timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+  }
+  timings.sort((a, b) => a - b);
+  const mean = timings.reduce((sum, t) => sum + t, 0) / timings.length;
+  return [mean, percentile(timings, 0.5), percentile(timings, 0.99)];
+};
+
+stubRouter.listen(PORT, async () => {
+  try {
+    console.log(`${"path".padEnd(10)}${"mean ms".padStart(10)}${"p50 ms".padStart(10)}${"p99 ms".padStart(10)}   (${REQUESTS} requests)`);
+    for (const [name, run] of [["before", viaProcess], ["after", viaFetch]]) {
+      const [mean, p50, p99] = await measure(run);
+      console.log(`${name.padEnd(10)}${mean.toFixed(1).padStart(10)}${p50.toFixed(1).padStart(10)}${p99.toFixed(1).padStart(10)}`);
+    }
+  } finally {
+    stubRouter.close();
+  }
+});
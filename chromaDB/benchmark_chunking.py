@@ -0,0 +1,124 @@
+"""
+Vergleicht die serielle mit der parallelen Seitenextraktion des ChunkProcessors auf synthetischen PDFs:
+
+    python -m chromaDB.benchmark_chunking [--pages 400] [--files 2] [--workers 4]
+
+Die PDFs werden ohne zusätzliche Abhängigkeiten erzeugt: nummerierte Kapitel- und Abschnittsüberschriften,
+mehrzeilige Absätze und Seitenzahlen im Format "15 / 55", wie in der DHBW-Leitlinie. Der Benchmark prüft
+zusätzlich, dass beide Wege dieselben Chunks liefern.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from chromaDB.chunk_processor import ChunkProcessor
+
+WORDS = (
+    "Die Arbeit muss den Anforderungen an wissenschaftliches Arbeiten genügen und eine eigenständige "
+    "Auseinandersetzung mit der Problemstellung zeigen Quellen sind nach einer einheitlichen Zitierweise "
+    "anzugeben das Literaturverzeichnis enthält alle verwendeten Quellen die Gliederung folgt dem Vorspann "
+    "Hauptteil und Schluss der Betreuer bewertet Inhalt Methodik und Form der Bachelorarbeit"
+).split()
+LINES_PER_PAGE = 48
+CHARS_PER_LINE = 90
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def paragraph(rng):
+    """Ein Absatz aus einigen Sätzen, umbrochen auf Zeilen von höchstens CHARS_PER_LINE Zeichen."""
+    sentences = [" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "."
+                 for _ in range(rng.randint(2, 5))]
+    lines, line = [], ""
+    for word in " ".join(sentences).split():
+        if line and len(line) + len(word) + 1 > CHARS_PER_LINE:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line]
+
+
+def page_lines(pages, seed):
+    """Erzeugt die Zeilen aller Seiten: alle 10 Seiten ein Kapitel, alle 3 Seiten ein Abschnitt."""
+    rng = random.Random(seed)
+    result = []
+    for number in range(1, pages + 1):
+        chapter, page_in_chapter = divmod(number - 1, 10)
+        lines = []
+        if page_in_chapter == 0:
+            lines.append(f"{chapter + 1} Kapitel {chapter + 1} der Leitlinie")
+        if page_in_chapter % 3 == 0:
+            lines.append(f"{chapter + 1}.{page_in_chapter // 3 + 1} Abschnitt zu Seite {number}")
+        while len(lines) < LINES_PER_PAGE - 8:
+            lines.extend(paragraph(rng))
+        lines.append(f"{number} / {pages}")
+        result.append(lines)
+    return result
+
+
+def write_pdf(path, pages, seed=0):
+    """Schreibt eine PDF mit einer Helvetica-Textseite pro Eintrag von page_lines."""
+    contents = []
+    for lines in page_lines(pages, seed):
+        text = "\n".join(f"({escape(line)}) Tj T*" for line in lines)
+        contents.append(f"BT /F1 10 Tf 14 TL 40 800 Td\n{text}\nET".encode("latin-1"))
+
+    # Objekte: 1 Katalog, 2 Seitenbaum, 3 Schrift, danach je Seite das Seitenobjekt und sein Inhaltsstrom.
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for page_id, content in zip(page_ids, contents):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       f"/Contents {page_id + 1} 0 R >>".encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        f.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def measure(file_paths, workers):
+    start = time.perf_counter()
+    chunks = ChunkProcessor(file_paths, None, workers=workers).extract_paragraph_chunks_with_headings()
+    return time.perf_counter() - start, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400, help="Seiten pro PDF")
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = [os.path.join(directory, f"leitlinie_{i}.pdf") for i in range(args.files)]
+        for seed, path in enumerate(file_paths):
+            write_pdf(path, args.pages, seed)
+
+        serial, expected = measure(file_paths, 1)
+        parallel, chunks = measure(file_paths, args.workers)
+        assert chunks == expected, "Die parallele Extraktion liefert andere Chunks als die serielle."
+
+    print(f"{args.files} PDFs mit je {args.pages} Seiten, {len(expected)} Chunks")
+    print(f"{'Weg':<22}{'Sekunden':>10}{'Seiten/s':>10}")
+    for name, seconds in [("seriell", serial), (f"parallel ({args.workers} Worker)", parallel)]:
+        print(f"{name:<22}{seconds:>10.2f}{args.files * args.pages / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
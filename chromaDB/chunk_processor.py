@@ -1,12 +1,30 @@
 import json
+from concurrent.futures import ProcessPoolExecutor
 
 import pdfplumber
 import re
 
+
+def extract_page_range(file_path, start, end, max_heading_words=10):
+    """
+    Worker-Funktion für den Prozess-Pool: extrahiert die Absätze der Seiten [start, end) einer PDF.
+    Gibt eine Liste mit einer Absatzliste pro Seite zurück.
+    """
+    processor = ChunkProcessor(file_path, None)
+    with pdfplumber.open(file_path) as pdf:
+        return processor.extract_paragraphs_from_pages(pdf.pages[start:end], max_heading_words=max_heading_words)
+
+
 class ChunkProcessor:
-    def __init__(self, file_path, output_path):
-        self.file_path = file_path
+    def __init__(self, file_path, output_path, workers=1):
+        """
+        file_path kann ein einzelner Pfad oder eine Liste von PDF-Pfaden sein.
+        Bei workers > 1 werden die Seiten aller PDFs parallel in einem Prozess-Pool extrahiert.
+        """
+        self.file_paths = [file_path] if isinstance(file_path, str) else list(file_path)
+        self.file_path = self.file_paths[0]
         self.output_path = output_path
+        self.workers = workers or 1
 
     def is_heading(self, text):
         """
@@ -91,10 +109,52 @@ class ChunkProcessor:
             paragraphs.append(current_paragraph)
         return paragraphs
 
-    def extract_paragraph_chunks_with_headings(self, max_heading_words=10):
+    def extract_paragraphs_from_pages(self, pages, max_heading_words=10):
+        """
+        Extrahiert die Absätze mehrerer Seiten (eine Absatzliste pro Seite). Jede Seite wird danach
+        geschlossen: pdfplumber behält sonst die Zeichen- und Layoutobjekte aller gelesenen Seiten im
+        Speicher, bei einigen hundert Seiten mehrere GB.
         """
-        Öffnet die PDF und extrahiert seitenweise alle Absätze mithilfe der Satzzeichen-Heuristik.
-        Währenddessen wird ein Heading-Context gepflegt:
+        paragraphs = []
+        for page in pages:
+            paragraphs.append(self.extract_paragraphs_from_page(page, max_heading_words=max_heading_words))
+            page.close()
+        return paragraphs
+
+    def extract_page_paragraphs(self, file_path, max_heading_words=10):
+        """
+        Extrahiert seriell die Absätze jeder Seite einer PDF (eine Absatzliste pro Seite).
+        """
+        with pdfplumber.open(file_path) as pdf:
+            return self.extract_paragraphs_from_pages(pdf.pages, max_heading_words=max_heading_words)
+
+    def extract_page_paragraphs_parallel(self, max_heading_words=10):
+        """
+        Verteilt die Seiten aller PDFs in Seitenblöcken auf einen Prozess-Pool.
+        Gibt pro PDF die Absatzlisten ihrer Seiten in der ursprünglichen Reihenfolge zurück.
+        """
+        tasks = []
+        for file_path in self.file_paths:
+            with pdfplumber.open(file_path) as pdf:
+                page_count = len(pdf.pages)
+            # Mehrere Blöcke pro Worker, damit ungleich aufwendige Seiten die Last nicht einseitig verteilen.
+            block_size = max(1, -(-page_count // (self.workers * 4)))
+            for start in range(0, page_count, block_size):
+                tasks.append((file_path, start, min(start + block_size, page_count)))
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(extract_page_range, file_path, start, end, max_heading_words)
+                for file_path, start, end in tasks
+            ]
+            pages_per_file = {file_path: [] for file_path in self.file_paths}
+            for (file_path, _, _), future in zip(tasks, futures):
+                pages_per_file[file_path].extend(future.result())
+        return [pages_per_file[file_path] for file_path in self.file_paths]
+
+    def merge_pages_with_headings(self, pages):
+        """
+        Fügt die Absätze der Seiten in Reihenfolge zu Chunks zusammen und pflegt dabei einen Heading-Context:
           - Wird ein Absatz als Überschrift erkannt, wird der Kontext (alle übergeordneten Überschriften)
             aktualisiert.
           - Jeder Nicht-Überschrift-Absatz erhält den aktuellen Heading-Context als Metadatum.
@@ -102,28 +162,44 @@ class ChunkProcessor:
         """
         chunks = []
         heading_context = []  # z.B. ["7 Modul Bachelorarbeit …", "7.1 Anforderungen und Ablauf"]
-        with pdfplumber.open(self.file_path) as pdf:
-            for page in pdf.pages:
-                paragraphs = self.extract_paragraphs_from_page(page, max_heading_words=max_heading_words)
-                for paragraph in paragraphs:
-                    if self.is_heading(paragraph):
-                        level = self.get_heading_level(paragraph)
-                        if level is not None:
-                            # Sorge dafür, dass der Context mindestens "level" Einträge enthält.
-                            if len(heading_context) < level:
-                                heading_context.extend([None] * (level - len(heading_context)))
-                            # Setze auf der aktuellen Ebene die Überschrift und entferne alle tieferen Ebenen.
-                            heading_context[level - 1] = paragraph
-                            heading_context = heading_context[:level]
-                        chunks.append({
-                            "text": paragraph,
-                            "headings": heading_context.copy()
-                        })
-                    else:
-                        chunks.append({
-                            "text": paragraph,
-                            "headings": heading_context.copy()
-                        })
+        for paragraphs in pages:
+            for paragraph in paragraphs:
+                if self.is_heading(paragraph):
+                    level = self.get_heading_level(paragraph)
+                    if level is not None:
+                        # Sorge dafür, dass der Context mindestens "level" Einträge enthält.
+                        if len(heading_context) < level:
+                            heading_context.extend([None] * (level - len(heading_context)))
+                        # Setze auf der aktuellen Ebene die Überschrift und entferne alle tieferen Ebenen.
+                        heading_context[level - 1] = paragraph
+                        heading_context = heading_context[:level]
+                    chunks.append({
+                        "text": paragraph,
+                        "headings": heading_context.copy()
+                    })
+                else:
+                    chunks.append({
+                        "text": paragraph,
+                        "headings": heading_context.copy()
+                    })
+        return chunks
+
+    def extract_paragraph_chunks_with_headings(self, max_heading_words=10):
+        """
+        Öffnet die PDFs und extrahiert seitenweise alle Absätze mithilfe der Satzzeichen-Heuristik –
+        seriell oder, bei workers > 1, parallel. Der Heading-Context wird anschließend in einem
+        sequentiellen Durchlauf pro PDF ergänzt, sodass beide Wege dieselben Chunks liefern.
+        """
+        if self.workers > 1:
+            pages_per_file = self.extract_page_paragraphs_parallel(max_heading_words=max_heading_words)
+        else:
+            pages_per_file = [
+                self.extract_page_paragraphs(file_path, max_heading_words=max_heading_words)
+                for file_path in self.file_paths
+            ]
+        chunks = []
+        for pages in pages_per_file:
+            chunks.extend(self.merge_pages_with_headings(pages))
         return chunks
 
     def assign_tags(self, text):
@@ -156,5 +232,10 @@ class ChunkProcessor:
         for chunk in chunks:
             chunk["tags"] = self.assign_tags(chunk["text"])
 
+        # JSON-Lines (.jsonl): ein Chunk pro Zeile, damit der DataLoader die Chunks streamen kann.
         with open(self.output_path, 'w') as json_file:
-            json.dump(chunks, json_file)
\ No newline at end of file
+            if self.output_path.endswith(".jsonl"):
+                for chunk in chunks:
+                    json_file.write(json.dumps(chunk) + "\n")
+            else:
+                json.dump(chunks, json_file)
\ No newline at end of file
@@ -1,14 +1,39 @@
 import json
 import logging
+import queue
+import threading
+import time
 from sentence_transformers import SentenceTransformer
 import chromadb
 
+from chromaDB.embedding_cache import EmbeddingCache
+from chromaDB.vector_index import write_vector_index
+from chromaDB.manifest import (IngestionManifest, iter_chunk_ids, corpus_version,
+                               EMBEDDING_MODEL, EMBEDDING_DIM, COLLECTION_NAME)
+
+_END_OF_STREAM = None
+
 
 class DataLoader:
-    def __init__(self, chunked_data_path):
+    def __init__(self, chunked_data_path, manifest: IngestionManifest = None,
+                 encode_batch_size=64, upload_batch_size=256, queue_size=4,
+                 embedding_cache_dir="./data/embedding_cache", vector_index_dir="./data/vector_index"):
+        """
+        encode_batch_size: Anzahl Texte pro model.encode-Aufruf
+        upload_batch_size: Anzahl Chunks pro Schreibzugriff auf ChromaDB
+        queue_size: maximale Anzahl eingebetteter Batches, die auf den Upload warten
+        embedding_cache_dir: Verzeichnis des persistenten Embedding-Caches (None deaktiviert ihn)
+        vector_index_dir: Zielverzeichnis des NumPy-Index für den Router (None deaktiviert den Export)
+        """
         self.setup_logger()
         self.logger = logging.getLogger("data_loader")
         self.path = chunked_data_path
+        self.manifest = manifest
+        self.encode_batch_size = encode_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.queue_size = queue_size
+        self.embedding_cache_dir = embedding_cache_dir
+        self.vector_index_dir = vector_index_dir
 
     def setup_logger(self):
         logger = logging.getLogger("data_loader")
@@ -30,16 +55,18 @@ class DataLoader:
             logger.addHandler(console_handler)
             logger.addHandler(file_handler)
 
-    def load_json_data(self):
-        self.logger.debug(f"Loading JSON data from: {self.path}")
-        try:
-            with open(self.path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            self.logger.info(f"Successfully loaded {len(data)} items from: {self.path}")
-            return data
-        except FileNotFoundError:
-            self.logger.error(f"Error: File not found at {self.path}")
-            return None
+    def iter_chunks(self):
+        """
+        Liest die Chunks einzeln ein: JSON-Lines (.jsonl) zeilenweise, ansonsten als JSON-Liste.
+        """
+        self.logger.debug(f"Streaming chunks from: {self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            if self.path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from json.load(f)
 
     def create_embeddings(self, text_list, model):
         self.logger.debug(f"Creating embeddings for {len(text_list)} texts")
@@ -48,50 +75,186 @@ class DataLoader:
         return embeddings
 
     def extract_meta_data(self, data):
+        """
+        Überschriften als Text, jeder Tag als eigener boolescher Schlüssel (z.B. tag_Zitierweise: True),
+        damit der Router mit where={"tag_Zitierweise": True} filtern kann.
+        """
         metadata_list = []
         for item in data:
-            headings = ""
-            tags = ""
-            for heading in item["headings"]:
-                headings += f"{heading}, "
+            metadata = {"headings": ", ".join(item["headings"])}
             for tag in item["tags"]:
-                tags += f"{tag}, "
-            metadata_list.append({"headings": headings, "tags": tags})
+                metadata[f"tag_{tag}"] = True
+            metadata_list.append(metadata)
         return metadata_list
 
-    def insert_into_chorma_db(self, texts, embeddings, metadata_list):
+    def get_collection(self):
         client = chromadb.HttpClient(host="localhost", port=8000)
         self.logger.debug("Chroma client initialized.")
 
         # Collection erstellen oder abrufen
-        collection = client.get_or_create_collection("dhbw_rules")
-        self.logger.debug("Collection 'dhbw_rules' created or retrieved.")
-
-        # IDs für jeden Chunk generieren
-        ids = [f"chunk-{i}" for i in range(len(texts))]
+        collection = client.get_or_create_collection(COLLECTION_NAME)
+        self.logger.debug(f"Collection '{COLLECTION_NAME}' created or retrieved.")
+        return collection
 
-        # Daten in ChromaDB hinzufügen
-        collection.add(
-            embeddings=embeddings.tolist(),
+    def insert_into_chorma_db(self, collection, ids, texts, embeddings, metadata_list):
+        # Neue oder geänderte Chunks einfügen bzw. überschreiben
+        collection.upsert(
+            embeddings=embeddings,
             documents=texts,
             metadatas=metadata_list,
             ids=ids
         )
-        self.logger.info("Embeddings and documents added to ChromaDB.")
-        self.logger.info(f"Number of items in collection: {collection.count()}")
+        self.logger.debug(f"{len(ids)} embeddings and documents upserted into ChromaDB.")
+
+    def delete_from_chroma_db(self, collection, ids):
+        collection.delete(ids=ids)
+        self.logger.info(f"{len(ids)} stale chunks deleted from ChromaDB.")
+
+    def set_corpus_version(self, collection, version):
+        """
+        Schreibt die Korpus-Version in die Metadaten der Collection. Der Router leert daran seinen Retrieval-Cache.
+        """
+        metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+        metadata["corpus_version"] = version
+        collection.modify(metadata=metadata)
+        self.logger.info(f"Corpus version set to {version}.")
+
+    def export_vector_index(self, collection, version, page_size=1000):
+        """
+        Liest die komplette Collection seitenweise aus und schreibt sie als memory-mapbaren NumPy-Index.
+        """
+        ids, documents, metadatas, embeddings = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            embeddings.extend(page["embeddings"])
+            offset += len(page["ids"])
+        write_vector_index(self.vector_index_dir, ids, documents, metadatas, embeddings, version)
+        self.logger.info(f"Vector index with {len(ids)} chunks written to {self.vector_index_dir}.")
+
+    def upload_worker(self, collection, upload_queue, stats):
+        """
+        Nimmt eingebettete Batches aus der Queue und schreibt sie in Batches von upload_batch_size nach ChromaDB.
+        Nach einem Fehler wird die Queue weiter geleert, damit der Producer nicht blockiert.
+        """
+        pending = {"ids": [], "texts": [], "embeddings": [], "metadata": []}
+
+        def flush():
+            if not pending["ids"] or stats["error"]:
+                return
+            start = time.perf_counter()
+            self.insert_into_chorma_db(
+                collection, pending["ids"], pending["texts"], pending["embeddings"], pending["metadata"]
+            )
+            stats["upload_seconds"] += time.perf_counter() - start
+            stats["uploaded"] += len(pending["ids"])
+            self.logger.info(f"Uploaded {stats['uploaded']} chunks "
+                             f"({stats['uploaded'] / max(stats['upload_seconds'], 1e-9):.1f} chunks/s upload).")
+            for values in pending.values():
+                values.clear()
+
+        while True:
+            batch = upload_queue.get()
+            try:
+                if batch is _END_OF_STREAM:
+                    flush()
+                    return
+                for key, values in batch.items():
+                    pending[key].extend(values)
+                if len(pending["ids"]) >= self.upload_batch_size:
+                    flush()
+            except Exception as e:
+                self.logger.error(f"Upload to ChromaDB failed: {e}")
+                stats["error"] = e
 
     def load(self):
-        data = self.load_json_data()
-        if data is None:
-            exit(1)
+        manifest = self.manifest
+        collection = self.get_collection()
+        stored_ids = set(collection.get(include=[])["ids"])
+        indexed_ids = set()
+        if manifest is not None and manifest.matches_index():
+            # Das Manifest allein reicht nicht: Wurde die Collection geleert oder gelöscht, müssen die Chunks
+            # neu hochgeladen werden, auch wenn das Manifest sie noch als indexiert führt.
+            indexed_ids = set(manifest.data["chunks"]) & stored_ids
+        model = None
+        cache = None
+        if self.embedding_cache_dir:
+            cache = EmbeddingCache(self.embedding_cache_dir, EMBEDDING_MODEL, EMBEDDING_DIM)
+        stats = {"uploaded": 0, "upload_seconds": 0.0, "error": None}
+        upload_queue = queue.Queue(maxsize=self.queue_size)
+        uploader = threading.Thread(target=self.upload_worker, args=(collection, upload_queue, stats), daemon=True)
+        uploader.start()
+
+        ids = []
+        batch = []
+        encoded = 0
+        encode_seconds = 0.0
+        start = time.perf_counter()
+
+        def encode_missing(texts):
+            # Das Modell wird erst geladen, wenn ein Text nicht im Cache liegt.
+            nonlocal model
+            if model is None:
+                model = SentenceTransformer(EMBEDDING_MODEL)
+            return self.create_embeddings(texts, model)
 
-        texts = [item["text"] for item in data]
-        metadata_list = self.extract_meta_data(data)
+        def encode_batch():
+            nonlocal encoded, encode_seconds
+            encode_start = time.perf_counter()
+            texts = [item["text"] for _, item in batch]
+            embeddings = cache.encode(texts, encode_missing) if cache else encode_missing(texts)
+            encode_seconds += time.perf_counter() - encode_start
+            encoded += len(batch)
+            # Blockiert, sobald queue_size Batches auf den Upload warten (begrenzter Speicherbedarf).
+            upload_queue.put({
+                "ids": [chunk_id for chunk_id, _ in batch],
+                "texts": [item["text"] for _, item in batch],
+                "embeddings": embeddings.tolist(),
+                "metadata": self.extract_meta_data([item for _, item in batch]),
+            })
+            self.logger.info(f"Encoded {encoded} chunks ({encoded / max(encode_seconds, 1e-9):.1f} chunks/s encoding).")
+            batch.clear()
 
-        self.logger.debug(f"Number of texts: {len(texts)}")
+        try:
+            # Nur Chunks, deren Inhalt noch nicht indexiert ist, werden neu eingebettet.
+            for chunk_id, item in iter_chunk_ids(self.iter_chunks()):
+                ids.append(chunk_id)
+                if chunk_id in indexed_ids:
+                    continue
+                batch.append((chunk_id, item))
+                if len(batch) >= self.encode_batch_size:
+                    encode_batch()
+            if batch:
+                encode_batch()
+        except FileNotFoundError:
+            self.logger.error(f"Error: File not found at {self.path}")
+            exit(1)
+        finally:
+            upload_queue.put(_END_OF_STREAM)
+            uploader.join()
+        if stats["error"]:
+            raise stats["error"]
 
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        embeddings = self.create_embeddings(texts, model)
-        self.logger.info(f"Generated {len(embeddings)} embeddings.")
+        # Veraltete Chunks werden anhand der tatsächlich gespeicherten IDs bestimmt, nicht anhand des Manifests:
+        # Ohne passendes Manifest (erster Lauf, neues Modell, neue METADATA_VERSION) blieben sie sonst liegen.
+        stale_ids = sorted(stored_ids - set(ids))
+        if stale_ids:
+            self.delete_from_chroma_db(collection, stale_ids)
+        elapsed = time.perf_counter() - start
+        self.logger.info(f"Number of texts: {len(ids)}, new or changed: {encoded}, removed: {len(stale_ids)}, "
+                         f"{elapsed:.2f}s total ({encoded / max(elapsed, 1e-9):.1f} chunks/s end-to-end).")
+        self.logger.info(f"Number of items in collection: {collection.count()}")
+        version = corpus_version(ids)
+        self.set_corpus_version(collection, version)
+        if self.vector_index_dir:
+            self.export_vector_index(collection, version)
+        if cache:
+            self.logger.info(f"Embedding cache: {cache.stats()}")
 
-        self.insert_into_chorma_db(texts, embeddings, metadata_list)
+        if manifest is not None:
+            manifest.record_chunks(ids)
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+KEY_SIZE = 16
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()[:KEY_SIZE]
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model id, normalized text hash).
+
+    Vectors live in a memory-mapped float32 array with one row per slot; a parallel memory-mapped
+    array holds the key of every slot. The key -> slot index with last-use times is a small SQLite
+    file, which also serializes writers across threads and processes. When all `max_entries` slots
+    are taken, the least recently used entries are evicted and their slots reused.
+    """
+
+    def __init__(self, directory: str, model_name: str, dim: int, max_entries: int = 50000):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key BLOB PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+        vectors_created = self._create_file("vectors.f32", max_entries * dim * 4)
+        keys_created = self._create_file("keys.bin", max_entries * KEY_SIZE)
+        if vectors_created or keys_created:
+            # Dimension or size changed: the stored slots are no longer valid.
+            conn.execute("DELETE FROM entries")
+        self.vectors = np.memmap(os.path.join(self.directory, "vectors.f32"), dtype=np.float32, mode="r+",
+                                 shape=(max_entries, dim))
+        self.keys = np.memmap(os.path.join(self.directory, "keys.bin"), dtype=np.uint8, mode="r+",
+                              shape=(max_entries, KEY_SIZE))
+
+    def _create_file(self, name, size):
+        """Creates (or recreates) a zero-filled file of the given size; returns True if it had to be created."""
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            return False
+        with open(path, "wb") as f:
+            f.truncate(size)
+        return True
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, texts):
+        """Returns one vector per text, or None where the text is not cached."""
+        keys = [text_key(text) for text in texts]
+        conn = self._connection()
+        slots = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), 500):
+            part = unique_keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            slots.update(rows)
+        results = []
+        found = []
+        for key in keys:
+            slot = slots.get(key)
+            vector = None
+            if slot is not None:
+                # The slot may be reused by a concurrent writer; only accept the row if its key still matches.
+                vector = np.array(self.vectors[slot])
+                if self.keys[slot].tobytes() != key:
+                    vector = None
+            if vector is not None:
+                found.append(key)
+            results.append(vector)
+        now = time.time()
+        for i in range(0, len(found), 500):
+            part = found[i:i + 500]
+            conn.execute(f"UPDATE entries SET last_used = ? WHERE key IN ({','.join('?' * len(part))})", [now] + part)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return results
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        entries = {}
+        for text, vector in zip(texts, vectors):
+            entries[text_key(text)] = vector
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = {}
+            keys = list(entries)
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                existing.update(conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall())
+            new_keys = [key for key in keys if key not in existing][:self.max_entries]
+            count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            free = list(range(count, min(count + len(new_keys), self.max_entries)))
+            evict = len(new_keys) - len(free)
+            if evict > 0:
+                rows = conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)
+                ).fetchall()
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+                free.extend(slot for _, slot in rows)
+            for key, slot in zip(new_keys, free):
+                self.keys[slot] = 0
+                self.vectors[slot] = entries[key]
+                self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+            conn.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, now) for key, slot in zip(new_keys, free)]
+            )
+            self.vectors.flush()
+            self.keys.flush()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def encode(self, texts, encode_fn):
+        """
+        Returns the embeddings of all texts as a float32 array, calling encode_fn only for the texts
+        that are not cached yet and storing their embeddings.
+        """
+        texts = list(texts)
+        cached = self.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            # Texts that only differ in whitespace share a key and are encoded once.
+            representatives = {}
+            for i in missing:
+                representatives.setdefault(text_key(texts[i]), texts[i])
+            missing_texts = list(representatives.values())
+            encoded = np.asarray(encode_fn(missing_texts), dtype=np.float32)
+            self.put_many(missing_texts, encoded)
+            by_key = dict(zip(representatives.keys(), encoded))
+            for i in missing:
+                cached[i] = by_key[text_key(texts[i])]
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack(cached)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "max_entries": self.max_entries,
+            }
+
+
+class CachedEmbeddingModel:
+    """
+    Wraps a SentenceTransformer so that encode() consults the embedding cache first.
+    """
+
+    def __init__(self, model, cache: EmbeddingCache):
+        self.model = model
+        self.cache = cache
+
+    def encode(self, texts, normalize_embeddings=False):
+        single = isinstance(texts, str)
+        vectors = self.cache.encode([texts] if single else texts, lambda missing: self.model.encode(missing))
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors[0] if single else vectors
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384
+# Wird erhöht, wenn sich das Format der Chunk-Metadaten ändert; alle Chunks werden dann neu geschrieben.
+METADATA_VERSION = 2
+COLLECTION_NAME = "dhbw_rules"
+
+
+def file_hash(path):
+    """
+    SHA-256 des Dateiinhalts, blockweise gelesen.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(chunk):
+    """
+    SHA-256 über Text, Überschriften und Tags eines Chunks.
+    Ändert sich eines davon, ändert sich auch die ID des Chunks.
+    """
+    content = json.dumps(
+        {"text": chunk["text"], "headings": chunk["headings"], "tags": chunk.get("tags", [])},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def iter_chunk_ids(chunks):
+    """
+    Liefert (ID, Chunk)-Paare mit stabilen, inhaltsbasierten IDs. Identische Chunks erhalten einen laufenden Suffix.
+    """
+    seen = {}
+    for chunk in chunks:
+        base = f"chunk-{chunk_hash(chunk)[:32]}"
+        seen[base] = seen.get(base, 0) + 1
+        yield (base if seen[base] == 1 else f"{base}-{seen[base]}"), chunk
+
+
+def chunk_ids(chunks):
+    return [chunk_id for chunk_id, _ in iter_chunk_ids(chunks)]
+
+
+def corpus_version(ids, embedding_model=EMBEDDING_MODEL):
+    """
+    Inhaltsbasierte Version des Korpus: ändert sich, sobald ein Chunk hinzukommt, wegfällt oder sich ändert.
+    """
+    digest = hashlib.sha256(embedding_model.encode("utf-8"))
+    for chunk_id in sorted(ids):
+        digest.update(chunk_id.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class IngestionManifest:
+    """
+    Hält fest, welche Quelldateien und Chunks mit welchem Embedding-Modell in welche Collection indexiert wurden.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {"embedding_model": None, "collection": None, "metadata_version": None, "sources": {}, "chunks": []}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    def matches_index(self, embedding_model=EMBEDDING_MODEL, collection=COLLECTION_NAME):
+        return (self.data["embedding_model"] == embedding_model and self.data["collection"] == collection
+                and self.data["metadata_version"] == METADATA_VERSION)
+
+    def is_current(self, source_paths, embedding_model=EMBEDDING_MODEL, collection=COLLECTION_NAME):
+        """
+        True, wenn alle Quelldateien unverändert und mit demselben Modell in dieselbe Collection indexiert sind.
+        """
+        if not self.matches_index(embedding_model, collection):
+            return False
+        sources = self.data["sources"]
+        if set(sources) != set(source_paths):
+            return False
+        return all(sources[path] == file_hash(path) for path in source_paths)
+
+    def record_sources(self, source_paths):
+        self.data["sources"] = {path: file_hash(path) for path in source_paths}
+
+    def record_chunks(self, ids, embedding_model=EMBEDDING_MODEL, collection=COLLECTION_NAME):
+        self.data["chunks"] = list(ids)
+        self.data["embedding_model"] = embedding_model
+        self.data["collection"] = collection
+        self.data["metadata_version"] = METADATA_VERSION
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
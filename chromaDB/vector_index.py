@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+RECORDS_FILE = "records.json"
+
+logger = logging.getLogger("router")
+
+
+def write_vector_index(directory, ids, documents, metadatas, embeddings, version):
+    """
+    Writes an index that VectorIndex can memory-map. The embeddings go into a file named after the
+    version; records.json, which points at it, is replaced last, so readers never see a half-written index.
+    """
+    os.makedirs(directory, exist_ok=True)
+    embeddings_file = f"embeddings-{version}.npy"
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    tmp_path = os.path.join(directory, f"{embeddings_file}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_path, os.path.join(directory, embeddings_file))
+
+    records = {
+        "version": version,
+        "embeddings_file": embeddings_file,
+        "ids": list(ids),
+        "documents": list(documents),
+        "metadatas": list(metadatas),
+    }
+    tmp_path = os.path.join(directory, f"{RECORDS_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, RECORDS_FILE))
+
+    for name in os.listdir(directory):
+        if name.startswith("embeddings-") and name.endswith(".npy") and name != embeddings_file:
+            os.remove(os.path.join(directory, name))
+
+
+def _matches(metadata, where):
+    """
+    Every condition in `where` has to hold; values are compared for equality, like Chroma's where filter.
+    Tags are stored as tag_<name> flags, so a tag filter is an exact match on its flag.
+    """
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+class VectorIndex:
+    """
+    In-process exact nearest-neighbour index over a memory-mapped embedding matrix.
+    Query results have the same shape as those of a Chroma collection (squared L2 distances).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.version = None
+        self._mtime = None
+        self._missing = False
+        self._state = ([], [], [], np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.float32))
+        self.reload()
+
+    def reload(self):
+        """
+        Loads the index again if records.json changed on disk; returns True if it did.
+        Until the DataLoader has exported an index, the index stays empty and queries return no documents.
+        """
+        path = os.path.join(self.directory, RECORDS_FILE)
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            if not self._missing:
+                logger.warning(f"No vector index at {path} yet; retrieval returns no documents until the "
+                               f"ingestion (init_data.py) has exported one.")
+                self._missing = True
+            return False
+        self._missing = False
+        if mtime == self._mtime:
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        embeddings = np.load(os.path.join(self.directory, records["embeddings_file"]), mmap_mode="r")
+        # Swapped in one assignment, so concurrent queries see either the old or the new index.
+        self._state = (records["ids"], records["documents"], records["metadatas"], embeddings,
+                       np.einsum("ij,ij->i", embeddings, embeddings))
+        self.version = records["version"]
+        self._mtime = mtime
+        return True
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        ids, documents, metadatas, embeddings, norms = self._state
+        candidates = np.arange(len(ids))
+        if where:
+            candidates = np.array([i for i in candidates if _matches(metadatas[i], where)], dtype=np.int64)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if len(candidates) == 0:
+            for key in results:
+                results[key] = [[] for _ in queries]
+            return results
+
+        matrix = embeddings if not where else embeddings[candidates]
+        distances = norms[candidates][None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * queries @ matrix.T
+        k = min(n_results, len(candidates))
+        for row in distances:
+            top = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(row[top])]
+            chosen = candidates[top]
+            results["ids"].append([ids[i] for i in chosen])
+            results["documents"].append([documents[i] for i in chosen])
+            results["metadatas"].append([metadatas[i] for i in chosen])
+            results["distances"].append([float(d) for d in row[top]])
+        return results
@@ -1,11 +1,14 @@
+import os
+import sys
+
 import requests
 
-from chromaDB.chunk_processor import ChunkProcessor
-from chromaDB.data_loader import DataLoader
+from chromaDB.manifest import IngestionManifest
 
 ROUTER_API_RESET_URL = "http://localhost:8080/reset/"
 pdf_path = "./data/191212_Leitlinien_Praxismodule_Studien_Bachelorarbeiten.pdf"
-output_path = './data/dhbw_rules.json'
+output_path = './data/dhbw_rules.jsonl'
+manifest_path = './data/dhbw_rules.manifest.json'
 
 def reset_chat():
     try:
@@ -16,9 +19,26 @@ def reset_chat():
         return {"error": f"Error contacting router_api: {e}"}
 
 
+def ingest(force=False):
+    manifest = IngestionManifest(manifest_path)
+    if not force and os.path.exists(output_path) and manifest.is_current([pdf_path]):
+        print("Sources unchanged, skipping ingestion.")
+        return
+
+    # Erst hier importieren, damit der Fall ohne Änderungen weder pdfplumber noch das Embedding-Modell lädt.
+    from chromaDB.chunk_processor import ChunkProcessor
+    from chromaDB.data_loader import DataLoader
+
+    workers = int(os.environ.get("CHUNK_WORKERS", os.cpu_count() or 1))
+    chunker = ChunkProcessor(pdf_path, output_path, workers=workers)
+    chunker.chunk()
+    data_loader = DataLoader(output_path, manifest)
+    data_loader.load()
+    manifest.record_sources([pdf_path])
+    manifest.save()
+
 
-chunker = ChunkProcessor(pdf_path, output_path)
-chunker.chunk()
-data_loader = DataLoader(output_path)
-data_loader.load()
-reset_chat()
\ No newline at end of file
+# Der Guard ist nötig, weil der Prozess-Pool des ChunkProcessors dieses Modul in den Workern neu importieren kann.
+if __name__ == "__main__":
+    ingest(force="--force" in sys.argv)
+    reset_chat()
@@ -5,9 +5,9 @@ import requests
 ROUTER_API_URL = "http://localhost:8080/process/"  # Port 8080 in docker-compose.yml
 
 
-def start_tutor(question):
+def start_tutor(question, session_id="default"):
     try:
-        response = requests.post(ROUTER_API_URL, json={"text": question})
+        response = requests.post(ROUTER_API_URL, json={"text": question, "session_id": session_id})
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -21,8 +21,9 @@ def main():
             question = sys.argv[1]
         else:
             question = "Default Question"
+        session_id = sys.argv[2] if len(sys.argv) > 2 else "default"
 
-        message_json = start_tutor(question)
+        message_json = start_tutor(question, session_id)
         message = message_json.get("response", "No message generated.")
 
         response.update({"message": message})
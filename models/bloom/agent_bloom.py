@@ -1,79 +1,243 @@
 from typing import List
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, StoppingCriteriaList, TextIteratorStreamer
 from contextlib import asynccontextmanager
 
 import torch
+import os
+import json
 import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from generation import (PrefixCache, BatchScheduler, CancelFlag, InputBuffer, generation_config, sample_debug,
+                        traced_generate)
+from model_loading import load_model, report_startup, BackgroundLoader
+from tracing import tracer
 
 
 # Verwende das deutsch optimierte Modell
 MODEL_NAME = "malteos/bloom-6b4-clp-german"
+USE_PREFIX_CACHE = os.environ.get("USE_PREFIX_CACHE", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 4))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 20))
+MAX_INPUT_TOKENS = 512
+# Streamed requests bypass the batch scheduler; at most STREAM_WORKERS of them generate at the same time.
+STREAM_WORKERS = int(os.environ.get("STREAM_WORKERS", 1))
+
+# Der Prompt wird so formuliert, dass das Modell als Experte für deutsche Grammatik agiert.
+# Der feste Anfang des Prompts wird einmalig vorberechnet (siehe PrefixCache).
+GRAMMAR_PREFIX = """
+       Du bist ein hochqualifizierter Lektor für deutsche Sprache. Deine Aufgabe ist es, einen gegebenen deutschen Text auf grammatikalische Fehler zu korrigieren.
+
+       Befolge diese Regeln:
+       1. Korrigiere ausschließlich Grammatik, Rechtschreibung und Zeichensetzung.
+       2. Behalte den ursprünglichen Sinn des Textes bei.
+       3. Gib nur den korrigierten Text zurück, ohne zusätzliche Erklärungen.
+
+       Beispiele:
+       - "Main Nahme isd Mike." -> "Mein Name ist Mike."
+       - "Ich gehe zum gesheft." -> "Ich gehe zum Geschäft."
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    torch_dtype=torch.bfloat16,
-    device_map="auto"
-)
-tokenizer.pad_token = tokenizer.eos_token
+       Hier hast du weitere hinweise aus dem wissenschaftlichen Richtlinien, welche dir helfen können: """
+GRAMMAR_TEXT = '\n\n       Zu korrigierender Text: "{text}"\n       Korrigierter Text:\n       '
+GRAMMAR_SUFFIX = '{context}' + GRAMMAR_TEXT
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Set by load() in a background thread started from lifespan; requests are rejected with 503 until then.
+tokenizer = None
+model = None
+grammar_prefix = None
+# Resolved once in load(), so the request path neither looks up the device nor rebuilds generation settings.
+grammar_config = None
+input_buffer = None
+
+
+def load(loader: BackgroundLoader):
+    global tokenizer, model, grammar_prefix, grammar_config, input_buffer
+    loader.stage("tokenizer")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    loader.stage("model")
+    # MODEL_PRECISION=int8/int4 and MODEL_DEVICE=cpu allow running the grammar agent on CPU-only nodes.
+    model = load_model(MODEL_NAME)
+    grammar_config = generation_config(
+        model, max_new_tokens=512, num_beams=1, early_stopping=True, pad_token_id=tokenizer.pad_token_id
+    )
+    input_buffer = InputBuffer(model.device, tokenizer.pad_token_id)
+    loader.stage("warm-up")
+    report_startup(model, tokenizer)
+    loader.stage("prefix cache")
+    grammar_prefix = PrefixCache(model, tokenizer, GRAMMAR_PREFIX)
+
+
+loader = BackgroundLoader(load)
+
 
 class TextInput(BaseModel):
     text: str
     context: str
 
 
+def format_output(output):
+    return output.replace("\n", "").replace("\t", "").replace("  ", "").replace("\"", "")
+
+
+def formatted_deltas(fragments):
+    """
+    Yields format_output of the text generated so far as increments. Only the text up to its last
+    non-whitespace character is formatted until the end, since format_output merges whitespace runs
+    that may continue in the next fragment.
+    """
+    text, sent = "", ""
+    for fragment in fragments:
+        text += fragment
+        formatted = format_output(text.rstrip())
+        if len(formatted) > len(sent) and formatted.startswith(sent):
+            yield formatted[len(sent):]
+            sent = formatted
+    formatted = format_output(text)
+    if len(formatted) > len(sent) and formatted.startswith(sent):
+        yield formatted[len(sent):]
+
+
+def encode_request(context, text):
+    """
+    Token ids of the prompt suffix. If prefix and suffix exceed MAX_INPUT_TOKENS, the context is
+    shortened; the text to correct is always kept in full.
+    """
+    text_ids = tokenizer(GRAMMAR_TEXT.format(text=text), add_special_tokens=False).input_ids
+    context_ids = tokenizer(context, add_special_tokens=False).input_ids
+    room = max(MAX_INPUT_TOKENS - grammar_prefix.length - len(text_ids), 0)
+    return context_ids[:room] + text_ids
+
+
+def prompt_inputs(suffix_ids):
+    """Left-padded input_ids and attention_mask of the full prompts, for generation without prefix cache."""
+    prefix_ids = grammar_prefix.prefix_ids[0].tolist()
+    input_ids, attention_mask = input_buffer.pack([prefix_ids + ids for ids in suffix_ids])
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def check_grammar_batch(suffix_ids):
+    if USE_PREFIX_CACHE:
+        generated = grammar_prefix.generate(suffix_ids, generation_config=grammar_config)
+    else:
+        inputs = prompt_inputs(suffix_ids)
+        input_length = inputs["input_ids"].shape[1]
+        outputs = traced_generate(model.generate, **inputs, generation_config=grammar_config)
+        generated = [output[input_length:] for output in outputs]
+    results = []
+    for generated_tokens in generated:
+        output = tokenizer.decode(generated_tokens, skip_special_tokens=True)
+        results.append(format_output(output))
+    return results
+
+
+scheduler = BatchScheduler(check_grammar_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    model.eval()
-    logging.debug("Modell set to evaluation mode.")
+    loader.start()
+    scheduler.start()
     yield
+    await scheduler.stop()
+    stream_executor.shutdown(wait=False, cancel_futures=True)
     torch.cuda.empty_cache()
     logging.debug("Shutdown performed successfully.")
 
 app = FastAPI(lifespan=lifespan)
+tracer.install(app)
 
-# TODO: Bring down responding time
-# TODO: Provide good Answers
-@app.post("/process/")
-async def check_grammar(input: TextInput):
-    # Der Prompt wird so formuliert, dass das Modell als Experte für deutsche Grammatik agiert.
-    prompt = f"""
-       Du bist ein hochqualifizierter Lektor für deutsche Sprache. Deine Aufgabe ist es, einen gegebenen deutschen Text auf grammatikalische Fehler zu korrigieren.
 
-       Befolge diese Regeln:
-       1. Korrigiere ausschließlich Grammatik, Rechtschreibung und Zeichensetzung.
-       2. Behalte den ursprünglichen Sinn des Textes bei.
-       3. Gib nur den korrigierten Text zurück, ohne zusätzliche Erklärungen.
+def require_ready():
+    if not loader.ready:
+        raise HTTPException(status_code=503, detail=loader.status(), headers={"Retry-After": "10"})
 
-       Beispiele:
-       - "Main Nahme isd Mike." -> "Mein Name ist Mike."
-       - "Ich gehe zum gesheft." -> "Ich gehe zum Geschäft."
 
-       Hier hast du weitere hinweise aus dem wissenschaftlichen Richtlinien, welche dir helfen können: {input.context}
+@app.get("/health/")
+async def health():
+    """Liveness: the server is up, whether or not the model has finished loading."""
+    return {"status": "ok", "loading": loader.status()}
 
-       Zu korrigierender Text: "{input.text}"
-       Korrigierter Text:
-       """
 
-    print(prompt)
+@app.get("/ready/")
+async def ready():
+    require_ready()
+    return loader.status()
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    torch.cuda.empty_cache()
-
-    inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
-    input_length = inputs.input_ids.shape[1]
-    outputs = model.generate(**inputs, max_new_tokens=512, num_beams=1, early_stopping=True)
-    generated_tokens = outputs[0][input_length:]
-    output = tokenizer.decode(generated_tokens, skip_special_tokens=True)
-    formated_output = output.replace("\n", "").replace("\t", "").replace("  ", "").replace("\"", "")
+# TODO: Bring down responding time
+# TODO: Provide good Answers
+@app.post("/process/")
+async def check_grammar(input: TextInput):
+    require_ready()
+    if sample_debug():
+        logging.debug(f"Grammar prompt: {GRAMMAR_PREFIX + GRAMMAR_SUFFIX.format(context=input.context, text=input.text)}")
 
-    torch.cuda.empty_cache()
+    with tracer.span("tokenize"):
+        suffix_ids = encode_request(input.context, input.text)
+    formated_output = await scheduler.submit(suffix_ids)
 
     return {"response": formated_output}
+
+
+@app.get("/metrics/")
+async def metrics():
+    return scheduler.stats()
+
+
+@app.post("/stream/")
+async def stream_grammar(input: TextInput):
+    """
+    Streams the corrected text token by token as server-sent events. Generation runs on the bounded
+    stream executor; requests beyond STREAM_WORKERS wait there for a free worker. If the client goes
+    away, generation stops at the next token, so the worker is free for the next stream.
+    """
+    require_ready()
+    with tracer.span("tokenize"):
+        suffix_ids = encode_request(input.context, input.text)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    cancelled = threading.Event()
+    errors = []
+
+    def run():
+        if cancelled.is_set():
+            # The client left while the request was still waiting for a stream worker.
+            return
+        stopping_criteria = StoppingCriteriaList([CancelFlag(cancelled)])
+        try:
+            if USE_PREFIX_CACHE:
+                grammar_prefix.generate([suffix_ids], generation_config=grammar_config, streamer=streamer,
+                                        stopping_criteria=stopping_criteria)
+            else:
+                traced_generate(model.generate, **prompt_inputs([suffix_ids]), generation_config=grammar_config,
+                                streamer=streamer, stopping_criteria=stopping_criteria)
+        except Exception as e:
+            logging.error(f"Streaming generation failed: {e}")
+            errors.append(e)
+            streamer.end()
+
+    # The copied context carries the request's span into the worker, so prefill and decode are traced.
+    stream_executor.submit(contextvars.copy_context().run, run)
+
+    def events():
+        try:
+            for token in formatted_deltas(streamer):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            if errors:
+                yield f"data: {json.dumps({'error': f'Generation failed: {errors[0]}'})}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
+        finally:
+            # Also runs when the response is closed early because the client disconnected.
+            cancelled.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
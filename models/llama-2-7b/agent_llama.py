@@ -1,66 +1,299 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer
 from contextlib import asynccontextmanager
+from generation import PrefixCache, BatchScheduler, InputBuffer, generation_config, sample_debug, traced_generate
+from model_loading import load_model, report_startup, BackgroundLoader
+from tracing import tracer
 
 import torch
 import os
 import logging
 import re
+import time
 
 MODEL_NAME = "meta-llama/Llama-2-7b-chat-hf"
 HF_TOKEN = os.environ.get("HF_TOKEN", None)
+LABELS = ["citation", "structure", "grammar", "none"]
+# Temperature for the softmax over label scores; tune on held-out requests to calibrate probabilities.
+LABEL_TEMPERATURE = float(os.environ.get("LABEL_TEMPERATURE", 1.0))
+USE_PREFIX_CACHE = os.environ.get("USE_PREFIX_CACHE", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 10))
+# Tokens whose keys and values one classification forward pass may hold (prefix, query and label of every
+# row). Each query needs one row per label and every row gets its own copy of the prefix cache, so a batch
+# is split into passes of as many queries as fit. Llama-2-7B needs about 0.5 MiB per token, i.e. ~4 GiB.
+CLASSIFY_KV_TOKEN_BUDGET = int(os.environ.get("CLASSIFY_KV_TOKEN_BUDGET", 8192))
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
-tokenizer.pad_token = tokenizer.eos_token
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME, token=HF_TOKEN, torch_dtype=torch.bfloat16, device_map="auto"
-)
+CLASSIFIER_PREFIX = """
+        Du agierst als Experte im Management von Benutzeranfragen. 
+        Deine Aufgabe ist es, Benutzeranfragen in exakt eine der folgenden vier Kategorien einzustufen: citation, structure, grammar, none. 
+        Jede Anfrage muss ausschließlich einer Kategorie zugeordnet werden.
+
+        Beachte: Die Anfragen können auf Deutsch formuliert sein.
+        
+        Mögliche Kategorien und deren Kriterien:
+        
+        "citation"
+        Für Anfragen, die sich auf die Erstellung von Zitaten beziehen. Achte besonders auf Wörter wie „Zitat“ sowie Formulierungen wie:
+        
+        „Erstelle mir ein Zitat“
+        
+        „Mache ein Zitat zu“
+        Beispiele:
+        
+        „Erstelle mir hieraus ein Zitat im Chicago-Stil“ → citation
+        
+        „Ich möchte daraus ein Zitat haben“ → citation
+        
+        "structure"
+        Für Anfragen, die den Aufbau oder die Gliederung eines Textes oder Themas betreffen. Achte auf Wörter wie „Gliederung“ oder „Struktur“ und Formulierungen wie:
+        
+        „Erstelle mir eine Gliederung hierzu“
+        
+        „Gib mir eine Struktur zu diesem Thema“
+        Beispiele:
+        
+        „Erstelle eine Gliederung zum Thema Delfine“ → structure
+        
+        „Gib mir eine Struktur für meine Bachelorarbeit“ → structure
+        
+        "grammar"
+        Für Anfragen, bei denen es um die grammatikalische Verbesserung oder stilistische Überarbeitung eines Textes geht. Achte auf Phrasen wie:
+        
+        „Verbessere mir diesen Text“
+        
+        „Schreib das schöner“
+        Beispiele:
+        
+        „Verbessere mir das Folgende:“ → grammar
+        
+        „Bitte schreib das so um, dass es besser klingt“ → grammar
+        
+        "none"
+        Für Anfragen, die keinen Bezug zu den oben genannten Kategorien oder zur Erstellung wissenschaftlicher Texte haben. Auch wenn nicht klar ist, welche Kategorie zutrifft, solltest du „none“ wählen.
+        Beispiele:
+        
+        „Wie heißt mein Hund?“ → none
+        
+        „Wie ist das Wetter morgen?“ → none
+        
+        „Wie groß ist die Erde?“ → none
+        
+        „Was ist die Hauptstadt von Frankreich?“ → none
+        
+        Wichtige Anweisung:
+        Antworte ausschließlich mit dem Namen der Kategorie! Deine Antwort darf nur eine der folgenden Optionen enthalten:
+        
+        citation
+        
+        structure
+        
+        grammar
+        
+        none
+        
+        Benutzeranfrage:
+        """
+CLASSIFIER_SUFFIX = '"{text}"\n        '
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Set by load() in a background thread started from lifespan; requests are rejected with 503 until then.
+tokenizer = None
+model = None
+label_token_ids = None
+classifier_prefix = None
+# Resolved once in load(), so the request path neither looks up the device nor rebuilds generation settings.
+device = None
+outline_config = None
+input_buffer = None
+
+
+def load(loader: BackgroundLoader):
+    global tokenizer, model, label_token_ids, classifier_prefix, device, outline_config, input_buffer
+    loader.stage("tokenizer")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    loader.stage("model")
+    # MODEL_PRECISION=int8/int4 and MODEL_DEVICE=cpu allow running the classifier on CPU-only nodes.
+    model = load_model(MODEL_NAME, token=HF_TOKEN)
+    device = model.device
+    outline_config = generation_config(
+        model, max_new_tokens=10, num_beams=1, early_stopping=True, pad_token_id=tokenizer.pad_token_id
+    )
+    input_buffer = InputBuffer(device, tokenizer.pad_token_id)
+    loader.stage("warm-up")
+    report_startup(model, tokenizer)
+    loader.stage("prefix cache")
+    label_token_ids = [tokenizer(label, add_special_tokens=False).input_ids for label in LABELS]
+    classifier_prefix = PrefixCache(model, tokenizer, CLASSIFIER_PREFIX)
+
+
+loader = BackgroundLoader(load)
+
+
 class TextInput(BaseModel):
     text: str
 
 
+def extract_label(generated_text):
+    for label in LABELS:
+        if label in generated_text:
+            return label
+    return ""
+
+
+def generate_batch(texts):
+    start = time.time()
+    input_ids, attention_mask = input_buffer.pack(tokenizer(texts, truncation=True, max_length=1024).input_ids)
+    tracer.record_batch("tokenize", start, time.time())
+    input_length = input_ids.shape[1]
+    outputs = traced_generate(
+        model.generate, input_ids=input_ids, attention_mask=attention_mask, generation_config=outline_config
+    )
+    results = []
+    for sequence in outputs:
+        generated_text = tokenizer.decode(sequence[input_length:], skip_special_tokens=True).strip()
+        output = extract_label(generated_text)
+
+        if sample_debug():
+            logging.debug(f"Full llama output: {tokenizer.decode(sequence, skip_special_tokens=True)}")
+        logging.debug(f"Llama output without prompt: {generated_text}")
+        logging.debug(f"relevant word: {output}")
+        results.append(output)
+    logging.debug(f"amount of tokens in prompt: {input_length}, batch size: {len(texts)}")
+    return results
+
+
+def score_labels(suffixes):
+    """
+    Scores every label as a continuation of each query in one forward pass (one row per query and label).
+    Returns a (queries x labels) tensor of label scores on the CPU.
+
+    A label's score is the summed log-likelihood of all its tokens, i.e. log P(label | prompt). LLaMA splits
+    "citation" and "grammar" into two tokens but "structure" and "none" are single tokens; averaging per
+    token would halve the penalty of the multi-token labels and bias the probabilities towards them.
+    """
+    sequences = [suffix_ids + ids for suffix_ids in suffixes for ids in label_token_ids]
+    input_ids, attention_mask = input_buffer.pack(sequences, left_pad=False)
+
+    past_key_values = None
+    if USE_PREFIX_CACHE:
+        past_key_values = classifier_prefix.cache(batch_size=len(sequences))
+        prefix_mask = torch.ones((len(sequences), classifier_prefix.length), dtype=torch.long, device=device)
+        attention_mask = torch.cat([prefix_mask, attention_mask], dim=1)
+
+    with torch.no_grad():
+        logits = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+        ).logits
+
+    scores = []
+    for t, suffix_ids in enumerate(suffixes):
+        offset = len(suffix_ids)
+        for l, ids in enumerate(label_token_ids):
+            # The logits at position p predict the token at position p + 1. Only these positions are
+            # normalized, instead of the whole (rows x length x vocabulary) logits tensor.
+            positions = torch.arange(offset - 1, offset - 1 + len(ids), device=logits.device)
+            targets = torch.tensor(ids, device=logits.device)
+            log_probs = torch.log_softmax(logits[t * len(LABELS) + l, positions].float(), dim=-1)
+            scores.append(log_probs[torch.arange(len(ids), device=logits.device), targets].sum())
+    return torch.stack(scores).view(len(suffixes), len(LABELS)).cpu()
+
+
+def classify_batch(texts):
+    """
+    Scores every label as a continuation of the classifier prompt for all texts and returns the most likely
+    label together with the softmax-normalized probabilities. The fixed part of the prompt is taken from the
+    prefix cache, so only the user queries are encoded. The texts are scored in as few forward passes as
+    CLASSIFY_KV_TOKEN_BUDGET allows.
+    """
+    start = time.time()
+    suffixes = []
+    for text in texts:
+        suffix_ids = classifier_prefix.encode_suffix(CLASSIFIER_SUFFIX.format(text=text), max_length=1024)
+        if not USE_PREFIX_CACHE:
+            suffix_ids = classifier_prefix.prefix_ids[0].tolist() + suffix_ids
+        suffixes.append(suffix_ids)
+    tracer.record_batch("tokenize", start, time.time())
+
+    row_tokens = max(len(ids) for ids in suffixes) + max(len(ids) for ids in label_token_ids)
+    if USE_PREFIX_CACHE:
+        row_tokens += classifier_prefix.length
+    queries_per_pass = max(CLASSIFY_KV_TOKEN_BUDGET // (row_tokens * len(LABELS)), 1)
+
+    start = time.time()
+    scores = torch.cat([score_labels(suffixes[i:i + queries_per_pass])
+                        for i in range(0, len(suffixes), queries_per_pass)])
+    # Classification only runs forward passes over the label continuations, so there is no decode span.
+    tracer.record_batch("prefill", start, time.time(), queries_per_pass=queries_per_pass)
+
+    results = []
+    for query_scores in scores:
+        probabilities = torch.softmax(query_scores / LABEL_TEMPERATURE, dim=0).tolist()
+        result = dict(zip(LABELS, probabilities))
+        logging.debug(f"Label probabilities: {result}")
+        results.append(result)
+    return results
+
+
+generate_scheduler = BatchScheduler(generate_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+classify_scheduler = BatchScheduler(classify_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    model.eval()
-    logging.debug("Modell set to evaluation mode.")
+    loader.start()
+    generate_scheduler.start()
+    classify_scheduler.start()
     yield
+    await generate_scheduler.stop()
+    await classify_scheduler.stop()
     torch.cuda.empty_cache()
     logging.debug("Shutdown performed successfully.")
 
 app = FastAPI(lifespan=lifespan)
+tracer.install(app)
+
+
+def require_ready():
+    if not loader.ready:
+        raise HTTPException(status_code=503, detail=loader.status(), headers={"Retry-After": "10"})
+
+
+@app.get("/health/")
+async def health():
+    """Liveness: the server is up, whether or not the model has finished loading."""
+    return {"status": "ok", "loading": loader.status()}
+
+
+@app.get("/ready/")
+async def ready():
+    require_ready()
+    return loader.status()
 
 
 @app.post("/process/")
 async def generate_outline(input: TextInput):
-    print(input)
-
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    require_ready()
+    if sample_debug():
+        logging.debug(f"Outline request: {input.text}")
+    output = await generate_scheduler.submit(input.text)
+    return {"response": output}
 
-    torch.cuda.empty_cache()
 
-    inputs = tokenizer(input.text, return_tensors="pt", padding=True, truncation=True, max_length=1024).to(device)
-    input_length = inputs.input_ids.shape[1]
-    outputs = model.generate(**inputs, max_new_tokens=10, num_beams=1, early_stopping=True)
-    generated_text = tokenizer.decode(outputs[0][input_length:], skip_special_tokens=True).strip()
-    output = ""
-    if "citation" in generated_text:
-        output = "citation"
-    elif "structure" in generated_text:
-        output = "structure"
-    elif "grammar" in generated_text:
-        output = "grammar"
-    elif "none" in generated_text:
-        output = "none"
-
-    logging.debug(f"Full llama output: {tokenizer.decode(outputs[0], skip_special_tokens=True)}")
-    logging.debug(f"Llama output without prompt: {generated_text}")
-    logging.debug(f"relevant word: {output}")
-    logging.debug(f"amount of tokens in prompt: {input_length}")
+@app.post("/classify/")
+async def classify(input: TextInput):
+    require_ready()
+    result = await classify_scheduler.submit(input.text)
+    output = max(result, key=result.get)
+    return {"response": output, "probabilities": result}
 
-    torch.cuda.empty_cache()
 
-    return {"response": output}
\ No newline at end of file
+@app.get("/metrics/")
+async def metrics():
+    return {"process": generate_scheduler.stats(), "classify": classify_scheduler.stats()}
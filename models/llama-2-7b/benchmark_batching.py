@@ -0,0 +1,75 @@
+"""
+Measures throughput and latency of concurrent generation requests with and without request batching:
+
+    python benchmark_batching.py [--model hf-internal-testing/tiny-random-LlamaForCausalLM] [--requests 64]
+
+"before" runs the requests one at a time (max_batch_size 1, the former one-generate-per-request path),
+"after" lets the BatchScheduler collect up to --batch requests into one left-padded generate call.
+"""
+import argparse
+import asyncio
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from generation import BatchScheduler, InputBuffer
+
+PROMPTS = [
+    "Erstelle mir eine Gliederung für meine Bachelorarbeit über erneuerbare Energien in Deutschland.",
+    "Wie zitiere ich ein Buch mit zwei Autoren?",
+    "Verbessere: Main Nahme isd Mike.",
+    "Welche Kapitel gehören in eine Hausarbeit?",
+]
+
+
+async def run_requests(scheduler, requests):
+    scheduler.start()
+
+    async def request(i):
+        start = time.perf_counter()
+        await scheduler.submit(PROMPTS[i % len(PROMPTS)])
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(request(i) for i in range(requests))))
+    wall = time.perf_counter() - start
+    await scheduler.stop()
+    return requests / wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=10)
+    parser.add_argument("--new-tokens", type=int, default=10)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    buffer = InputBuffer(model.device, tokenizer.pad_token_id)
+
+    def generate_batch(texts):
+        input_ids, attention_mask = buffer.pack(tokenizer(texts).input_ids)
+        with torch.no_grad():
+            outputs = model.generate(input_ids=input_ids, attention_mask=attention_mask, do_sample=False,
+                                     max_new_tokens=args.new_tokens, min_new_tokens=args.new_tokens,
+                                     pad_token_id=tokenizer.pad_token_id)
+        return [tokenizer.decode(output[input_ids.shape[1]:], skip_special_tokens=True) for output in outputs]
+
+    print(f"{'path':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}  batch sizes   "
+          f"({model.device}, {args.requests} concurrent requests)")
+    generate_batch(PROMPTS)  # warm-up
+    for name, batch_size in [("before", 1), ("after", args.batch)]:
+        scheduler = BatchScheduler(generate_batch, max_batch_size=batch_size, max_wait_ms=args.wait_ms)
+        throughput, p50, p99 = asyncio.run(run_requests(scheduler, args.requests))
+        histogram = scheduler.stats()["batch_size_histogram"]
+        print(f"{name:<8}{throughput:>10.1f}{p50:>10.1f}{p99:>10.1f}  {histogram}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures the per-request overhead around model.generate, i.e. everything the agents do besides the generation itself:
+
+    python benchmark_overhead.py [--tokenizer sshleifer/tiny-gpt2] [--batch 4] [--requests 200]
+
+generate is replaced by appending random token ids, so only tokenization, input preparation, cache clearing
+and decoding are timed. "before" is the former request path (torch.cuda.empty_cache twice, a fresh padded
+tensor per batch, printing the request, decoding the full output for the debug log), "after" the current one.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+import torch
+from transformers import AutoTokenizer
+
+from generation import InputBuffer, sample_debug
+
+TEXT = "Erstelle mir eine Gliederung für meine Bachelorarbeit über erneuerbare Energien in Deutschland."
+
+
+def fake_generate(input_ids, new_tokens, vocab_size):
+    return torch.cat([input_ids, torch.randint(vocab_size, (input_ids.shape[0], new_tokens))], dim=1)
+
+
+def before(tokenizer, texts, device, new_tokens):
+    torch.cuda.empty_cache()
+    with contextlib.redirect_stdout(io.StringIO()):
+        print(texts)
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=1024).to(device)
+    input_length = inputs.input_ids.shape[1]
+    start = time.perf_counter()
+    outputs = fake_generate(inputs.input_ids.cpu(), new_tokens, tokenizer.vocab_size)
+    excluded = time.perf_counter() - start
+    for sequence in outputs:
+        tokenizer.decode(sequence[input_length:], skip_special_tokens=True).strip()
+        tokenizer.decode(sequence, skip_special_tokens=True)
+    torch.cuda.empty_cache()
+    return excluded
+
+
+def after(tokenizer, texts, buffer, new_tokens):
+    input_ids, _ = buffer.pack(tokenizer(texts, truncation=True, max_length=1024).input_ids)
+    input_length = input_ids.shape[1]
+    start = time.perf_counter()
+    outputs = fake_generate(input_ids.cpu(), new_tokens, tokenizer.vocab_size)
+    excluded = time.perf_counter() - start
+    for sequence in outputs:
+        tokenizer.decode(sequence[input_length:], skip_special_tokens=True).strip()
+        if sample_debug():
+            tokenizer.decode(sequence, skip_special_tokens=True)
+    return excluded
+
+
+def measure(run, requests):
+    run()  # warm-up
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        excluded = run()
+        timings.append((time.perf_counter() - start - excluded) * 1e6)
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--new-tokens", type=int, default=10)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    buffer = InputBuffer(device, tokenizer.pad_token_id)
+    texts = [TEXT * (i + 1) for i in range(args.batch)]
+
+    print(f"{'path':<8}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}   ({device}, batch {args.batch})")
+    for name, run in [
+        ("before", lambda: before(tokenizer, texts, device, args.new_tokens)),
+        ("after", lambda: after(tokenizer, texts, buffer, args.new_tokens)),
+    ]:
+        mean, p50, p99 = measure(run, args.requests)
+        print(f"{name:<8}{mean:>12.0f}{p50:>12.0f}{p99:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
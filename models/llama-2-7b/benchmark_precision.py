@@ -0,0 +1,59 @@
+"""
+Compares generation speed and memory of the load-time precisions on CPU with a tiny model:
+
+    python benchmark_precision.py [--model hf-internal-testing/tiny-random-LlamaForCausalLM] [--tokens 64]
+
+Every precision is measured in its own subprocess so resident memory is not shared between runs.
+The model should use nn.Linear layers like Llama and BLOOM: dynamic int8 quantization leaves the Conv1D
+layers of GPT-2 checkpoints alone, so only their lm_head would be quantized. There is no int4 kernel on
+the CPU, so the int4 row is loaded (and labelled) as int8.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from model_loading import PRECISIONS
+
+
+def measure(model_name, precision, new_tokens):
+    from transformers import AutoTokenizer
+    from model_loading import load_model, measure_generation, model_size_mb, resident_memory_mb, resolve_precision
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = load_model(model_name, precision=precision, device="cpu")
+    measure_generation(model, tokenizer, new_tokens=4)  # warm-up
+    tokens_per_second = measure_generation(model, tokenizer, new_tokens=new_tokens)
+    return {
+        "precision": resolve_precision(precision, "cpu")[0],
+        "requested": precision,
+        "tokens_per_second": round(tokens_per_second, 1),
+        "weights_mb": round(model_size_mb(model), 1),
+        "resident_mb": round(resident_memory_mb() or 0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--precision", choices=PRECISIONS, help="measure a single precision in this process")
+    args = parser.parse_args()
+
+    if args.precision:
+        print(json.dumps(measure(args.model, args.precision, args.tokens)))
+        return
+
+    print(f"{'precision':<10}{'tokens/s':>12}{'weights MB':>12}{'RSS MB':>10}  requested")
+    for precision in PRECISIONS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--model", args.model, "--tokens", str(args.tokens), "--precision", precision],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['precision']:<10}{result['tokens_per_second']:>12}{result['weights_mb']:>12}"
+              f"{result['resident_mb']:>10}  {result['requested']}")
+
+
+if __name__ == "__main__":
+    main()
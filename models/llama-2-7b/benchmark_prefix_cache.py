@@ -0,0 +1,75 @@
+"""
+Compares the time to first token of a classifier request with and without the cached prompt prefix:
+
+    python benchmark_prefix_cache.py [--model hf-internal-testing/tiny-random-LlamaForCausalLM] [--requests 50]
+
+"before" tokenizes and encodes CLASSIFIER_PREFIX plus the query on every request (USE_PREFIX_CACHE=0),
+"after" only encodes the query on top of a copy of the precomputed prefix cache. Runs on the CPU.
+"""
+import argparse
+import logging
+import statistics
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from agent_llama import CLASSIFIER_PREFIX, CLASSIFIER_SUFFIX
+from generation import PrefixCache
+
+QUERIES = [
+    "Wie zitiere ich ein Buch mit zwei Autoren?",
+    "Erstelle mir eine Gliederung für meine Bachelorarbeit über erneuerbare Energien.",
+    "Verbessere: Main Nahme isd Mike.",
+]
+
+
+def first_token(model, **generate_kwargs):
+    return model.generate(max_new_tokens=1, do_sample=False, **generate_kwargs)
+
+
+def before(model, tokenizer, prefix_cache, query):
+    inputs = tokenizer(CLASSIFIER_PREFIX + CLASSIFIER_SUFFIX.format(text=query), return_tensors="pt")
+    first_token(model, **inputs, pad_token_id=tokenizer.pad_token_id)
+
+
+def after(model, tokenizer, prefix_cache, query):
+    suffix_ids = prefix_cache.encode_suffix(CLASSIFIER_SUFFIX.format(text=query))
+    prefix_cache.generate([suffix_ids], max_new_tokens=1, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+
+
+def measure(run, requests):
+    run(QUERIES[0])  # warm-up
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        run(QUERIES[i % len(QUERIES)])
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    prefix_cache = PrefixCache(model, tokenizer, CLASSIFIER_PREFIX)
+
+    print(f"{'path':<8}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}   "
+          f"(prefix {prefix_cache.length} tokens, {args.requests} requests)")
+    with torch.no_grad():
+        for name, run in [("before", before), ("after", after)]:
+            mean, p50, p99 = measure(lambda query: run(model, tokenizer, prefix_cache, query), args.requests)
+            print(f"{name:<8}{mean:>10.1f}{p50:>10.1f}{p99:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Tiny randomly initialised Llama and a word-level tokenizer for the CPU tests. Both are built locally,
+so the tests need neither a GPU nor the Hugging Face Hub.
+"""
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+WORDS = """
+Du bist ein Tutor für wissenschaftliches Arbeiten . Ordne die Anfrage einer Kategorie zu : zitat gliederung
+formulierung nichts davon Wie zitiere ich ein Buch mit zwei Autoren ? Erstelle mir eine für meine
+Bachelorarbeit über erneuerbare Energien in Deutschland Verbessere den Satz Main Nahme isd Mike Antwort
+citation structure grammar none
+""".split()
+
+
+@pytest.fixture(scope="session")
+def tokenizer():
+    vocab = {token: i for i, token in enumerate(["<pad>", "<unk>", "<s>", "</s>"] + sorted(set(WORDS)))}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    return PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", unk_token="<unk>",
+                                   bos_token="<s>", eos_token="</s>", padding_side="left")
+
+
+@pytest.fixture(scope="session")
+def model(tokenizer):
+    torch.manual_seed(0)
+    # A larger initializer_range than the default keeps greedy outputs of the random model from collapsing.
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=256,
+                         initializer_range=0.5, pad_token_id=tokenizer.pad_token_id,
+                         bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)
+    return LlamaForCausalLM(config).eval()
@@ -0,0 +1,269 @@
+import asyncio
+import copy
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from tracing import tracer
+
+# Fraction of requests whose full prompt and output are decoded and logged; 0 keeps the hot path free of it.
+DEBUG_SAMPLE_RATE = float(os.environ.get("DEBUG_SAMPLE_RATE", 0))
+
+
+def sample_debug():
+    """True for a DEBUG_SAMPLE_RATE share of calls; decides whether expensive debug output is produced."""
+    return DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
+
+
+def generation_config(model, **overrides):
+    """The model's default generation config with the agent's settings applied, built once at load time."""
+    config = copy.deepcopy(model.generation_config)
+    config.update(**overrides)
+    return config
+
+
+class InputBuffer:
+    """
+    Builds padded input_ids and attention_mask on the model's device.
+
+    On CUDA the rows are filled into one shared pinned staging buffer, which is allocated once, only
+    grows, and is copied to the GPU asynchronously. A lock serializes the batch worker and the stream
+    workers, and a CUDA event makes the next fill wait until the previous copy has left the buffer.
+    On the CPU there is nothing to copy, so every batch gets fresh tensors.
+    """
+
+    def __init__(self, device, pad_token_id):
+        self.device = torch.device(device)
+        self.pad_token_id = pad_token_id
+        self.pin = self.device.type == "cuda"
+        self.ids = None
+        self.mask = None
+        self.copied = None
+        self._lock = threading.Lock()
+
+    def _fill(self, input_ids, attention_mask, sequences, left_pad):
+        width = input_ids.shape[1]
+        input_ids.fill_(self.pad_token_id)
+        attention_mask.zero_()
+        for i, ids in enumerate(sequences):
+            if ids:
+                start = width - len(ids) if left_pad else 0
+                input_ids[i, start:start + len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[i, start:start + len(ids)] = 1
+
+    def pack(self, sequences, left_pad=True):
+        """Pads the token id lists into one batch on the model's device; returns (input_ids, attention_mask)."""
+        rows, width = len(sequences), max(len(ids) for ids in sequences)
+        if not self.pin:
+            input_ids = torch.empty((rows, width), dtype=torch.long)
+            attention_mask = torch.empty((rows, width), dtype=torch.long)
+            self._fill(input_ids, attention_mask, sequences, left_pad)
+            return input_ids.to(self.device), attention_mask.to(self.device)
+        with self._lock:
+            if self.copied is not None:
+                self.copied.synchronize()
+            size = rows * width
+            if self.ids is None or self.ids.numel() < size:
+                self.ids = torch.empty(size, dtype=torch.long, pin_memory=True)
+                self.mask = torch.empty(size, dtype=torch.long, pin_memory=True)
+            # Flat storage keeps the (rows, width) views contiguous whatever the previous batch's shape was.
+            input_ids, attention_mask = self.ids[:size].view(rows, width), self.mask[:size].view(rows, width)
+            self._fill(input_ids, attention_mask, sequences, left_pad)
+            input_ids = input_ids.to(self.device, non_blocking=True)
+            attention_mask = attention_mask.to(self.device, non_blocking=True)
+            self.copied = torch.cuda.Event()
+            self.copied.record()
+        return input_ids, attention_mask
+
+
+class FirstTokenTimer(StoppingCriteria):
+    """Never stops generation; remembers when the first new token was produced, i.e. when the prefill ended."""
+
+    def __init__(self):
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class CancelFlag(StoppingCriteria):
+    """Stops every sequence once `event` is set, e.g. when the client of a streamed request went away."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def traced_generate(generate, **generate_kwargs):
+    """
+    Calls generate and, if the running requests are traced, records its prefill (up to the first
+    new token) and decode spans for each of them. Stopping criteria of the caller are kept.
+    """
+    if not tracer.traced():
+        return generate(**generate_kwargs)
+    timer = FirstTokenTimer()
+    stopping_criteria = StoppingCriteriaList([*generate_kwargs.pop("stopping_criteria", []), timer])
+    start = time.time()
+    outputs = generate(stopping_criteria=stopping_criteria, **generate_kwargs)
+    end = time.time()
+    first_token_at = timer.first_token_at or end
+    tracer.record_batch("prefill", start, first_token_at)
+    tracer.record_batch("decode", first_token_at, end)
+    return outputs
+
+
+class PrefixCache:
+    """
+    Precomputed past_key_values of a fixed prompt prefix.
+
+    The prefix is encoded once; requests only encode their variable suffix and start
+    generation from a copy of the cached keys and values.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+        self.buffer = InputBuffer(model.device, tokenizer.pad_token_id)
+        with torch.no_grad():
+            self.past_key_values = model(self.prefix_ids, use_cache=True).past_key_values
+        logging.debug(f"Prefix cache built for {self.length} tokens.")
+
+    @property
+    def length(self):
+        return self.prefix_ids.shape[1]
+
+    def encode_suffix(self, suffix: str, max_length: int = None):
+        """Tokenizes the suffix without special tokens, truncated so prefix and suffix fit into max_length."""
+        ids = self.tokenizer(suffix, add_special_tokens=False).input_ids
+        if max_length is not None:
+            ids = ids[:max(max_length - self.length, 0)]
+        return ids
+
+    def cache(self, batch_size: int = 1):
+        """Returns a private copy of the prefix cache, repeated for `batch_size` sequences."""
+        past_key_values = copy.deepcopy(self.past_key_values)
+        if batch_size > 1:
+            past_key_values.batch_repeat_interleave(batch_size)
+        return past_key_values
+
+    def batch_inputs(self, suffixes):
+        """
+        Builds input_ids and attention_mask of prefix plus suffix for several sequences.
+        Suffixes are left-padded, so every sequence ends right where generation starts.
+        """
+        suffix_ids, suffix_mask = self.buffer.pack(suffixes)
+        prefix_ids = self.prefix_ids.expand(len(suffixes), -1)
+        return {
+            "input_ids": torch.cat([prefix_ids, suffix_ids], dim=1),
+            "attention_mask": torch.cat([torch.ones_like(prefix_ids), suffix_mask], dim=1),
+        }
+
+    def generate(self, suffixes, **generate_kwargs):
+        """
+        Runs one batched model.generate on prefix plus every suffix, only encoding the suffixes.
+        Returns the newly generated tokens per sequence.
+        """
+        inputs = self.batch_inputs(suffixes)
+        outputs = traced_generate(
+            self.model.generate, **inputs, past_key_values=self.cache(len(suffixes)), **generate_kwargs
+        )
+        input_length = inputs["input_ids"].shape[1]
+        return [output[input_length:] for output in outputs]
+
+
+class BatchScheduler:
+    """
+    Collects concurrent requests for up to `max_wait_ms` or `max_batch_size` items and hands them
+    to `run_batch` as one list. `run_batch` is executed in a worker thread and must return one
+    result per item; the results are dispatched back to the waiting coroutines.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future, tracer.current(), time.time()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        while True:
+            batch = await self._collect()
+            self.queue_depths[self.queue.qsize()] += 1
+            self.batch_sizes[len(batch)] += 1
+            self.batches += 1
+            self.items += len(batch)
+            start = time.perf_counter()
+            started_at = time.time()
+            for _, _, trace, submitted_at in batch:
+                tracer.record("queue", trace, submitted_at, started_at, batch_size=len(batch))
+            try:
+                # to_thread copies the context, so spans recorded by run_batch reach every request of the batch.
+                with tracer.batch(trace for _, _, trace, _ in batch):
+                    results = await asyncio.to_thread(self.run_batch, [item for item, _, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Batch of {len(batch)} failed: {e}")
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future, _, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            self.busy_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "busy_seconds": self.busy_seconds,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth_histogram": dict(sorted(self.queue_depths.items())),
+        }
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+
+import torch
+from transformers import AutoModelForCausalLM
+
+PRECISIONS = ["bf16", "int8", "int4"]
+
+
+def resident_memory_mb():
+    """Resident set size of this process in MB (Linux), or None if it can't be read."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def model_size_mb(model):
+    """Size of all parameters and buffers, including the packed weights of dynamically quantized layers."""
+    size = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            weight, bias = packed._weight_bias()
+            size += weight.numel() * weight.element_size() + (bias.numel() * bias.element_size() if bias is not None else 0)
+    return size / 2 ** 20
+
+
+def resolve_precision(precision=None, device=None):
+    """
+    Resolves MODEL_PRECISION and MODEL_DEVICE to the precision that is actually loaded and whether the
+    model goes to the GPU; returns (precision, on_gpu).
+    """
+    precision = precision or os.environ.get("MODEL_PRECISION", "bf16")
+    device = device or os.environ.get("MODEL_DEVICE", "auto")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown MODEL_PRECISION '{precision}', expected one of {PRECISIONS}.")
+    on_gpu = device != "cpu" and torch.cuda.is_available()
+    if precision == "int4" and not on_gpu:
+        logging.warning("4-bit weights need a GPU (bitsandbytes); falling back to dynamic int8 on CPU.")
+        precision = "int8"
+    return precision, on_gpu
+
+
+def load_model(model_name, token=None, precision=None, device=None):
+    """
+    Loads the causal LM in the requested precision (MODEL_PRECISION):
+        bf16  bfloat16 weights (default)
+        int8  on CPU: dynamic int8 quantization of all nn.Linear layers; on GPU: bitsandbytes 8-bit
+        int4  on GPU: bitsandbytes 4-bit NF4; on CPU there is no int4 kernel, int8 is used instead
+    MODEL_DEVICE=cpu forces CPU inference, auto (default) uses the GPU if there is one.
+    """
+    precision, on_gpu = resolve_precision(precision, device)
+
+    start = time.perf_counter()
+    if precision == "bf16":
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, token=token, torch_dtype=torch.bfloat16, device_map="auto" if on_gpu else "cpu"
+        )
+    elif on_gpu:
+        from transformers import BitsAndBytesConfig
+        if precision == "int8":
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+        else:
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=torch.bfloat16
+            )
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, token=token, device_map="auto", quantization_config=quantization_config
+        )
+    else:
+        # Dynamic quantization needs float32 weights; activations are quantized on the fly per batch.
+        model = AutoModelForCausalLM.from_pretrained(model_name, token=token, torch_dtype=torch.float32)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    load_seconds = time.perf_counter() - start
+
+    logging.info(
+        f"Loaded {model_name} as {precision} on {'GPU' if on_gpu else 'CPU'} in {load_seconds:.1f}s: "
+        f"weights {model_size_mb(model):.0f} MB, resident memory {resident_memory_mb() or 0:.0f} MB."
+    )
+    return model
+
+
+def measure_generation(model, tokenizer, prompt="Hallo, wie geht es dir?", new_tokens=16):
+    """Greedy generation of `new_tokens` tokens; returns tokens per second."""
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    with torch.no_grad():
+        start = time.perf_counter()
+        output = model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+                                pad_token_id=tokenizer.eos_token_id)
+        seconds = time.perf_counter() - start
+    generated = output.shape[1] - inputs.input_ids.shape[1]
+    return generated / seconds
+
+
+def report_startup(model, tokenizer, new_tokens=None):
+    """Logs a warm-up generation's latency and the resident memory; MODEL_WARMUP_TOKENS=0 disables it."""
+    new_tokens = new_tokens if new_tokens is not None else int(os.environ.get("MODEL_WARMUP_TOKENS", 8))
+    if new_tokens <= 0:
+        return
+    tokens_per_second = measure_generation(model, tokenizer, new_tokens=new_tokens)
+    logging.info(f"Warm-up: {tokens_per_second:.1f} tokens/s, resident memory {resident_memory_mb() or 0:.0f} MB.")
+
+
+class BackgroundLoader:
+    """
+    Runs the blocking model load in a daemon thread, so the HTTP server can bind immediately.
+    The load function reports its progress through stage(); status() backs the /health/ and /ready/ endpoints.
+    """
+
+    def __init__(self, load_fn):
+        self.load_fn = load_fn
+        self.current_stage = "pending"
+        self.stages = []
+        self.error = None
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stage(self, name):
+        logging.info(f"Loading stage: {name}")
+        self.current_stage = name
+        self.stages.append({"stage": name, "at_seconds": round(time.monotonic() - self.started_at, 1)})
+
+    def _run(self):
+        try:
+            self.load_fn(self)
+            self.current_stage = "ready"
+            self.ready = True
+        except Exception as e:
+            logging.exception("Model loading failed.")
+            self.current_stage = "failed"
+            self.error = str(e)
+        self.finished_at = time.monotonic()
+
+    def status(self):
+        end = self.finished_at or time.monotonic()
+        return {
+            "ready": self.ready,
+            "stage": self.current_stage,
+            "stages": list(self.stages),
+            "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else 0.0,
+            "error": self.error,
+            "resident_mb": round(resident_memory_mb() or 0, 1),
+        }
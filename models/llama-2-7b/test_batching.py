@@ -0,0 +1,111 @@
+"""
+Checks of the request batching on a tiny CPU model: concurrent requests are collected into batches of at
+most max_batch_size, every request gets the same answer as when run alone, and classification gives the
+same label probabilities however the batch is split into forward passes.
+Run with `python -m pytest` from this directory.
+"""
+import asyncio
+
+import pytest
+import torch
+
+import agent_llama
+from generation import BatchScheduler, InputBuffer, PrefixCache
+
+PROMPTS = [
+    "Wie zitiere ich ein Buch ?",
+    "Verbessere den Satz Main Nahme isd Mike",
+    "Erstelle mir eine gliederung für meine Bachelorarbeit über erneuerbare Energien in Deutschland",
+    "Ordne die Anfrage einer Kategorie zu :",
+    "Du bist ein Tutor",
+]
+
+
+async def submit_all(scheduler, items):
+    scheduler.start()
+    try:
+        return await asyncio.gather(*(scheduler.submit(item) for item in items))
+    finally:
+        await scheduler.stop()
+
+
+@pytest.fixture(scope="module")
+def greedy_generate(model, tokenizer):
+    buffer = InputBuffer(model.device, tokenizer.pad_token_id)
+
+    def run_batch(texts):
+        input_ids, attention_mask = buffer.pack(tokenizer(texts).input_ids)
+        with torch.no_grad():
+            outputs = model.generate(input_ids=input_ids, attention_mask=attention_mask, max_new_tokens=6,
+                                     do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        return [output[input_ids.shape[1]:].tolist() for output in outputs]
+
+    return run_batch
+
+
+def test_concurrent_requests_share_one_batch(greedy_generate):
+    scheduler = BatchScheduler(greedy_generate, max_batch_size=8, max_wait_ms=200)
+    results = asyncio.run(submit_all(scheduler, PROMPTS))
+    assert results == [greedy_generate([prompt])[0] for prompt in PROMPTS]
+    stats = scheduler.stats()
+    assert stats["batch_size_histogram"] == {len(PROMPTS): 1}
+    assert stats["queue_depth_histogram"] == {0: 1}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    scheduler = BatchScheduler(lambda items: [item * 2 for item in items], max_batch_size=4, max_wait_ms=200)
+    assert asyncio.run(submit_all(scheduler, range(10))) == [item * 2 for item in range(10)]
+    assert scheduler.stats()["batch_size_histogram"] == {2: 1, 4: 2}
+
+
+def test_batch_failure_reaches_every_request():
+    def fail(items):
+        raise RuntimeError("out of memory")
+
+    scheduler = BatchScheduler(fail, max_batch_size=4, max_wait_ms=50)
+
+    async def run():
+        scheduler.start()
+        try:
+            return await asyncio.gather(*(scheduler.submit(item) for item in range(3)), return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    assert [str(result) for result in asyncio.run(run())] == ["out of memory"] * 3
+
+
+@pytest.fixture
+def classifier(monkeypatch, model, tokenizer):
+    monkeypatch.setattr(agent_llama, "model", model)
+    monkeypatch.setattr(agent_llama, "tokenizer", tokenizer)
+    monkeypatch.setattr(agent_llama, "device", model.device)
+    monkeypatch.setattr(agent_llama, "input_buffer", InputBuffer(model.device, tokenizer.pad_token_id))
+    monkeypatch.setattr(agent_llama, "label_token_ids",
+                        [tokenizer(label, add_special_tokens=False).input_ids for label in agent_llama.LABELS])
+    monkeypatch.setattr(agent_llama, "classifier_prefix", PrefixCache(model, tokenizer, agent_llama.CLASSIFIER_PREFIX))
+    return agent_llama
+
+
+def assert_same_probabilities(actual, expected):
+    assert len(actual) == len(expected)
+    for result, reference in zip(actual, expected):
+        assert result.keys() == reference.keys()
+        assert result == pytest.approx(reference, abs=1e-5)
+
+
+def test_classify_batch_matches_single_queries(classifier):
+    expected = [classifier.classify_batch([prompt])[0] for prompt in PROMPTS]
+    assert_same_probabilities(classifier.classify_batch(PROMPTS), expected)
+
+
+def test_classify_batch_split_by_kv_budget(classifier, monkeypatch):
+    expected = classifier.classify_batch(PROMPTS)
+    # A budget below one query's rows still scores one query per forward pass.
+    monkeypatch.setattr(classifier, "CLASSIFY_KV_TOKEN_BUDGET", 1)
+    assert_same_probabilities(classifier.classify_batch(PROMPTS), expected)
+
+
+def test_classify_batch_matches_full_prompt(classifier, monkeypatch):
+    expected = classifier.classify_batch(PROMPTS)
+    monkeypatch.setattr(classifier, "USE_PREFIX_CACHE", False)
+    assert_same_probabilities(classifier.classify_batch(PROMPTS), expected)
@@ -0,0 +1,70 @@
+"""
+Checks on a tiny CPU model that generating from the cached prompt prefix gives the same result as
+encoding the full prompt. generation.py is shared with the BLOOM agent, so this covers both copies.
+Run with `python -m pytest` from this directory.
+"""
+import threading
+
+import pytest
+import torch
+from transformers import StoppingCriteriaList
+
+from generation import CancelFlag, PrefixCache
+
+PREFIX = "Du bist ein Tutor für wissenschaftliches Arbeiten . Ordne die Anfrage einer Kategorie zu :"
+SUFFIXES = [
+    " Wie zitiere ich ein Buch mit zwei Autoren ?",
+    " Verbessere den Satz Main Nahme isd Mike",
+    " Erstelle mir eine gliederung für meine Bachelorarbeit über erneuerbare Energien in Deutschland",
+]
+
+
+@pytest.fixture(scope="module")
+def prefix_cache(model, tokenizer):
+    return PrefixCache(model, tokenizer, PREFIX)
+
+
+def full_prompt_generate(model, tokenizer, suffix, **generate_kwargs):
+    inputs = tokenizer(PREFIX + suffix, return_tensors="pt")
+    return model.generate(**inputs, **generate_kwargs)[0, inputs.input_ids.shape[1]:]
+
+
+def test_suffix_logits_match_full_prompt(model, tokenizer, prefix_cache):
+    for suffix in SUFFIXES:
+        with torch.no_grad():
+            full = model(**tokenizer(PREFIX + suffix, return_tensors="pt")).logits
+            cached = model(torch.tensor([prefix_cache.encode_suffix(suffix)]),
+                           past_key_values=prefix_cache.cache()).logits
+        torch.testing.assert_close(cached, full[:, prefix_cache.length:], rtol=1e-4, atol=1e-4)
+
+
+def test_generate_matches_full_prompt(model, tokenizer, prefix_cache):
+    generate_kwargs = {"max_new_tokens": 8, "do_sample": False, "pad_token_id": tokenizer.pad_token_id}
+    expected = [full_prompt_generate(model, tokenizer, suffix, **generate_kwargs).tolist() for suffix in SUFFIXES]
+    single = [prefix_cache.generate([prefix_cache.encode_suffix(suffix)], **generate_kwargs)[0].tolist()
+              for suffix in SUFFIXES]
+    # The suffixes differ in length, so the batch also covers the left padding between prefix and suffix.
+    batched = [output.tolist() for output in
+               prefix_cache.generate([prefix_cache.encode_suffix(suffix) for suffix in SUFFIXES], **generate_kwargs)]
+    assert single == expected
+    assert batched == expected
+
+
+def test_cache_copies_are_not_shared(tokenizer, prefix_cache):
+    generate_kwargs = {"max_new_tokens": 4, "do_sample": False, "pad_token_id": tokenizer.pad_token_id}
+    first = prefix_cache.generate([prefix_cache.encode_suffix(SUFFIXES[0])], **generate_kwargs)[0].tolist()
+    prefix_cache.generate([prefix_cache.encode_suffix(SUFFIXES[1])], **generate_kwargs)
+    assert prefix_cache.past_key_values.get_seq_length() == prefix_cache.length
+    assert prefix_cache.generate([prefix_cache.encode_suffix(SUFFIXES[0])], **generate_kwargs)[0].tolist() == first
+
+
+def test_cancel_flag_stops_generation(tokenizer, prefix_cache):
+    generate_kwargs = {"max_new_tokens": 8, "min_new_tokens": 8, "do_sample": False,
+                       "pad_token_id": tokenizer.pad_token_id}
+    suffix_ids = [prefix_cache.encode_suffix(SUFFIXES[0])]
+    cancelled = threading.Event()
+    stopping_criteria = StoppingCriteriaList([CancelFlag(cancelled)])
+    assert len(prefix_cache.generate(suffix_ids, stopping_criteria=stopping_criteria, **generate_kwargs)[0]) == 8
+    cancelled.set()
+    # The criterion is checked after every new token, so only the first one is generated.
+    assert len(prefix_cache.generate(suffix_ids, stopping_criteria=stopping_criteria, **generate_kwargs)[0]) == 1
@@ -1,17 +1,29 @@
 from typing import List
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
 import os
+import json
 import logging
+import time
 
 from llm_client import LLMClient
+from tracing import tracer
 
 MODEL_NAME = "mistralai/Mistral-7B-v0.1"
 HF_TOKEN = os.environ.get("HF_TOKEN", None)
-llm_client = LLMClient(HF_TOKEN)
+# LLM_BACKEND selects remote (gradio space), openai (OpenAI-compatible server at LLM_BASE_URL) or transformers.
+# LLM_SPACE points the client at another space or URL (e.g. a local stub server), LLM_SECONDARY_SPACE adds a fallback.
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "remote")
+if LLM_BACKEND == "openai":
+    llm_client = LLMClient(HF_TOKEN, os.environ.get("LLM_BASE_URL"), os.environ.get("LLM_SECONDARY_URL"),
+                           backend=LLM_BACKEND, model=MODEL_NAME)
+else:
+    llm_client = LLMClient(HF_TOKEN, os.environ.get("LLM_SPACE", "hysts/mistral-7b"),
+                           os.environ.get("LLM_SECONDARY_SPACE"), backend=LLM_BACKEND, model=MODEL_NAME)
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,11 +40,11 @@ async def lifespan(app: FastAPI):
     logging.debug("Mistral Agent shutdown.")
 
 app = FastAPI(lifespan=lifespan)
+tracer.install(app)
 
 
-@app.post("/process/")
-async def generate_outline(input: TextInput):
-    prompt = (
+def build_prompt(input: TextInput):
+    return (
         "Du bist ein hochspezialisierter Experte für die Erstellung von Gliederungen für wissenschaftliche Arbeiten."
         "Deine einzige Aufgabe ist es, detaillierte und logisch strukturierte Gliederungen für wissenschaftliche Themen zu erstellen."
         "Unter keinen Umständen solltest du über diese Aufgabe hinausgehen und zusätzliche Erklärungen oder Texte liefern."
@@ -56,15 +68,74 @@ async def generate_outline(input: TextInput):
         "Gib nur die Gliederung ohne weitere Erklärungen an."
     )
 
+
+@app.post("/process/")
+async def generate_outline(input: TextInput):
+    prompt = build_prompt(input)
+
     logging.debug(f"User Input for Mistral: {input.text}")
     logging.debug(f"Retrieved Context from RAG: {input.context}")
 
-    response = llm_client.query_instruct(
-        model=MODEL_NAME,
-        message=prompt,
-        max_tokens=1000
-    )
+    try:
+        with tracer.span("upstream", backend=llm_client.backend.name):
+            response = await llm_client.aquery_instruct(
+                model=MODEL_NAME,
+                message=prompt,
+                max_tokens=1000
+            )
+    except RuntimeError as e:
+        logging.error(e)
+        raise HTTPException(status_code=503, detail=str(e))
 
     logging.debug(response)
 
-    return {"response": response}
\ No newline at end of file
+    return {"response": response}
+
+
+@app.get("/metrics/")
+async def metrics():
+    return llm_client.stats()
+
+
+@app.get("/health/")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready/")
+async def ready():
+    """
+    Ready unless the circuit breakers of all upstream backends are open. A breaker whose reset_timeout has
+    elapsed counts as available: the router only sends requests to ready agents, so without traffic the
+    breaker would never get to its half-open probe otherwise.
+    """
+    stats = llm_client.stats()
+    if not any(backend["available"] for backend in stats["backends"].values()):
+        raise HTTPException(status_code=503, detail=stats)
+    return stats
+
+
+@app.post("/stream/")
+async def stream_outline(input: TextInput):
+    """Streams the outline as server-sent events while the model generates it."""
+    prompt = build_prompt(input)
+
+    trace = tracer.current()
+
+    async def events():
+        start = time.time()
+        first_token_at = None
+        try:
+            async for token in llm_client.astream_instruct(model=MODEL_NAME, message=prompt, max_tokens=1000):
+                first_token_at = first_token_at or time.time()
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        except RuntimeError as e:
+            logging.error(e)
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        end = time.time()
+        # Time to the first token covers the upstream's queueing and prefill, the rest is decoding.
+        tracer.record("upstream_first_token", trace, start, first_token_at or end)
+        tracer.record("upstream_decode", trace, first_token_at or end, end)
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,25 +1,44 @@
 import logging
-from gradio_client import Client
+
+from llm_backends import GradioBackend, create_backend
+from resilience import ResilientExecutor
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class LLMClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, space: str = "hysts/mistral-7b", secondary_space: str = None,
+                 backend: str = "remote", model: str = None):
         """
         Initialize the LLM client using the Hugging Face InferenceClient for Instruct models
         and requests for chat models.
 
         Args:
             api_key (str): The Hugging Face API key for authentication.
+            space (str): Gradio space or URL (e.g. a local stub server) serving the /chat endpoint;
+                the server URL for the openai backend.
+            secondary_space (str): Optional second space or URL used for failover and hedged requests.
+            backend (str): remote (gradio space), openai (OpenAI-compatible server)
+                or transformers (in-process model, see llm_backends.TransformersBackend).
+            model (str): Model loaded by the transformers backend unless LLM_MODEL is set.
         """
-        if not api_key:
+        if backend == "remote" and not api_key:
             raise ValueError("HF_API_TOKEN must be provided or set in the environment variables.")
         self.api_key = api_key
-        self.client = Client("hysts/mistral-7b")
+        self.resilience = ResilientExecutor()
+        self.backends = [
+            ResilientExecutor.backend("primary", create_backend(backend, GradioBackend, space, api_key, model))
+        ]
+        if secondary_space and backend != "transformers":
+            self.backends.append(
+                ResilientExecutor.backend("secondary", create_backend(backend, GradioBackend, secondary_space, api_key, model))
+            )
+        self.backend = self.backends[0].client
 
-    def query_instruct(self, model: str, message: str, max_tokens: int = 500, temperature: float = 1.0) -> dict:
+    async def aquery_instruct(self, model: str, message: str, max_tokens: int = 500, temperature: float = 1.0):
         """
-        Query the LLM using the Instruct model for chat completion.
+        Query the LLM using the Instruct model for chat completion. The call runs in a worker thread with a
+        deadline, skips backends whose circuit breaker is open and is hedged to the secondary backend when the
+        primary is slow.
 
         Args:
             model (str): The name of the model to query.
@@ -28,16 +47,35 @@ class LLMClient:
             temperature (float): Sampling temperature for response generation.
 
         Returns:
-            dict: The response from the API.
+            str: The generated response.
+
+        Raises:
+            RuntimeError: If no backend answered in time (CircuitOpenError, DeadlineExceededError included).
         """
-        try:
-            result = self.client.predict(
-                message=message,
-                param_2=max_tokens,
-                api_name="/chat"
-            )
-            return result
+        messages = [{"role": "user", "content": message}]
+        return await self.resilience.call(
+            self.backends, lambda backend: backend.complete(model, messages, max_tokens, temperature)
+        )
 
-        except Exception as e:
-            raise RuntimeError(f"Error querying the instruct model API: {e}")
+    async def astream_instruct(self, model: str, message: str, max_tokens: int = 500, temperature: float = 1.0):
+        """
+        Query the LLM like aquery_instruct, but yield the response text incrementally. Fails with a
+        RuntimeError if the upstream stalls.
+
+        Args:
+            model (str): The name of the model to query.
+            message (str): The message to send.
+            max_tokens (int): The maximum number of tokens for the response.
+            temperature (float): Sampling temperature for response generation.
+
+        Yields:
+            str: The newly generated part of the response.
+        """
+        messages = [{"role": "user", "content": message}]
+        async for delta in self.resilience.stream(
+            self.backends, lambda backend: backend.stream(model, messages, max_tokens, temperature)
+        ):
+            yield delta
 
+    def stats(self):
+        return {"backend": self.backend.name, **self.resilience.stats(self.backends)}
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a backend is skipped because its circuit breaker is open."""
+    pass
+
+
+class DeadlineExceededError(RuntimeError):
+    """Raised when a backend call does not finish within its deadline."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds.
+    Afterwards it is half-open: a single probe call is let through, which closes the breaker on
+    success or opens it again on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """
+        False only while the breaker is open and reset_timeout has not elapsed. Unlike allow() this does not
+        change the state, so it can be polled by readiness checks that must not use up the half-open probe.
+        """
+        with self._lock:
+            return self.state != self.OPEN or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning(f"Circuit breaker opened after {self.failures} failures.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Gives back a half-open probe whose call ended without an outcome, so that the next call can probe."""
+        with self._lock:
+            self._probing = False
+
+
+class Backend:
+    """One upstream the client can call, with its own circuit breaker and latency history."""
+
+    def __init__(self, name: str, client, breaker: CircuitBreaker, latency_window: int = 200):
+        self.name = name
+        self.client = client
+        self.breaker = breaker
+        self.latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.failures = 0
+
+    def percentile(self, q: float, min_samples: int = 20):
+        if not self.latencies or len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * q / 100), len(ordered) - 1)]
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "available": self.breaker.available,
+            "calls": self.calls,
+            "failures": self.failures,
+            "p50": self.percentile(50, 1),
+            "p95": self.percentile(95, 1),
+        }
+
+
+class Attempt:
+    """
+    One call of a backend. Its outcome is recorded exactly once: by the worker when the call returns,
+    or as a failure by the caller when the deadline expires first, whichever comes first. A call the
+    caller abandons before either happens counts neither way.
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.start = time.monotonic()
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def _settle(self) -> bool:
+        with self._lock:
+            first, self._settled = not self._settled, True
+        return first
+
+    def succeeded(self):
+        if self._settle():
+            self.backend.latencies.append(time.monotonic() - self.start)
+            self.backend.breaker.record_success()
+
+    def failed(self):
+        if self._settle():
+            self.backend.failures += 1
+            self.backend.breaker.record_failure()
+
+    def abandoned(self):
+        if self._settle():
+            self.backend.breaker.release()
+
+
+class ResilientExecutor:
+    """
+    Runs blocking upstream calls off the event loop with a deadline per call.
+
+    Calls go to the first backend whose circuit breaker allows it. If hedging is enabled and a
+    secondary backend exists, the secondary is called as well once the primary has been running
+    longer than its `hedge_percentile` latency; the first successful answer wins.
+    """
+
+    def __init__(self, deadline: float = None, stream_idle_timeout: float = None, hedge_percentile: float = None,
+                 max_workers: int = None):
+        self.deadline = deadline if deadline is not None else float(os.environ.get("LLM_DEADLINE_SECONDS", 60))
+        self.stream_idle_timeout = (stream_idle_timeout if stream_idle_timeout is not None
+                                    else float(os.environ.get("LLM_STREAM_IDLE_SECONDS", 30)))
+        # 0 disables hedging.
+        self.hedge_percentile = (hedge_percentile if hedge_percentile is not None
+                                 else float(os.environ.get("LLM_HEDGE_PERCENTILE", 95)))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or int(os.environ.get("LLM_MAX_WORKERS", 16)))
+        self.hedged = 0
+
+    @staticmethod
+    def backend(name: str, client):
+        breaker = CircuitBreaker(
+            int(os.environ.get("LLM_BREAKER_FAILURES", 5)),
+            float(os.environ.get("LLM_BREAKER_RESET_SECONDS", 30)),
+        )
+        return Backend(name, client, breaker)
+
+    def _start(self, backend: Backend, fn):
+        """Starts fn(backend.client) in a worker thread; returns its future and its Attempt."""
+        backend.calls += 1
+        attempt = Attempt(backend)
+
+        def run():
+            try:
+                result = fn(backend.client)
+            except Exception:
+                attempt.failed()
+                raise
+            attempt.succeeded()
+            return result
+
+        future = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(self.executor, run))
+        # Losing hedged calls and calls past their deadline are never awaited; mark their errors as seen.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future, attempt
+
+    async def call(self, backends: list, fn):
+        """Calls fn(client) on the backends and returns the first successful result."""
+        # Breakers are only asked right before a backend is used, so a half-open probe is never wasted.
+        candidates = list(backends)
+
+        def next_backend():
+            while candidates:
+                backend = candidates.pop(0)
+                if backend.breaker.allow():
+                    return backend
+            return None
+
+        primary = next_backend()
+        if primary is None:
+            raise CircuitOpenError("All upstream backends are unavailable (circuit open).")
+        deadline = time.monotonic() + self.deadline
+        future, attempt = self._start(primary, fn)
+        pending = {future: attempt}
+        errors = []
+
+        hedge_delay = primary.percentile(self.hedge_percentile) if self.hedge_percentile and candidates else None
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=min(hedge_delay, self.deadline))
+            if not done:
+                backend = next_backend()
+                if backend is not None:
+                    logging.debug(f"Hedging request to {backend.name} after {hedge_delay:.2f}s.")
+                    self.hedged += 1
+                    future, attempt = self._start(backend, fn)
+                    pending[future] = attempt
+
+        while True:
+            if not pending:
+                backend = next_backend()
+                if backend is None:
+                    raise RuntimeError(f"All upstream backends failed: {errors}")
+                future, attempt = self._start(backend, fn)
+                pending[future] = attempt
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # The worker threads keep running, but the caller is released and the breakers count a failure.
+                # Whatever those threads return later is not recorded again.
+                for attempt in pending.values():
+                    attempt.failed()
+                raise DeadlineExceededError(f"Upstream call exceeded its deadline of {self.deadline}s.")
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+
+    async def stream(self, backends: list, fn):
+        """
+        Iterates fn(client) in a worker thread and yields its items. Raises DeadlineExceededError if no
+        item arrives within the idle timeout. Streams are not hedged; the first available backend is used.
+        """
+        backend = next((backend for backend in backends if backend.breaker.allow()), None)
+        if backend is None:
+            raise CircuitOpenError("All upstream backends are unavailable (circuit open).")
+        backend.calls += 1
+        attempt = Attempt(backend)
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stopped = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for item in fn(backend.client):
+                    if stopped.is_set():
+                        return
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                loop.call_soon_threadsafe(items.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, e)
+
+        self.executor.submit(produce)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(items.get(), self.stream_idle_timeout)
+                except asyncio.TimeoutError:
+                    attempt.failed()
+                    raise DeadlineExceededError(f"Upstream stream stalled for {self.stream_idle_timeout}s.")
+                if item is done:
+                    attempt.succeeded()
+                    return
+                if isinstance(item, Exception):
+                    attempt.failed()
+                    raise RuntimeError(f"Error querying the instruct model API: {item}")
+                yield item
+        finally:
+            # The consumer closed the stream early (client disconnect, aclose()): without an outcome the
+            # half-open probe would never be given back and the breaker would reject every later call.
+            attempt.abandoned()
+            stopped.set()
+
+    def stats(self, backends: list):
+        return {"hedged": self.hedged, "backends": {backend.name: backend.stats() for backend in backends}}
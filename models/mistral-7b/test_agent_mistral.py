@@ -0,0 +1,45 @@
+"""
+Readiness of the agent while its circuit breakers are open. The agent is started with the openai backend, which
+does not connect before the first request. Run with `python -m pytest` from this directory.
+"""
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("LLM_BACKEND", "openai")
+os.environ.setdefault("LLM_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("LLM_SECONDARY_URL", "http://127.0.0.1:9")
+
+import agent_mistral  # noqa: E402
+
+
+@pytest.fixture
+def breakers():
+    breakers = [backend.breaker for backend in agent_mistral.llm_client.backends]
+    saved = [breaker.reset_timeout for breaker in breakers]
+    yield breakers
+    for breaker, reset_timeout in zip(breakers, saved):
+        breaker.reset_timeout = reset_timeout
+        breaker.record_success()
+
+
+def test_ready_again_after_reset_timeout(breakers):
+    client = TestClient(agent_mistral.app)
+    assert client.get("/ready/").status_code == 200
+
+    for breaker in breakers:
+        breaker.reset_timeout = 0.1
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+    response = client.get("/ready/")
+    assert response.status_code == 503
+    assert all(not backend["available"] for backend in response.json()["detail"]["backends"].values())
+
+    # Nobody called allow() in between, so the breakers are still open; the agent must report ready anyway
+    # so that the router sends the request that becomes the half-open probe.
+    time.sleep(0.15)
+    response = client.get("/ready/")
+    assert response.status_code == 200
+    assert all(backend["state"] == "open" for backend in response.json()["backends"].values())
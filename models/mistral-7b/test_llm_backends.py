@@ -0,0 +1,56 @@
+"""
+TransformersBackend on a tiny randomly initialised Llama saved to a temporary directory, so the test needs
+neither a GPU nor the Hugging Face Hub. llm_backends.py is shared with the Zephyr agent, so this covers both
+copies. Run with `python -m pytest` from this directory.
+"""
+import pytest
+
+from llm_backends import TransformersBackend, create_backend
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+WORDS = "Du bist ein Tutor . Wie zitiere ich ein Buch mit zwei Autoren ? Antwort Quelle Seite".split()
+MESSAGES = [{"role": "user", "content": "Wie zitiere ich ein Buch mit zwei Autoren ?"}]
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    vocab = {token: i for i, token in enumerate(["<pad>", "<unk>", "<s>", "</s>"] + sorted(set(WORDS)))}
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.WhitespaceSplit()
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>",
+                                                     unk_token="<unk>", bos_token="<s>", eos_token="</s>")
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64,
+                                      num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=4,
+                                      max_position_embeddings=128, initializer_range=0.5,
+                                      pad_token_id=tokenizer.pad_token_id, bos_token_id=tokenizer.bos_token_id,
+                                      eos_token_id=tokenizer.eos_token_id)
+    directory = tmp_path_factory.mktemp("tiny-llama")
+    transformers.LlamaForCausalLM(config).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return str(directory)
+
+
+def test_complete_and_stream_generate_the_same_text(model_dir, monkeypatch):
+    monkeypatch.delenv("LLM_MODEL", raising=False)
+    backend = create_backend("transformers", None, model=model_dir)
+    assert isinstance(backend, TransformersBackend)
+
+    text = backend.complete(None, MESSAGES, max_tokens=8, temperature=0)
+    assert text
+    assert "".join(backend.stream(None, MESSAGES, max_tokens=8, temperature=0)) == text
+
+
+def test_stream_raises_when_generation_fails(model_dir, monkeypatch):
+    backend = TransformersBackend(model_dir)
+    monkeypatch.setattr(backend, "_generate_kwargs", lambda max_tokens, temperature: {"max_new_tokens": -1})
+    with pytest.raises(ValueError):
+        list(backend.stream(None, MESSAGES, max_tokens=8, temperature=0))
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown LLM_BACKEND 'tgi'"):
+        create_backend("tgi", None)
@@ -0,0 +1,73 @@
+"""
+Breaker accounting of ResilientExecutor.call and .stream: every attempt counts exactly once, also when the
+deadline expires before the worker thread returns, and a stream closed early gives back its half-open probe.
+resilience.py is shared with the Zephyr agent, so this covers both copies. Run with `python -m pytest` from this directory.
+"""
+import asyncio
+import threading
+
+import pytest
+
+from resilience import Backend, CircuitBreaker, DeadlineExceededError, ResilientExecutor
+
+
+def slow_call(release, error=None):
+    def fn(client):
+        release.wait(5)
+        if error:
+            raise error
+        return "Antwort"
+    return fn
+
+
+async def call_past_deadline(executor, backend, fn):
+    with pytest.raises(DeadlineExceededError):
+        await executor.call([backend], fn)
+
+
+@pytest.mark.parametrize("late_error", [None, RuntimeError("upstream failed")])
+def test_deadline_expiry_counts_one_failure(late_error):
+    executor = ResilientExecutor(deadline=0.05, hedge_percentile=0, max_workers=2)
+    backend = Backend("primary", None, CircuitBreaker(failure_threshold=5))
+    release = threading.Event()
+    asyncio.run(call_past_deadline(executor, backend, slow_call(release, late_error)))
+    assert (backend.failures, backend.breaker.failures) == (1, 1)
+
+    # The worker returns after the caller gave up; its late result must neither count again nor close the breaker.
+    release.set()
+    executor.executor.shutdown(wait=True)
+    assert (backend.failures, backend.breaker.failures) == (1, 1)
+    assert not backend.latencies
+
+
+def test_failed_and_successful_attempts_are_recorded():
+    executor = ResilientExecutor(deadline=5, hedge_percentile=0, max_workers=2)
+    failing = Backend("primary", None, CircuitBreaker(failure_threshold=5))
+    healthy = Backend("secondary", None, CircuitBreaker(failure_threshold=5))
+
+    def fn(client):
+        if client is None:
+            raise RuntimeError("upstream failed")
+        return client
+
+    healthy.client = "Antwort"
+    assert asyncio.run(executor.call([failing, healthy], fn)) == "Antwort"
+    assert (failing.failures, failing.breaker.failures) == (1, 1)
+    assert (healthy.failures, len(healthy.latencies), healthy.breaker.state) == (0, 1, CircuitBreaker.CLOSED)
+
+
+def test_closing_a_probe_stream_early_releases_the_probe():
+    executor = ResilientExecutor(deadline=5, stream_idle_timeout=5, hedge_percentile=0, max_workers=2)
+    backend = Backend("primary", None, CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    backend.breaker.record_failure()
+
+    async def read_one_item():
+        stream = executor.stream([backend], lambda client: iter(["Ant", "wort"]))
+        assert await stream.__anext__() == "Ant"
+        await stream.aclose()
+
+    asyncio.run(read_one_item())
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    assert (backend.failures, backend.breaker.failures) == (0, 1)
+    # Without the release the breaker would keep rejecting calls as if the probe were still running.
+    assert backend.breaker.allow()
@@ -1,16 +1,28 @@
 import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
+import json
 import logging
+import time
 
 from llm_client import LLMClient
+from tracing import tracer
 
 MODEL_NAME = "HuggingFaceH4/zephyr-7b-beta"
 HF_TOKEN = os.environ.get("HF_TOKEN", None)
-llm_client = LLMClient(HF_TOKEN)
+# LLM_BACKEND selects remote (HF Inference API), openai (OpenAI-compatible server) or transformers (in-process).
+# LLM_BASE_URL points the client at another endpoint (e.g. a local stub server), LLM_SECONDARY_URL adds a fallback.
+llm_client = LLMClient(
+    HF_TOKEN,
+    os.environ.get("LLM_BASE_URL"),
+    os.environ.get("LLM_SECONDARY_URL"),
+    backend=os.environ.get("LLM_BACKEND", "remote"),
+    model=MODEL_NAME,
+)
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -27,11 +39,11 @@ async def lifespan(app: FastAPI):
     logging.debug("Zephyr Agent shutdown.")
 
 app = FastAPI(lifespan=lifespan)
+tracer.install(app)
 
 
-@app.post("/process/")
-async def generate_outline(input: TextInput):
-    prompt = (
+def build_prompt(input: TextInput):
+    return (
         "Du bist ein hochspezialisierter Experte für die Erstellung von Zitaten für wissenschaftliche Arbeiten. "
         "Deine einzige Aufgabe ist es, genaue Zitate basierend auf einem definierten Zitationsstil zu erstellen. "
         "Unter keinen Umständen solltest du zusätzliche Erklärungen oder Texte über das Zitat selbst hinaus liefern. "
@@ -69,10 +81,69 @@ async def generate_outline(input: TextInput):
         "Gib nur das Zitat an, ohne zusätzliche Erklärungen."
     )
 
+
+@app.post("/process/")
+async def generate_outline(input: TextInput):
+    prompt = build_prompt(input)
+
     messages = [{"role": "user", "content": prompt}]
-    response = llm_client.query_instruct(
-        model=MODEL_NAME,
-        messages=messages,
-    )
+    try:
+        with tracer.span("upstream", backend=llm_client.backend.name):
+            response = await llm_client.aquery_instruct(
+                model=MODEL_NAME,
+                messages=messages,
+            )
+    except RuntimeError as e:
+        logging.error(e)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"response": response.strip().lower()}
+
+
+@app.get("/metrics/")
+async def metrics():
+    return llm_client.stats()
+
+
+@app.get("/health/")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready/")
+async def ready():
+    """
+    Ready unless the circuit breakers of all upstream backends are open. A breaker whose reset_timeout has
+    elapsed counts as available: the router only sends requests to ready agents, so without traffic the
+    breaker would never get to its half-open probe otherwise.
+    """
+    stats = llm_client.stats()
+    if not any(backend["available"] for backend in stats["backends"].values()):
+        raise HTTPException(status_code=503, detail=stats)
+    return stats
+
+
+@app.post("/stream/")
+async def stream_citation(input: TextInput):
+    """Streams the citation as server-sent events while the model generates it."""
+    messages = [{"role": "user", "content": build_prompt(input)}]
+
+    trace = tracer.current()
+
+    async def events():
+        start = time.time()
+        first_token_at = None
+        try:
+            async for token in llm_client.astream_instruct(model=MODEL_NAME, messages=messages):
+                first_token_at = first_token_at or time.time()
+                yield f"data: {json.dumps({'token': token.lower()})}\n\n"
+        except RuntimeError as e:
+            logging.error(e)
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        end = time.time()
+        # Time to the first token covers the upstream's queueing and prefill, the rest is decoding.
+        tracer.record("upstream_first_token", trace, start, first_token_at or end)
+        tracer.record("upstream_decode", trace, first_token_at or end, end)
+        yield f"data: {json.dumps({'done': True})}\n\n"
 
-    return {"response": response["choices"][0]["message"]["content"].strip().lower()}
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import threading
+
+
+class LLMBackend:
+    """
+    Interface of the inference backends behind LLMClient.
+
+    messages are chat messages in the format [{"role": "user", "content": "..."}];
+    complete() returns the generated text, stream() yields it piece by piece.
+    """
+
+    name = "backend"
+
+    def complete(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 1.0) -> str:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 1.0):
+        yield self.complete(model, messages, max_tokens, temperature)
+
+
+def last_user_message(messages: list) -> str:
+    return next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+
+class HFInferenceBackend(LLMBackend):
+    """Hugging Face Inference API (or any TGI endpoint given as base_url) via huggingface_hub."""
+
+    name = "hf_inference"
+
+    def __init__(self, api_key: str, base_url: str = None):
+        from huggingface_hub import InferenceClient
+        self.client = InferenceClient(base_url=base_url, api_key=api_key)
+
+    def complete(self, model, messages, max_tokens=500, temperature=1.0):
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature
+        )
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, max_tokens=500, temperature=1.0):
+        for chunk in self.client.chat.completions.create(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+        ):
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+
+class GradioBackend(LLMBackend):
+    """A gradio space (or URL) with a /chat endpoint taking the message and the maximum number of new tokens."""
+
+    name = "gradio"
+
+    def __init__(self, space: str):
+        from gradio_client import Client
+        self.client = Client(space)
+
+    def complete(self, model, messages, max_tokens=500, temperature=1.0):
+        return self.client.predict(message=last_user_message(messages), param_2=max_tokens, api_name="/chat")
+
+    def stream(self, model, messages, max_tokens=500, temperature=1.0):
+        job = self.client.submit(message=last_user_message(messages), param_2=max_tokens, api_name="/chat")
+        previous = ""
+        for output in job:
+            # The space returns the full response generated so far with every update.
+            if output.startswith(previous):
+                yield output[len(previous):]
+            else:
+                yield output
+            previous = output
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Any server implementing the OpenAI /v1/chat/completions API (vLLM, TGI, llama.cpp, Ollama, ...)."""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str = None, model: str = None, timeout: float = 120.0):
+        import httpx
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.http = httpx.Client(base_url=base_url.rstrip("/"), headers=headers, timeout=timeout)
+        self.model = model
+
+    def _payload(self, model, messages, max_tokens, temperature, stream=False):
+        return {
+            "model": self.model or model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    def complete(self, model, messages, max_tokens=500, temperature=1.0):
+        response = self.http.post("/chat/completions", json=self._payload(model, messages, max_tokens, temperature))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(self, model, messages, max_tokens=500, temperature=1.0):
+        payload = self._payload(model, messages, max_tokens, temperature, stream=True)
+        with self.http.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                content = json.loads(data)["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+
+
+class TransformersBackend(LLMBackend):
+    """
+    In-process Hugging Face transformers model. Requires torch and transformers, which are not part of
+    the agent's default requirements; a tiny CPU model (e.g. sshleifer/tiny-gpt2) is enough for tests.
+    """
+
+    name = "transformers"
+
+    def __init__(self, model_name: str, api_key: str = None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, token=api_key)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_name, token=api_key, torch_dtype="auto",
+            device_map="auto" if torch.cuda.is_available() else None
+        )
+        self.model.eval()
+        # generate() is not safe to run concurrently on one model instance.
+        self._lock = threading.Lock()
+        logging.debug(f"Transformers backend loaded {model_name}.")
+
+    def _inputs(self, messages):
+        if getattr(self.tokenizer, "chat_template", None):
+            prompt = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        else:
+            prompt = "\n".join(m["content"] for m in messages)
+        return self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+
+    def _generate_kwargs(self, max_tokens, temperature):
+        kwargs = {"max_new_tokens": max_tokens, "pad_token_id": self.tokenizer.eos_token_id}
+        if temperature > 0:
+            kwargs.update(do_sample=True, temperature=temperature)
+        return kwargs
+
+    def complete(self, model, messages, max_tokens=500, temperature=1.0):
+        inputs = self._inputs(messages)
+        with self._lock, self.torch.no_grad():
+            output = self.model.generate(**inputs, **self._generate_kwargs(max_tokens, temperature))
+        return self.tokenizer.decode(output[0][inputs.input_ids.shape[1]:], skip_special_tokens=True)
+
+    def stream(self, model, messages, max_tokens=500, temperature=1.0):
+        from transformers import TextIteratorStreamer
+        inputs = self._inputs(messages)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def run():
+            try:
+                with self._lock, self.torch.no_grad():
+                    self.model.generate(**inputs, **self._generate_kwargs(max_tokens, temperature), streamer=streamer)
+            except Exception as e:
+                logging.error(f"Streaming generation failed: {e}")
+                errors.append(e)
+                streamer.end()
+
+        threading.Thread(target=run, daemon=True).start()
+        for text in streamer:
+            if text:
+                yield text
+        # A failed generation must not look like a complete (truncated or empty) answer.
+        if errors:
+            raise errors[0]
+
+
+def create_backend(kind: str, remote_factory, endpoint: str = None, api_key: str = None, model: str = None):
+    """
+    Builds the backend selected by `kind`:
+        remote        the hosted endpoint of the agent, built by remote_factory(endpoint)
+        openai        an OpenAI-compatible server at endpoint (LLM_BASE_URL)
+        transformers  the model LLM_MODEL (or `model`) loaded in-process
+    """
+    if kind == "remote":
+        return remote_factory(endpoint)
+    if kind == "openai":
+        return OpenAICompatibleBackend(
+            endpoint or "http://localhost:8000/v1", os.environ.get("LLM_API_KEY"), os.environ.get("LLM_MODEL")
+        )
+    if kind == "transformers":
+        return TransformersBackend(os.environ.get("LLM_MODEL", model), api_key)
+    raise ValueError(f"Unknown LLM_BACKEND '{kind}', expected remote, openai or transformers.")
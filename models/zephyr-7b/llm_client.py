@@ -1,23 +1,44 @@
-from huggingface_hub import InferenceClient
+from llm_backends import HFInferenceBackend, create_backend
+from resilience import ResilientExecutor
+
 
 class LLMClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = None, secondary_url: str = None, backend: str = "remote",
+                 model: str = None):
         """
         Initialize the LLM client using the Hugging Face InferenceClient for Instruct models
         and requests for chat models.
 
         Args:
             api_key (str): The Hugging Face API key for authentication.
+            base_url (str): Optional endpoint (e.g. a local TGI or stub server) instead of the HF Inference API.
+            secondary_url (str): Optional second endpoint used for failover and hedged requests.
+            backend (str): remote (HF Inference API), openai (OpenAI-compatible server at base_url)
+                or transformers (in-process model, see llm_backends.TransformersBackend).
+            model (str): Model loaded by the transformers backend unless LLM_MODEL is set.
         """
-        if not api_key:
+        if backend == "remote" and not api_key:
             raise ValueError("HF_API_TOKEN must be provided or set in the environment variables.")
         self.api_key = api_key
-        self.headers = {"Authorization": f"Bearer {self.api_key}"}
-        self.instruct_client = InferenceClient(api_key=self.api_key)
 
-    def query_instruct(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 1.0) -> dict:
+        def remote(url):
+            return HFInferenceBackend(self.api_key, url)
+
+        self.resilience = ResilientExecutor()
+        self.backends = [
+            ResilientExecutor.backend("primary", create_backend(backend, remote, base_url, api_key, model))
+        ]
+        if secondary_url and backend != "transformers":
+            self.backends.append(
+                ResilientExecutor.backend("secondary", create_backend(backend, remote, secondary_url, api_key, model))
+            )
+        self.backend = self.backends[0].client
+
+    async def aquery_instruct(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 1.0):
         """
-        Query the LLM using the Instruct model for chat completion.
+        Query the LLM using the Instruct model for chat completion. The call runs in a worker thread with a
+        deadline, skips backends whose circuit breaker is open and is hedged to the secondary backend when the
+        primary is slow.
 
         Args:
             model (str): The name of the model to query.
@@ -26,15 +47,33 @@ class LLMClient:
             temperature (float): Sampling temperature for response generation.
 
         Returns:
-            dict: The response from the API.
+            str: The generated response.
+
+        Raises:
+            RuntimeError: If no backend answered in time (CircuitOpenError, DeadlineExceededError included).
         """
-        try:
-            response = self.instruct_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            return response
-        except Exception as e:
-            raise RuntimeError(f"Error querying the instruct model API: {e}")
\ No newline at end of file
+        return await self.resilience.call(
+            self.backends, lambda backend: backend.complete(model, messages, max_tokens, temperature)
+        )
+
+    async def astream_instruct(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 1.0):
+        """
+        Query the LLM like aquery_instruct, but yield the response text incrementally. Fails with a
+        RuntimeError if the upstream stalls.
+
+        Args:
+            model (str): The name of the model to query.
+            messages (list): A list of messages in the format [{"role": "user", "content": "..."}].
+            max_tokens (int): The maximum number of tokens for the response.
+            temperature (float): Sampling temperature for response generation.
+
+        Yields:
+            str: The next chunk of the response.
+        """
+        async for content in self.resilience.stream(
+            self.backends, lambda backend: backend.stream(model, messages, max_tokens, temperature)
+        ):
+            yield content
+
+    def stats(self):
+        return {"backend": self.backend.name, **self.resilience.stats(self.backends)}
@@ -1,58 +1,72 @@
 import { Message } from "@/types";
-import { spawn } from "child_process";
 import { NextApiRequest, NextApiResponse } from "next";
 
-const handler = async (req: NextApiRequest, res: NextApiResponse): Promise<NextApiResponse> => {
-  const body = req.body;
-  const message: Message = body?.message || { role: "user", content: "Test" };
-  console.log(message.content);
-
-  const pythonVersion = process.env.PYTHON_EXECUTABLE || "python3";
-  const pythonProcess = spawn(pythonVersion, ["./main.py", message.content.toString()]);
+const ROUTER_API_URL = process.env.ROUTER_API_URL || "http://localhost:8080";
 
-  //show pythonprocess output
-  pythonProcess.stdout.on("data", (data) => {
-    console.log(`stdout: ${data}`);
+// Forwards a single message to the router and returns its answer. This used to spawn a "python3 main.py"
+// per message; see benchmark_chat.mjs for the per-message overhead of both paths.
+const askTutor = async (content: string, sessionId: string): Promise<string> => {
+  const routerResponse = await fetch(`${ROUTER_API_URL}/process/`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ text: content, session_id: sessionId }),
   });
+  if (!routerResponse.ok) {
+    throw new Error(`Error contacting router_api: ${routerResponse.status} ${routerResponse.statusText}`);
+  }
+  const parsed = await routerResponse.json();
+  return parsed.response || "No message generated.";
+};
 
-  let output = "";
-  let errorOutput = "";
-
-  // Listen for data output
-  pythonProcess.stdout.on("data", (data) => {
-    output += data.toString(); // Accumulate standard output
+// Forwards the server-sent events of the router to the client as they arrive.
+const streamFromRouter = async (content: string, sessionId: string, res: NextApiResponse) => {
+  const routerResponse = await fetch(`${ROUTER_API_URL}/process/stream/`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ text: content, session_id: sessionId }),
   });
+  if (!routerResponse.ok || !routerResponse.body) {
+    const response_message: Message = { role: "assistant", content: "Router stream failed: " + routerResponse.statusText };
+    res.status(500).json({ message: response_message });
+    return;
+  }
 
-  // Listen for errors
-  pythonProcess.stderr.on("data", (data) => {
-    errorOutput += data.toString(); // Accumulate error output
+  res.writeHead(200, {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache, no-transform",
+    Connection: "keep-alive",
   });
+  const reader = routerResponse.body.getReader();
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    res.write(value);
+  }
+  res.end();
+};
+
+const handler = async (req: NextApiRequest, res: NextApiResponse): Promise<NextApiResponse> => {
+  const body = req.body;
+  const message: Message = body?.message || { role: "user", content: "Test" };
+  const sessionId: string = body?.sessionId || "default";
+  console.log(message.content);
+
+  if (body?.stream) {
+    await streamFromRouter(message.content.toString(), sessionId, res);
+    return res;
+  }
 
   let response_message: Message = { role: "assistant", content: ""}
 
-  // On process close
-  pythonProcess.on("close", (code) => {
-    if (code === 0) {
-      // If successful, send the result back as JSON
-      try {
-        const jsonMatch = output.match(/\{.*\}/); // Matches the first JSON object in the output
-        if (jsonMatch) {
-          const parsedContent = JSON.parse(jsonMatch[0]); // Parse the matched JSON string
-          response_message.content = parsedContent.message
-          res.status(200).json({message: response_message}); // Return only the JSON part
-        } else {
-          response_message.content = "No valid JSON found in output";
-          res.status(200).json({message: response_message});
-        }
-      } catch (parseError) {
-        response_message.content = "Failed to parse JSON";
-        res.status(500).json({message: response_message});
-      }
-    } else {
-      response_message.content = "Python script failed: " + errorOutput;
-      res.status(500).json({message: response_message});
-    }
-  });
+  try {
+    response_message.content = await askTutor(message.content.toString(), sessionId);
+    res.status(200).json({message: response_message});
+  } catch (error: any) {
+    response_message.content = "Router request failed: " + error.message;
+    res.status(500).json({message: response_message});
+  }
   return res;
 };
 
@@ -5,7 +5,10 @@ import Head from "next/head"
 import React from "react"
 import { useEffect, useRef, useState } from "react"
 
+const createSessionId = () => Date.now().toString(36) + Math.random().toString(36).substring(2, 10);
+
 export default function Home() {
+  const [sessionId, setSessionId] = useState<string>(createSessionId);
   const [messages, setMessages] = useState<Message[]>([]);
   const [loading, setLoading] = useState<boolean>(false);
   const [initializing, setInitializing] = useState<boolean>(true);
@@ -30,52 +33,73 @@ export default function Home() {
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ message: { role: "user", content: message.content} as Message} ),
+      body: JSON.stringify({ message: { role: "user", content: message.content} as Message, sessionId: sessionId, stream: true } ),
     };
 
     const response = await fetch("/api/chat", request);
-    if (!response.ok) {
+    if (!response.ok || !response.body) {
       setLoading(false);
       throw new Error(response.statusText);
     }
-    const responseData = await response.json();
-    const messageContent = responseData.message?.content;
 
-    if (!messageContent) {
-      return;
-    }
-
-    setLoading(false);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
     let done = false;
     let isFirst = true;
 
     while (!done) {
-      done = true;
-      if (isFirst) {
-        isFirst = false;
-        setMessages((messages) => [
-          ...messages,
-          {
-            role: "assistant",
-            content: messageContent
-          }
-        ]);
-      } else {
-        setMessages((messages) => {
-          const lastMessage = messages[messages.length - 1];
-          const updatedMessage = {
-            ...lastMessage,
-            content: lastMessage.content + messageContent
-          };
-          return [...messages.slice(0, -1), updatedMessage];
-        });
+      const { value, done: doneReading } = await reader.read();
+      done = doneReading;
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+      // Server-sent events are separated by a blank line; keep the incomplete rest for the next read.
+      const events = buffer.split("\n\n");
+      buffer = events.pop() || "";
+
+      for (const event of events) {
+        if (!event.startsWith("data: ")) {
+          continue;
+        }
+        const data = JSON.parse(event.slice("data: ".length));
+        const chunkValue: string = data.token || data.error || "";
+        if (!chunkValue) {
+          continue;
+        }
+
+        if (isFirst) {
+          isFirst = false;
+          setLoading(false);
+          setMessages((messages) => [
+            ...messages,
+            {
+              role: "assistant",
+              content: chunkValue
+            }
+          ]);
+        } else {
+          setMessages((messages) => {
+            const lastMessage = messages[messages.length - 1];
+            const updatedMessage = {
+              ...lastMessage,
+              content: lastMessage.content + chunkValue
+            };
+            return [...messages.slice(0, -1), updatedMessage];
+          });
+        }
       }
     }
+
+    setLoading(false);
   };
 
   const resetInputState = async () => {
   try {
-    const response = await fetch("http://192.168.23.112:8080/reset/", { method: "POST" });
+    const response = await fetch("http://192.168.23.112:8080/reset/", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ session_id: sessionId }),
+    });
     if (!response.ok) {
       throw new Error("Reset failed");
     }
@@ -88,6 +112,7 @@ export default function Home() {
 
   const handleReset = (chatbotContent: string) => {
     resetInputState();
+    setSessionId(createSessionId());
     setMessages([
       {
         role: "assistant",
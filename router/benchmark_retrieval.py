@@ -0,0 +1,95 @@
+"""
+Compares the query latency of the two retriever backends on the same synthetic corpus:
+
+    chroma run --path /tmp/chroma-benchmark --port 8000     # or the chromadb container of docker-compose
+    python benchmark_retrieval.py [--chroma-host localhost] [--documents 500] [--queries 500]
+
+The corpus has random unit-length embeddings of the all-MiniLM-L6-v2 size and the metadata the DataLoader
+writes (comma-joined headings, tag_* flags). "numpy" queries the memory-mapped VectorIndex in-process,
+"chroma" the same documents in a temporary collection over HTTP. Both are asked for the same top-k, and
+the report shows for how many queries they return the same ids. Embedding the query is not measured.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from vector_index import VectorIndex, write_vector_index
+
+DIMENSION = 384
+TAGS = ["Gliederung", "Zitierweise"]
+
+
+def corpus(documents, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((documents, DIMENSION)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"chunk_{i}" for i in range(documents)]
+    texts = [f"Absatz {i} der Leitlinie." for i in range(documents)]
+    metadatas = []
+    for i in range(documents):
+        metadata = {"headings": f"{i // 50 + 1} Kapitel, {i // 50 + 1}.{i // 10 % 5 + 1} Abschnitt"}
+        if i % 4 == 0:
+            metadata[f"tag_{TAGS[i // 4 % len(TAGS)]}"] = True
+        metadatas.append(metadata)
+    return ids, texts, metadatas, embeddings
+
+
+def measure(query, queries, where):
+    query(queries[:1], where)  # warm-up
+    timings, results = [], []
+    for embedding in queries:
+        start = time.perf_counter()
+        result = query([embedding], where)
+        timings.append((time.perf_counter() - start) * 1e6)
+        results.append(result["ids"][0])
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1], results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chroma-host", default="localhost")
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    ids, texts, metadatas, embeddings = corpus(args.documents)
+    queries = corpus(args.queries, seed=1)[3].tolist()
+
+    client = chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port)
+    collection_name = f"benchmark_{os.getpid()}"
+    collection = client.create_collection(collection_name)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            collection.add(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings.tolist())
+            write_vector_index(directory, ids, texts, metadatas, embeddings, version="benchmark")
+            index = VectorIndex(directory)
+            backends = [
+                ("numpy", lambda batch, where: index.query(batch, args.top_n, where)),
+                ("chroma", lambda batch, where: collection.query(query_embeddings=batch, n_results=args.top_n,
+                                                                 where=where)),
+            ]
+
+            print(f"{'backend':<10}{'filter':<26}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}   "
+                  f"({args.documents} documents, {args.queries} queries, top {args.top_n})")
+            for where in [None, {"tag_Gliederung": True}]:
+                ranked = {}
+                for name, query in backends:
+                    mean, p50, p99, ranked[name] = measure(query, queries, where)
+                    print(f"{name:<10}{str(where or '-'):<26}{mean:>10.0f}{p50:>10.0f}{p99:>10.0f}")
+                # Chroma searches an approximate HNSW graph, so a few queries may rank differently.
+                same = sum(a == b for a, b in zip(ranked["numpy"], ranked["chroma"]))
+                print(f"{'':<10}{'':<26}same top-{args.top_n} for {same} of {len(queries)} queries")
+        finally:
+            client.delete_collection(collection_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger("router")
+
+HF_TOKEN = os.environ.get("HF_TOKEN", None)
+
+
+class TokenCounter:
+    """
+    Counts tokens with the tokenizer of the target model. The tokenizer is loaded on first use;
+    if it cannot be loaded (offline, gated model without token), tokens are estimated from characters.
+    """
+
+    def __init__(self, tokenizer_name: str = None, chars_per_token: float = 4.0):
+        self.tokenizer_name = tokenizer_name
+        self.chars_per_token = chars_per_token
+        self._tokenizer = None
+        self._loaded = tokenizer_name is None
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, token=HF_TOKEN)
+                    except Exception as e:
+                        logger.warning(f"Tokenizer {self.tokenizer_name} unavailable, estimating tokens: {e}")
+                    self._loaded = True
+        return self._tokenizer
+
+    @property
+    def exact(self):
+        return self.tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return int(len(text) / self.chars_per_token + 0.5)
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextBuilder:
+    """
+    Turns a retrieval result into the context string of one model request.
+
+    Documents are taken in order of their distance, near-duplicates (documents whose word trigrams are
+    mostly contained in the already selected ones) are dropped, and the rest is packed greedily into the
+    model's token budget. The user text is never part of the budget and is never shortened.
+    """
+
+    def __init__(self, counters: dict, budgets: dict, input_limits: dict = None, dedup_overlap: float = None):
+        self.counters = counters
+        self.budgets = budgets
+        self.input_limits = input_limits or {}
+        self.dedup_overlap = (dedup_overlap if dedup_overlap is not None
+                              else float(os.environ.get("CONTEXT_DEDUP_OVERLAP", 0.8)))
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retrieved_tokens = 0
+        self.context_tokens = 0
+
+    def budget(self, model, text: str) -> int:
+        """Context budget of the model; models with a hard input limit leave room for the user text."""
+        budget = self.budgets.get(model, 0)
+        limit = self.input_limits.get(model)
+        if limit is not None:
+            budget = min(budget, max(limit - self.counters[model].count(text), 0))
+        return budget
+
+    def build(self, model, text: str, results: dict):
+        """Returns the context string and a report of the tokens retrieved, used and saved."""
+        counter = self.counters[model]
+        documents = (results.get("documents") or [[]])[0] or []
+        distances = (results.get("distances") or [[]])[0] or [0.0] * len(documents)
+        ranked = sorted(zip(distances, documents), key=lambda pair: pair[0])
+
+        budget = self.budget(model, text)
+        selected, seen = [], set()
+        retrieved_tokens = used_tokens = duplicates = 0
+        for _, document in ranked:
+            tokens = counter.count(document)
+            retrieved_tokens += tokens
+            shingles = _shingles(document)
+            if shingles and len(shingles & seen) / len(shingles) >= self.dedup_overlap:
+                duplicates += 1
+                continue
+            if used_tokens + tokens > budget:
+                continue
+            selected.append(document)
+            seen |= shingles
+            used_tokens += tokens
+
+        report = {
+            "documents": len(documents),
+            "used": len(selected),
+            "duplicates": duplicates,
+            "budget": budget,
+            "retrieved_tokens": retrieved_tokens,
+            "context_tokens": used_tokens,
+            "saved_tokens": retrieved_tokens - used_tokens,
+            "exact": counter.exact,
+        }
+        with self._lock:
+            self.requests += 1
+            self.retrieved_tokens += retrieved_tokens
+            self.context_tokens += used_tokens
+        return "\n\n".join(selected), report
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retrieved_tokens": self.retrieved_tokens,
+                "context_tokens": self.context_tokens,
+                "saved_tokens": self.retrieved_tokens - self.context_tokens,
+            }
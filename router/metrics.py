@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# With several uvicorn workers every worker has its own metrics. If METRICS_DIR is set, each worker writes
+# them to <METRICS_DIR>/<pid>.json every METRICS_FLUSH_SECONDS and a scrape adds up the files of all workers.
+# The directory must be emptied when the router starts (docker-compose mounts a tmpfs there).
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+# Upper bounds in seconds; model calls regularly take 10 s and more, so the buckets reach up to two minutes.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+_DISABLED = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self):
+        """The values as JSON-serialisable [labels, value] pairs."""
+        with self._lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, samples):
+        """Adds the samples() of the same metric from another worker."""
+        with self._lock:
+            for labels, value in samples:
+                self.values[tuple(labels)] = self.values.get(tuple(labels), 0.0) + value
+
+    def render(self):
+        with self._lock:
+            samples = sorted(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                                for labels, value in samples]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One count per bucket, then sum; counts are cumulated when rendering.
+                counts = self.values[labels] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[list(labels), list(counts)] for labels, counts in self.values.items()]
+
+    def merge(self, samples):
+        with self._lock:
+            for labels, counts in samples:
+                total = self.values.setdefault(tuple(labels), [0] * len(self.buckets) + [0.0])
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+    def render(self):
+        with self._lock:
+            samples = sorted((labels, list(counts)) for labels, counts in self.values.items())
+        lines = self.header()
+        for labels, counts in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "stage", "start")
+
+    def __init__(self, histogram, stage):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+class _InFlight:
+    __slots__ = ("gauge", "model")
+
+    def __init__(self, gauge, model):
+        self.gauge = gauge
+        self.model = model
+
+    def __enter__(self):
+        self.gauge.inc(self.model)
+
+    def __exit__(self, *exc):
+        self.gauge.dec(self.model)
+        return False
+
+
+class RouterMetrics:
+    """
+    Request metrics of the router in Prometheus text format.
+
+    With METRICS_ENABLED=0 every recording call returns right away and time() hands out a shared
+    no-op context manager, so the instrumented code paths pay one attribute check per call.
+    Cache hit rates and readiness are read from the existing stats() at scrape time instead of being
+    recorded per request.
+
+    With a `directory` the request metrics of all workers sharing it are rendered: counters and histograms
+    of exited workers are kept, so totals never go down, in-flight gauges only count live workers.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, directory: str = METRICS_DIR,
+                 flush_seconds: float = METRICS_FLUSH_SECONDS):
+        self.enabled = enabled
+        self.directory = directory if enabled else None
+        self.flush_seconds = flush_seconds
+        self.pid = os.getpid()
+        self.stage_seconds = Histogram(
+            "router_stage_seconds", "Latency of the request stages in seconds.", ["stage"]
+        )
+        self.model_requests = Counter(
+            "router_model_requests_total", "Requests to the model agents by outcome.", ["model", "outcome"]
+        )
+        self.labels = Counter(
+            "router_classifier_labels_total", "Routing decisions by classifier and label.", ["source", "label"]
+        )
+        self.in_flight = Gauge(
+            "router_backend_in_flight", "Requests currently sent to a model agent.", ["model"]
+        )
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _metrics(self):
+        return (self.stage_seconds, self.model_requests, self.labels, self.in_flight)
+
+    def flush(self):
+        """Writes the metrics of this worker to its file in `directory`."""
+        path = os.path.join(self.directory, f"{self.pid}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({metric.name: metric.samples() for metric in self._metrics()}, f)
+        os.replace(path + ".tmp", path)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {self.directory}: {e}")
+
+    def _collect(self):
+        """The metrics to render: those of this worker, or the sum over all worker files in `directory`."""
+        if not self.directory:
+            return self._metrics()
+        self.flush()
+        total = RouterMetrics(enabled=True, directory=None)
+        for name in sorted(os.listdir(self.directory)):
+            pid, extension = os.path.splitext(name)
+            if extension != ".json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    samples = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping metrics file {name}: {e}")
+                continue
+            for metric in total._metrics():
+                if metric is total.in_flight and not _alive(int(pid)):
+                    continue
+                metric.merge(samples.get(metric.name, []))
+        return total._metrics()
+
+    def time(self, stage: str):
+        """Context manager that records the duration of the block as `stage`."""
+        if not self.enabled:
+            return _DISABLED
+        return _StageTimer(self.stage_seconds, stage)
+
+    def observe(self, stage: str, seconds: float):
+        if self.enabled:
+            self.stage_seconds.observe(seconds, stage)
+
+    def record_request(self, model: str, outcome: str):
+        if self.enabled:
+            self.model_requests.inc(model, outcome)
+
+    def record_label(self, source: str, label: str):
+        if self.enabled:
+            self.labels.inc(source, label or "none")
+
+    def track_in_flight(self, model: str):
+        """Context manager that counts the block as one in-flight request to `model`."""
+        if not self.enabled:
+            return _DISABLED
+        return _InFlight(self.in_flight, model)
+
+    def render(self, caches: dict = None, readiness: dict = None) -> str:
+        """
+        Text exposition of all metrics. `caches` maps a cache name to its stats() and `readiness`
+        is ModelClient.readiness; both are rendered as they are at scrape time.
+        """
+        lines = []
+        for metric in self._collect():
+            lines.extend(metric.render())
+        if caches:
+            lookups = Counter("router_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+            hit_rate = Gauge("router_cache_hit_rate", "Share of cache lookups answered from the cache.", ["cache"])
+            for name, stats in caches.items():
+                for result in ("hits", "neighbour_hits", "similar_hits", "misses", "fallbacks"):
+                    if result in stats:
+                        lookups.inc(name, result, amount=stats[result])
+                hit_rate.set(name, value=stats.get("hit_rate", 0.0))
+            lines.extend(lookups.render() + hit_rate.render())
+        if readiness:
+            ready = Gauge("router_backend_ready", "1 if the model agent reported ready on the last poll.", ["model"])
+            for model, state in readiness.items():
+                ready.set(model, value=1.0 if state and state.get("ready") else 0.0)
+            lines.extend(ready.render())
+        return "\n".join(lines) + "\n"
+
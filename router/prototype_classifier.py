@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("router")
+
+# Example requests per label, taken from the classifier prompt (CLASSIFIER_PREFIX in agent_llama).
+LABEL_EXAMPLES = {
+    "citation": [
+        "Erstelle mir ein Zitat",
+        "Mache ein Zitat zu",
+        "Erstelle mir hieraus ein Zitat im Chicago-Stil",
+        "Ich möchte daraus ein Zitat haben",
+    ],
+    "structure": [
+        "Erstelle mir eine Gliederung hierzu",
+        "Gib mir eine Struktur zu diesem Thema",
+        "Erstelle eine Gliederung zum Thema Delfine",
+        "Gib mir eine Struktur für meine Bachelorarbeit",
+    ],
+    "grammar": [
+        "Verbessere mir diesen Text",
+        "Schreib das schöner",
+        "Verbessere mir das Folgende:",
+        "Bitte schreib das so um, dass es besser klingt",
+    ],
+    "none": [
+        "Wie heißt mein Hund?",
+        "Wie ist das Wetter morgen?",
+        "Wie groß ist die Erde?",
+        "Was ist die Hauptstadt von Frankreich?",
+    ],
+}
+
+
+class PrototypeClassifier:
+    """
+    Fast-path request classifier based on sentence embeddings.
+
+    The query is embedded and compared against the embedded example phrases of every label.
+    The label is only returned if the best label is at least `min_similarity` similar and beats
+    the runner-up by `margin`; otherwise None is returned and the caller falls through to LLaMA.
+    """
+
+    def __init__(self, embedding_model, margin: float = None, min_similarity: float = None):
+        self.embedding_model = embedding_model
+        self.margin = margin if margin is not None else float(os.environ.get("CLASSIFIER_MARGIN", 0.1))
+        self.min_similarity = (min_similarity if min_similarity is not None
+                               else float(os.environ.get("CLASSIFIER_MIN_SIMILARITY", 0.5)))
+        self.labels = list(LABEL_EXAMPLES.keys())
+        self.prototypes = {
+            label: self.embedding_model.encode(examples, normalize_embeddings=True)
+            for label, examples in LABEL_EXAMPLES.items()
+        }
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+        self.fast_path_seconds = 0.0
+        self.fallback_seconds = 0.0
+        logger.debug(f"Prototype classifier initialized with margin {self.margin}")
+
+    def scores(self, text: str):
+        """Returns the cosine similarity of the text to the closest example phrase of every label."""
+        query = self.embedding_model.encode([text], normalize_embeddings=True)[0]
+        return {label: float(np.max(prototypes @ query)) for label, prototypes in self.prototypes.items()}
+
+    def classify(self, text: str):
+        """Returns (label, scores); label is None if the classifier is not confident enough."""
+        start = time.perf_counter()
+        scores = self.scores(text)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best_label, best_score), (_, second_score) = ranked[0], ranked[1]
+        confident = best_score >= self.min_similarity and best_score - second_score >= self.margin
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.fast_path_seconds += elapsed
+            if confident:
+                self.hits += 1
+        if confident:
+            logger.debug(f"Fast-path classification: {best_label} ({best_score:.3f}, "
+                         f"margin {best_score - second_score:.3f}, "
+                         f"saved ~{max(self.average_fallback_seconds() - elapsed, 0.0):.3f}s)")
+            return best_label, scores
+        logger.debug(f"Fast-path classification not confident, falling through: {scores}")
+        return None, scores
+
+    def record_fallback(self, seconds: float):
+        """Records the latency of a classification that had to be answered by LLaMA."""
+        with self._lock:
+            self.fallbacks += 1
+            self.fallback_seconds += seconds
+
+    def average_fallback_seconds(self):
+        return self.fallback_seconds / self.fallbacks if self.fallbacks else 0.0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.fallbacks
+            average_fast = self.fast_path_seconds / total if total else 0.0
+            return {
+                "requests": total,
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": self.hits / total if total else 0.0,
+                "avg_fast_path_seconds": average_fast,
+                "avg_fallback_seconds": self.average_fallback_seconds(),
+                "estimated_seconds_saved": self.hits * max(self.average_fallback_seconds() - average_fast, 0.0),
+            }
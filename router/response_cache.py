@@ -0,0 +1,95 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+from embedding_cache import normalize_text
+from ttl_cache import TTLCache
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Caches complete model answers keyed by (route, whitespace-normalized text, context hash).
+    Case is part of the key, since a grammar correction or a citation depends on it.
+
+    For the routes in `similar_routes` only, an answer for the same route and context is also
+    reused if no entry matches exactly but the query embeddings are at least `similarity` similar.
+    Answers are kept for `ttl` seconds and at most `max_size` answers are stored. Every hit
+    records the generation time it saved.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None, similarity: float = None, similar_routes=()):
+        self.entries = TTLCache(
+            max_size if max_size is not None else int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+            ttl if ttl is not None else float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 6 * 3600)),
+        )
+        self.similarity = (similarity if similarity is not None
+                           else float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.98)))
+        self.similar_routes = set(similar_routes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    def matches_similar(self, route: str) -> bool:
+        """True if near-duplicate queries may be answered from the cache on this route."""
+        return route in self.similar_routes and self.similarity <= 1.0
+
+    def get(self, route: str, text: str, context: str, embedding=None):
+        scope = (route, context_hash(context))
+        entry = self.entries.get((normalize_text(text), scope))
+        similar = False
+        if entry is None and embedding is not None and self.matches_similar(route):
+            unit = self._unit(embedding)
+            best_score, best_entry = -1.0, None
+            for (_, entry_scope), candidate in self.entries.items():
+                if entry_scope != scope or candidate[0] is None:
+                    continue
+                score = float(np.dot(unit, candidate[0]))
+                if score > best_score:
+                    best_score, best_entry = score, candidate
+            if best_score >= self.similarity:
+                entry, similar = best_entry, True
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if similar:
+                self.similar_hits += 1
+            else:
+                self.hits += 1
+            self.saved_seconds += entry[2]
+        return entry[1]
+
+    def set(self, route: str, text: str, context: str, response: dict, seconds: float, embedding=None):
+        unit = self._unit(embedding) if embedding is not None else None
+        self.entries.set((normalize_text(text), (route, context_hash(context))), (unit, response, seconds))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    @staticmethod
+    def _unit(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": (self.hits + self.similar_hits) / total if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "entries": len(self.entries),
+            }
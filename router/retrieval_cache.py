@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import logging
+
+import numpy as np
+
+from embedding_cache import normalize_text
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("router")
+
+
+class RetrievalCache:
+    """
+    Caches retrieval results per query.
+
+    A query is found either by its normalized text or, for near-duplicate phrasings, by an embedding
+    neighbour whose cosine similarity is at least `similarity`. The whole cache is dropped when the
+    corpus version returned by `version_fn` changes; the version is checked at most every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, version_fn=None, max_size: int = None, ttl: float = None,
+                 similarity: float = None, check_interval: float = None):
+        self.version_fn = version_fn
+        self.entries = TTLCache(
+            max_size if max_size is not None else int(os.environ.get("RETRIEVAL_CACHE_SIZE", 1024)),
+            ttl if ttl is not None else float(os.environ.get("RETRIEVAL_CACHE_TTL_SECONDS", 3600)),
+        )
+        self.similarity = (similarity if similarity is not None
+                           else float(os.environ.get("RETRIEVAL_CACHE_SIMILARITY", 0.95)))
+        self.check_interval = (check_interval if check_interval is not None
+                               else float(os.environ.get("RETRIEVAL_CACHE_CHECK_SECONDS", 30)))
+        self._lock = threading.Lock()
+        self.version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.neighbour_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def check_version(self):
+        """Clears the cache if the corpus version changed since the last check."""
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.warning(f"Could not read corpus version: {e}")
+            return
+        with self._lock:
+            changed = self.version is not None and version != self.version
+            self.version = version
+            if changed:
+                self.invalidations += 1
+        if changed:
+            logger.debug(f"Corpus version changed to {version}, clearing retrieval cache.")
+            self.entries.clear()
+
+    @staticmethod
+    def _key(query, scope):
+        return normalize_text(query).lower(), scope
+
+    def get(self, query, embedding, scope):
+        """
+        `scope` holds everything besides the query that determines the result (e.g. top_n and filters);
+        neighbours are only looked up among entries with the same scope.
+        """
+        entry = self.entries.get(self._key(query, scope))
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+        unit = self._unit(embedding)
+        best_score, best_result = -1.0, None
+        for (_, entry_scope), (cached_unit, result) in self.entries.items():
+            if entry_scope != scope:
+                continue
+            score = float(np.dot(unit, cached_unit))
+            if score > best_score:
+                best_score, best_result = score, result
+        with self._lock:
+            if best_score >= self.similarity:
+                self.neighbour_hits += 1
+                return best_result
+            self.misses += 1
+        return None
+
+    def set(self, query, embedding, scope, result):
+        self.entries.set(self._key(query, scope), (self._unit(embedding), result))
+
+    @staticmethod
+    def _unit(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.neighbour_hits + self.misses
+            return {
+                "hits": self.hits,
+                "neighbour_hits": self.neighbour_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.neighbour_hits) / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "corpus_version": self.version,
+            }
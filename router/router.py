@@ -2,70 +2,369 @@ from encodings import undefined
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 from enum import Enum
 import chromadb
 from sentence_transformers import SentenceTransformer
-import requests
+import httpx
 import asyncio
+import json
+import os
 import logging
+import time
 from contextlib import asynccontextmanager
 
+from session_store import create_session_store
+from prototype_classifier import PrototypeClassifier
+from embedding_cache import EmbeddingCache, CachedEmbeddingModel
+from retrieval_cache import RetrievalCache
+from vector_index import VectorIndex
+from context_builder import ContextBuilder, TokenCounter
+from response_cache import ResponseCache
+from metrics import RouterMetrics
+from tracing import tracer
+
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("router")
 
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "/app/data/embedding_cache")
+RETRIEVER_BACKEND = os.environ.get("RETRIEVER_BACKEND", "chroma")  # chroma | numpy
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "/app/data/vector_index")
+RETRIEVAL_TAG_MODE = os.environ.get("RETRIEVAL_TAG_MODE", "filter")  # filter | boost | off
+RETRIEVAL_TAG_BOOST = float(os.environ.get("RETRIEVAL_TAG_BOOST", 0.8))  # distance factor for tagged chunks
+
+DEFAULT_SESSION_ID = "default"
+
+
 class TextRequest(BaseModel):
     text: str
+    session_id: str = DEFAULT_SESSION_ID
+    no_cache: bool = False
 
 
+class ResetRequest(BaseModel):
+    session_id: str = DEFAULT_SESSION_ID
+
+
+# The *_API_URL variables point the router at other agent hosts, e.g. stub_agent.py instances.
 class Model(Enum):
-    LLAMA = "http://llama_api:8000/process/"
-    ZEPHYR = "http://zephyr_api:8000/process/"
-    BLOOM = "http://bloom_api:8000/process/"
-    MISTRAL = "http://mistral_api:8000/process/"
+    LLAMA = os.environ.get("LLAMA_API_URL", "http://llama_api:8000") + "/process/"
+    ZEPHYR = os.environ.get("ZEPHYR_API_URL", "http://zephyr_api:8000") + "/process/"
+    BLOOM = os.environ.get("BLOOM_API_URL", "http://bloom_api:8000") + "/process/"
+    MISTRAL = os.environ.get("MISTRAL_API_URL", "http://mistral_api:8000") + "/process/"
     NONE = "None"
 
 
+LLAMA_CLASSIFY_URL = Model.LLAMA.value.replace("/process/", "/classify/")
+
+# Minimum LLaMA label probability to route directly, and to suggest a model in the backfall.
+ROUTE_PROBABILITY = 0.5
+SUGGEST_PROBABILITY = 0.2
+
+# Per-model read timeouts in seconds; generation on the local 7B models can take minutes.
+MODEL_TIMEOUTS = {
+    Model.LLAMA: 60.0,
+    Model.ZEPHYR: 120.0,
+    Model.BLOOM: 300.0,
+    Model.MISTRAL: 120.0,
+}
+
+# Agents are polled on /ready/ every READY_POLL_SECONDS; requests wait up to READY_WAIT_SECONDS for a loading agent.
+READY_POLL_SECONDS = float(os.environ.get("READY_POLL_SECONDS", 5))
+READY_WAIT_SECONDS = float(os.environ.get("READY_WAIT_SECONDS", 20))
+
+# Maximum number of requests in flight per backend, so one slow model can't exhaust the pool.
+MODEL_CONCURRENCY = {
+    Model.LLAMA: 16,
+    Model.ZEPHYR: 8,
+    Model.BLOOM: 4,
+    Model.MISTRAL: 8,
+}
+
+# Tokenizers used to measure the retrieved context for each model.
+MODEL_TOKENIZERS = {
+    Model.ZEPHYR: "HuggingFaceH4/zephyr-7b-beta",
+    Model.BLOOM: "malteos/bloom-6b4-clp-german",
+    Model.MISTRAL: "mistralai/Mistral-7B-v0.1",
+}
+
+# Maximum number of context tokens per request.
+CONTEXT_TOKEN_BUDGETS = {
+    Model.ZEPHYR: int(os.environ.get("ZEPHYR_CONTEXT_TOKENS", 1024)),
+    Model.BLOOM: int(os.environ.get("BLOOM_CONTEXT_TOKENS", 160)),
+    Model.MISTRAL: int(os.environ.get("MISTRAL_CONTEXT_TOKENS", 1024)),
+}
+
+# Models with a hard input window: context plus user text must stay below this many tokens.
+# BLOOM truncates prompts at 512 tokens, of which the fixed grammar prompt takes roughly 250.
+MODEL_INPUT_LIMITS = {
+    Model.BLOOM: 260,
+}
+
+
+# Maps the classifier labels to the model handling that kind of request.
+LABEL_MODELS = {
+    "citation": Model.ZEPHYR,
+    "structure": Model.MISTRAL,
+    "grammar": Model.BLOOM,
+    "none": Model.NONE,
+}
+
+# Routes whose answers may be reused for near-duplicate queries. Grammar corrections (BLOOM) and
+# citations (ZEPHYR) depend on every word and number of the input, so they only get exact hits.
+RESPONSE_CACHE_SIMILAR_ROUTES = [
+    route for route in os.environ.get("RESPONSE_CACHE_SIMILAR_ROUTES", "MISTRAL").split(",") if route
+]
+
+# Chunk tags (assigned by ChunkProcessor.assign_tags) that each route prefers during retrieval.
+ROUTE_TAGS = {
+    Model.ZEPHYR: "Zitierweise",
+    Model.MISTRAL: "Gliederung",
+}
+
+
 class InputState(Enum):
     REQUEST = 1
     CONFIRM = 2
     CHOOSE_MODEL = 3
 
 
+class Session:
+    """Conversation state of a single chat session."""
+
+    def __init__(self, input_state=InputState.REQUEST, userQuery="", model=Model.NONE):
+        self.input_state = input_state
+        self.userQuery = userQuery
+        self.model = model
+
+    def to_dict(self):
+        return {"input_state": self.input_state.name, "userQuery": self.userQuery, "model": self.model.name}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(InputState[data["input_state"]], data["userQuery"], Model[data["model"]])
+
+
 class NoResposeError(Exception):
     """Raised when no response is received from LLM."""
     pass
 
 
-class Retriever:
-    def __init__(self, collection_name="dhbw_rules"):
+class ModelNotReadyError(Exception):
+    """Raised when a model agent has not reported ready within READY_WAIT_SECONDS."""
+    pass
+
+
+class ChromaBackend:
+    """Retrieves from the collection on the Chroma HTTP server."""
+
+    def __init__(self, collection_name):
         self.client = chromadb.client = chromadb.HttpClient(host="chromadb", port=8000)
+        self.collection_name = collection_name
+        # Queries always pass query_embeddings from the cached embedding model, so the collection needs no
+        # embedding function of its own.
         self.collection = self.client.get_or_create_collection(collection_name)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.debug(f"Retriever initialized with collection: {self.collection.name}")
 
-    def retrieve_relevant_documents(self, query, top_n=5):
+    def query(self, query_embeddings, n_results, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def version(self):
+        """Version written into the collection metadata by the DataLoader after every ingestion run."""
+        metadata = self.client.get_collection(self.collection_name).metadata or {}
+        return metadata.get("corpus_version")
+
+
+class NumpyBackend:
+    """Retrieves in-process from the memory-mapped index the DataLoader exports after every ingestion run."""
+
+    def __init__(self, directory):
+        self.index = VectorIndex(directory)
+
+    def query(self, query_embeddings, n_results, where=None):
+        return self.index.query(query_embeddings, n_results, where)
+
+    def version(self):
+        self.index.reload()
+        return self.index.version
+
+
+class Retriever:
+    def __init__(self, collection_name="dhbw_rules", backend=None):
+        model = SentenceTransformer(EMBEDDING_MODEL)
+        cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, model.get_sentence_embedding_dimension())
+        self.embedding_model = CachedEmbeddingModel(model, cache)
+        backend = backend or RETRIEVER_BACKEND
+        if backend == "numpy":
+            self.backend = NumpyBackend(VECTOR_INDEX_DIR)
+        else:
+            self.backend = ChromaBackend(collection_name)
+        self.cache = RetrievalCache(self.backend.version)
+        logger.debug(f"Retriever initialized with {backend} backend for collection: {collection_name}")
+
+    def embed_queries(self, queries):
+        return self.embedding_model.encode(list(queries))
+
+    def retrieve_many(self, queries, top_n=5, where=None):
+        """
+        Embeds all queries in one model call and retrieves the documents of all uncached queries
+        in one backend query. `where` filters on chunk metadata such as headings and tags.
+        Returns one result per query, shaped like the result of retrieve_relevant_documents.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        self.cache.check_version()
+        scope = (top_n, json.dumps(where, sort_keys=True))
+        embeddings = self.embed_queries(queries)
+        results = [self.cache.get(query, embedding, scope) for query, embedding in zip(queries, embeddings)]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            logger.debug(f"Retrieving documents for {len(missing)} of {len(queries)} queries")
+            response = self.backend.query(embeddings[missing].tolist(), top_n, where)
+            for position, i in enumerate(missing):
+                results[i] = {key: [value[position]] if key != "included" and isinstance(value, list) else value
+                              for key, value in response.items()}
+                self.cache.set(queries[i], embeddings[i], scope, results[i])
+        return results
+
+    def retrieve_for_tag(self, query, tag=None, top_n=5):
+        """
+        Retrieves with a preference for chunks carrying `tag`. In filter mode only tagged chunks are
+        returned (falling back to all chunks if none match); in boost mode the distances of tagged
+        chunks are scaled by RETRIEVAL_TAG_BOOST and a larger candidate set is re-ranked.
+        """
+        if tag is None or RETRIEVAL_TAG_MODE == "off":
+            return self.retrieve_relevant_documents(query, top_n)
+        key = f"tag_{tag}"
+        if RETRIEVAL_TAG_MODE == "filter":
+            results = self.retrieve_relevant_documents(query, top_n, where={key: True})
+            if results["ids"][0]:
+                return results
+            return self.retrieve_relevant_documents(query, top_n)
+
+        results = self.retrieve_relevant_documents(query, top_n * 3)
+        distances = results["distances"][0]
+        metadatas = results["metadatas"][0]
+        order = sorted(
+            range(len(distances)),
+            key=lambda i: distances[i] * (RETRIEVAL_TAG_BOOST if (metadatas[i] or {}).get(key) else 1.0)
+        )[:top_n]
+        return {
+            name: [[value[0][i] for i in order]] if isinstance(value, list) and value and isinstance(value[0], list)
+            else value
+            for name, value in results.items()
+        }
+
+    def retrieve_relevant_documents(self, query, top_n=5, where=None):
         logger.debug(f"Retrieving documents for query: {query}")
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=top_n
-        )
+        results = self.retrieve_many([query], top_n, where)[0]
         logger.debug(f"Retrieved documents: {results}")
         return results
 
 
+class ModelClient:
+    """
+    Shared async HTTP client for all model agents.
+    Connections are pooled and kept alive; each backend gets its own timeout and concurrency limit.
+    """
+
+    def __init__(self, metrics: RouterMetrics):
+        self.metrics = metrics
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(30.0, connect=5.0),
+        )
+        self.semaphores = {model: asyncio.Semaphore(limit) for model, limit in MODEL_CONCURRENCY.items()}
+        self.ready = {model: asyncio.Event() for model in MODEL_CONCURRENCY}
+        self.readiness = {model.name: None for model in MODEL_CONCURRENCY}
+
+    async def check_ready(self, model: Model):
+        url = model.value.replace("/process/", "/ready/")
+        try:
+            response = await self.http.get(url, timeout=httpx.Timeout(5.0))
+            ready = response.status_code == 200
+            detail = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            ready, detail = False, str(e)
+        if ready:
+            self.ready[model].set()
+        else:
+            self.ready[model].clear()
+        self.readiness[model.name] = {"ready": ready, "detail": detail}
+
+    async def watch_readiness(self):
+        """Polls the /ready/ endpoint of every agent until cancelled."""
+        while True:
+            await asyncio.gather(*(self.check_ready(model) for model in self.ready))
+            await asyncio.sleep(READY_POLL_SECONDS)
+
+    def is_ready(self, model: Model) -> bool:
+        return self.ready[model].is_set()
+
+    async def wait_ready(self, model: Model):
+        """Holds the request while the agent is still loading, for at most READY_WAIT_SECONDS."""
+        if self.is_ready(model):
+            return
+        try:
+            await asyncio.wait_for(self.ready[model].wait(), READY_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise ModelNotReadyError(f"{model.name} ist noch nicht bereit.")
+
+    async def post(self, model: Model, payload: dict, url: str = None):
+        timeout = httpx.Timeout(MODEL_TIMEOUTS[model], connect=5.0)
+        with tracer.span(f"call {model.name}", url=url or model.value):
+            await self.wait_ready(model)
+            async with self.semaphores[model]:
+                with self.metrics.track_in_flight(model.name):
+                    response = await self.http.post(url or model.value, json=payload, timeout=timeout,
+                                                    headers=tracer.headers())
+        response.raise_for_status()
+        return response.json()
+
+    async def stream(self, model: Model, payload: dict):
+        """Proxies the server-sent events of the model's /stream/ endpoint line by line."""
+        timeout = httpx.Timeout(MODEL_TIMEOUTS[model], connect=5.0)
+        url = model.value.replace("/process/", "/stream/")
+        await self.wait_ready(model)
+        async with self.semaphores[model]:
+            with self.metrics.track_in_flight(model.name):
+                async with self.http.stream("POST", url, json=payload, timeout=timeout,
+                                            headers=tracer.headers()) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield f"{line}\n\n"
+
+    async def close(self):
+        await self.http.aclose()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.input_state = InputState.REQUEST
-    app.state.userQuery = ""
-    app.state.model = Model.NONE
+    app.state.sessions = create_session_store()
     app.state.retriever = Retriever()
+    app.state.classifier = PrototypeClassifier(app.state.retriever.embedding_model)
+    app.state.metrics = RouterMetrics()
+    app.state.model_client = ModelClient(app.state.metrics)
+    app.state.response_cache = ResponseCache(similar_routes=RESPONSE_CACHE_SIMILAR_ROUTES)
+    readiness_task = asyncio.create_task(app.state.model_client.watch_readiness())
+    app.state.context_builder = ContextBuilder(
+        {model: TokenCounter(name) for model, name in MODEL_TOKENIZERS.items()},
+        CONTEXT_TOKEN_BUDGETS,
+        MODEL_INPUT_LIMITS,
+    )
     logger.debug("State initialized via lifespan.")
     yield
+    readiness_task.cancel()
+    await app.state.model_client.close()
     logger.debug("Shutdown completed.")
 
 
 app = FastAPI(lifespan=lifespan)
+tracer.install(app)
 
 origins = [
     "http://192.168.23.112:3000",
@@ -82,116 +381,152 @@ app.add_middleware(
 forbidden_chars = ['\"', '\'']
 
 
-async def get_model_response(model: Model, text: str, state = None):
+def sse_event(data: dict):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+async def stream_model_response(model: Model, payload: dict):
+    metrics = app.state.metrics
+    trace = tracer.current()
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        async for event in app.state.model_client.stream(model, payload):
+            yield event
+        metrics.record_request(model.name, "ok")
+        metrics.observe("backend_stream", time.perf_counter() - start)
+        tracer.record(f"stream {model.name}", trace, started_at, time.time())
+    except (httpx.HTTPError, ModelNotReadyError) as e:
+        logger.error(f"Error streaming from {model.name}: {e}")
+        metrics.record_request(model.name, "not_ready" if isinstance(e, ModelNotReadyError) else "error")
+        yield sse_event({"error": f"Fehler beim Aufruf von {model.name}: {e}"})
+        yield sse_event({"done": True})
+
+
+async def cached_events(response: dict):
+    yield sse_event({"token": response.get("response", "")})
+    yield sse_event({"done": True})
+
+
+async def caching_events(events, model: Model, text: str, context: str, embedding=None):
+    """Passes the model's events through and caches the streamed answer if it completed without error and is not empty."""
+    start = time.perf_counter()
+    tokens = []
+    failed = False
+    async for event in events:
+        yield event
+        try:
+            data = json.loads(event[len("data: "):]) if event.startswith("data: ") else {}
+        except ValueError:
+            continue
+        if "error" in data:
+            failed = True
+        elif "token" in data:
+            tokens.append(data["token"])
+        elif data.get("done") and not failed and "".join(tokens).strip():
+            app.state.response_cache.set(model.name, text, context, {"response": "".join(tokens)},
+                                         time.perf_counter() - start, embedding)
+
+
+async def get_model_response(model: Model, text: str, retriever: Retriever = None, stream: bool = False,
+                             use_cache: bool = True):
+    """
+    Calls the model with the user text and the retrieved context.
+    With stream=True an async generator of server-sent events is returned instead of the response dict.
+    Answers are served from and stored in the response cache unless use_cache is False.
+    """
+    metrics = app.state.metrics
     try:
-        context = None
-        if state:
-            context = state.retriever.retrieve_relevant_documents(text)
-            logger.debug(f"Retrieved context from chromaDB: {context}")
-            context = " ".join(context)  # Combine documents into a single string
-            logger.debug(f"Context after joining: {context}")
-
-        payload = {"text": text}
-        if context:
-            payload["context"] = context
+        context = ""
+        if retriever:
+            with metrics.time("retrieval"), tracer.span("retrieval"):
+                results = await asyncio.to_thread(retriever.retrieve_for_tag, text, ROUTE_TAGS.get(model))
+            logger.debug(f"Retrieved context from chromaDB: {results}")
+            with metrics.time("context"), tracer.span("context"):
+                context, report = await asyncio.to_thread(app.state.context_builder.build, model, text, results)
+            logger.debug(f"Context assembled for {model.name}: {report}")
+
+        payload = {"text": text, "context": context}
+        response_cache = app.state.response_cache
+        embedding = None
+        if use_cache:
+            with metrics.time("response_cache"), tracer.span("response_cache"):
+                if retriever and response_cache.matches_similar(model.name):
+                    embedding = await asyncio.to_thread(retriever.embedding_model.encode, text)
+                cached = await asyncio.to_thread(response_cache.get, model.name, text, context, embedding)
+            if cached is not None:
+                logger.debug(f"Response cache hit for {model.name}")
+                metrics.record_request(model.name, "cached")
+                return cached_events(cached) if stream else cached
+        else:
+            response_cache.record_bypass()
+
         logger.debug(f"Sending request to {model.name} with payload: {payload}")  # Add payload logging
-        response = requests.post(model.value, json=payload)
-        response.raise_for_status()
-        response_json = response.json()
+        if stream:
+            events = stream_model_response(model, payload)
+            return caching_events(events, model, text, context, embedding) if use_cache else events
+        start = time.perf_counter()
+        response_json = await app.state.model_client.post(model, payload)
+        metrics.observe("backend", time.perf_counter() - start)
+        metrics.record_request(model.name, "ok")
         logger.debug(f"Response from {model.name}: {response_json}")  # Log the response
+        if use_cache and str(response_json.get("response", "")).strip():
+            response_cache.set(model.name, text, context, response_json, time.perf_counter() - start, embedding)
         return response_json
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error calling {model.name}: {e}")
+        metrics.record_request(model.name, "error")
         raise HTTPException(status_code=500, detail=f"Fehler beim Aufruf von {model.name}: {e}")
+    except ModelNotReadyError as e:
+        logger.warning(e)
+        metrics.record_request(model.name, "not_ready")
+        raise HTTPException(status_code=503, detail=f"{e} Bitte versuche es gleich noch einmal.")
 
 
 async def classify_prompt(text: str):
+    """
+    Returns the selected model and, if LLaMA was asked, its label probabilities (otherwise None).
+    """
     relevant_text = text.split(':', 1)[0]
-    prompt = f"""
-        Du agierst als Experte im Management von Benutzeranfragen. 
-        Deine Aufgabe ist es, Benutzeranfragen in exakt eine der folgenden vier Kategorien einzustufen: citation, structure, grammar, none. 
-        Jede Anfrage muss ausschließlich einer Kategorie zugeordnet werden.
-
-        Beachte: Die Anfragen können auf Deutsch formuliert sein.
-        
-        Mögliche Kategorien und deren Kriterien:
-        
-        "citation"
-        Für Anfragen, die sich auf die Erstellung von Zitaten beziehen. Achte besonders auf Wörter wie „Zitat“ sowie Formulierungen wie:
-        
-        „Erstelle mir ein Zitat“
-        
-        „Mache ein Zitat zu“
-        Beispiele:
-        
-        „Erstelle mir hieraus ein Zitat im Chicago-Stil“ → citation
-        
-        „Ich möchte daraus ein Zitat haben“ → citation
-        
-        "structure"
-        Für Anfragen, die den Aufbau oder die Gliederung eines Textes oder Themas betreffen. Achte auf Wörter wie „Gliederung“ oder „Struktur“ und Formulierungen wie:
-        
-        „Erstelle mir eine Gliederung hierzu“
-        
-        „Gib mir eine Struktur zu diesem Thema“
-        Beispiele:
-        
-        „Erstelle eine Gliederung zum Thema Delfine“ → structure
-        
-        „Gib mir eine Struktur für meine Bachelorarbeit“ → structure
-        
-        "grammar"
-        Für Anfragen, bei denen es um die grammatikalische Verbesserung oder stilistische Überarbeitung eines Textes geht. Achte auf Phrasen wie:
-        
-        „Verbessere mir diesen Text“
-        
-        „Schreib das schöner“
-        Beispiele:
-        
-        „Verbessere mir das Folgende:“ → grammar
-        
-        „Bitte schreib das so um, dass es besser klingt“ → grammar
-        
-        "none"
-        Für Anfragen, die keinen Bezug zu den oben genannten Kategorien oder zur Erstellung wissenschaftlicher Texte haben. Auch wenn nicht klar ist, welche Kategorie zutrifft, solltest du „none“ wählen.
-        Beispiele:
-        
-        „Wie heißt mein Hund?“ → none
-        
-        „Wie ist das Wetter morgen?“ → none
-        
-        „Wie groß ist die Erde?“ → none
-        
-        „Was ist die Hauptstadt von Frankreich?“ → none
-        
-        Wichtige Anweisung:
-        Antworte ausschließlich mit dem Namen der Kategorie! Deine Antwort darf nur eine der folgenden Optionen enthalten:
-        
-        citation
-        
-        structure
-        
-        grammar
-        
-        none
-        
-        Benutzeranfrage:
-        "{relevant_text}"
-        """
-    logger.debug(f"Classifying prompt: {prompt}")
-    response_list = await asyncio.gather(get_model_response(Model.LLAMA, prompt))
-    response = response_list[0]
+    classifier = app.state.classifier
+    metrics = app.state.metrics
+    with metrics.time("classify_prototype"), tracer.span("classify_prototype"):
+        label, _ = await asyncio.to_thread(classifier.classify, relevant_text)
+    if label:
+        metrics.record_label("prototype", label)
+        return LABEL_MODELS[label], None
+    if not app.state.model_client.is_ready(Model.LLAMA):
+        # While LLaMA is loading, the keyword heuristics of handle_backfall suggest the model instead.
+        logger.debug("LLaMA not ready, falling back to keyword classification.")
+        return Model.NONE, None
+    start = time.perf_counter()
+    logger.debug(f"Classifying prompt with llama: {relevant_text}")
+    try:
+        response = await app.state.model_client.post(Model.LLAMA, {"text": relevant_text}, url=LLAMA_CLASSIFY_URL)
+    except httpx.HTTPError as e:
+        logger.error(f"Error calling {Model.LLAMA.name}: {e}")
+        metrics.record_request(Model.LLAMA.name, "error")
+        raise HTTPException(status_code=500, detail=f"Fehler beim Aufruf von {Model.LLAMA.name}: {e}")
     classification = response.get("response")
-    logger.debug(f"llama-Response for classification: {classification}")
-    if classification == "citation":
-        return Model.ZEPHYR
-    elif classification == "structure":
-        return Model.MISTRAL
-    elif classification == "grammar":
-        return Model.BLOOM
-    elif classification == "none":
+    probabilities = response.get("probabilities", {})
+    classifier.record_fallback(time.perf_counter() - start)
+    metrics.observe("classify_llama", time.perf_counter() - start)
+    metrics.record_request(Model.LLAMA.name, "ok")
+    metrics.record_label("llama", classification)
+    logger.debug(f"llama-Response for classification: {classification} {probabilities}")
+    logger.debug(f"Classifier stats: {classifier.stats()}")
+    if probabilities.get(classification, 0.0) < ROUTE_PROBABILITY:
+        return Model.NONE, probabilities
+    return LABEL_MODELS.get(classification, Model.NONE), probabilities
+
+
+def suggest_model(probabilities: dict):
+    """Returns the most probable model other than NONE, if LLaMA gave it at least SUGGEST_PROBABILITY."""
+    candidates = {label: p for label, p in probabilities.items() if LABEL_MODELS.get(label, Model.NONE) != Model.NONE}
+    if not candidates:
         return Model.NONE
-    return Model.NONE
+    label = max(candidates, key=candidates.get)
+    return LABEL_MODELS[label] if candidates[label] >= SUGGEST_PROBABILITY else Model.NONE
 
 
 async def classify_prompt_backfall(text: str):
@@ -212,10 +547,15 @@ async def classify_prompt_backfall(text: str):
     return Model.NONE
 
 
-async def handle_backfall(text: str, state):
+async def handle_backfall(text: str, session: Session, probabilities: dict = None):
     logger.debug(f"Handling backfall for text: {text}")
-    model_list = await asyncio.gather(classify_prompt_backfall(text))
-    model = model_list[0]
+    if probabilities:
+        model = suggest_model(probabilities)
+    else:
+        with app.state.metrics.time("backfall"), tracer.span("backfall"):
+            model_list = await asyncio.gather(classify_prompt_backfall(text))
+        model = model_list[0]
+        app.state.metrics.record_label("keywords", model.name.lower())
     subject = ""
     if model == Model.ZEPHYR:
         subject = "Zitat"
@@ -224,40 +564,40 @@ async def handle_backfall(text: str, state):
     elif model == Model.BLOOM:
         subject = "Formulierung und Grammatik"
     result = "Kein passendes Modell gefunden"
-    state.userQuery = text
-    state.model = model
+    session.userQuery = text
+    session.model = model
     if subject:
         result += f"\nGeht es in deiner Anfrage um folgendes: {subject} (Bestätige mit ja oder nein)"
-        state.input_state = InputState.CONFIRM
+        session.input_state = InputState.CONFIRM
     else:
         result += "\nBitte gib die Art deiner Anfrage manuell ein (1 = zitat, 2 = gliederung, 3 = formulierung, 4 = nichts davon)"
-        state.input_state = InputState.CHOOSE_MODEL
+        session.input_state = InputState.CHOOSE_MODEL
     logger.debug(f"Backfall result: {result}")
     return {"response": result}
 
 
-async def handle_request_state(text: str, state):
+async def handle_request_state(text: str, session: Session, retriever: Retriever, stream: bool = False, use_cache: bool = True):
     logger.debug(f"Handling request state for text: {text}")
     model_list = await asyncio.gather(classify_prompt(text))
-    model = model_list[0]
+    model, probabilities = model_list[0]
     logger.debug(f"Model selected: {model}")
     if model in [Model.ZEPHYR, Model.MISTRAL, Model.BLOOM]:
-        result_list = await asyncio.gather(get_model_response(model, text, state))  # Pass context to LLM
+        result_list = await asyncio.gather(get_model_response(model, text, retriever, stream, use_cache))  # Pass context to LLM
     elif model in [Model.NONE]:
-        result_list = await asyncio.gather(handle_backfall(text, state))
+        result_list = await asyncio.gather(handle_backfall(text, session, probabilities))
     else:
         raise NoResposeError("No response from llama")
     return result_list[0]
 
 
-async def handle_confirm_state(text: str, state):
-    logger.debug(f"Handling confirm state for text: {text} with model: {state.model}")
+async def handle_confirm_state(text: str, session: Session, retriever: Retriever, stream: bool = False, use_cache: bool = True):
+    logger.debug(f"Handling confirm state for text: {text} with model: {session.model}")
     if text.lower() in ["ja", "yes", "j", "y"]:
-        result_list = await asyncio.gather(get_model_response(state.model, state.userQuery, state))
-        state.input_state = InputState.REQUEST
+        result_list = await asyncio.gather(get_model_response(session.model, session.userQuery, retriever, stream, use_cache))
+        session.input_state = InputState.REQUEST
         return result_list[0]
     elif text.lower() in ["nein", "no", "n"]:
-        state.input_state = InputState.CHOOSE_MODEL
+        session.input_state = InputState.CHOOSE_MODEL
         result = "Bitte gib die Art deiner Anfrage manuell ein (1 = zitat, 2 = gliederung, 3 = formulierung, 4 = nichts davon)"
         return {"response": result}
     else:
@@ -265,23 +605,23 @@ async def handle_confirm_state(text: str, state):
         return {"response": result}
 
 
-async def handle_choose_model_state(text: str, state):
+async def handle_choose_model_state(text: str, session: Session, retriever: Retriever, stream: bool = False, use_cache: bool = True):
     logger.debug(f"Handling choose model state for text: {text}")
     if text.lower() in ["zitat", "z", "1"]:
-        result_list = await asyncio.gather(get_model_response(Model.ZEPHYR, state.userQuery, state))
-        state.input_state = InputState.REQUEST
+        result_list = await asyncio.gather(get_model_response(Model.ZEPHYR, session.userQuery, retriever, stream, use_cache))
+        session.input_state = InputState.REQUEST
         return result_list[0]
     if text.lower() in ["gliederung", "g", "2"]:
-        result_list = await asyncio.gather(get_model_response(Model.MISTRAL, state.userQuery, state))
-        state.input_state = InputState.REQUEST
+        result_list = await asyncio.gather(get_model_response(Model.MISTRAL, session.userQuery, retriever, stream, use_cache))
+        session.input_state = InputState.REQUEST
         return result_list[0]
     if text.lower() in ["formulierung", "f", "3"]:
-        result_list = await asyncio.gather(get_model_response(Model.BLOOM, state.userQuery, state))
-        state.input_state = InputState.REQUEST
+        result_list = await asyncio.gather(get_model_response(Model.BLOOM, session.userQuery, retriever, stream, use_cache))
+        session.input_state = InputState.REQUEST
         return result_list[0]
     if text.lower() in ["nichts davon", "n", "4"]:
         result = "Es sieht so aus als wäre unser KI-Assistent nicht auf deine Anfrage ausgelegt."
-        state.input_state = InputState.REQUEST
+        session.input_state = InputState.REQUEST
         return {"response": result}
     else:
         result = "Bitte gib eine sinnvolle Antwort ein. Möglich sind 1 = zitat, 2 = gliederung, 3 = formulierung, 4 = nichts davon"
@@ -289,30 +629,92 @@ async def handle_choose_model_state(text: str, state):
 
 
 @app.post("/reset/")
-async def reset_state(request: Request):
-    request.app.state.input_state = InputState.REQUEST
+async def reset_state(request: Request, req: Optional[ResetRequest] = None):
+    session_id = req.session_id if req else DEFAULT_SESSION_ID
+    await request.app.state.sessions.adelete(session_id)
     return {"response": "Input state has been reset to REQUEST."}
 
 
+async def run_state_machine(request: Request, req: TextRequest, stream: bool = False):
+    text = req.text
+    trace = tracer.current()
+    logger.info(f"Processing user request{f' (trace {trace.trace_id})' if trace else ''}: {text}")
+    for char in forbidden_chars:
+        text = text.replace(char, "")
+    sessions = request.app.state.sessions
+    retriever = request.app.state.retriever
+    use_cache = not req.no_cache
+    data = await sessions.aload(req.session_id)
+    session = Session.from_dict(data) if data else Session()
+    # Streamed answers are still being generated when this returns; their model time is in "backend_stream".
+    with request.app.state.metrics.time(f"total_{session.input_state.name.lower()}"):
+        if session.input_state == InputState.REQUEST:
+            result_list = await asyncio.gather(handle_request_state(text, session, retriever, stream, use_cache))
+        elif session.input_state == InputState.CONFIRM:
+            result_list = await asyncio.gather(handle_confirm_state(text, session, retriever, stream, use_cache))
+        elif session.input_state == InputState.CHOOSE_MODEL:
+            result_list = await asyncio.gather(handle_choose_model_state(text, session, retriever, stream, use_cache))
+    await sessions.asave(req.session_id, session.to_dict())
+    return result_list[0]
+
+
+@app.get("/metrics/")
+async def metrics(request: Request):
+    retriever = request.app.state.retriever
+    return {
+        "classifier": request.app.state.classifier.stats(),
+        "embedding_cache": retriever.embedding_model.cache.stats(),
+        "retrieval_cache": retriever.cache.stats(),
+        "context": request.app.state.context_builder.stats(),
+        "response_cache": request.app.state.response_cache.stats(),
+        "readiness": request.app.state.model_client.readiness,
+    }
+
+
+@app.get("/metrics/prometheus/", response_class=PlainTextResponse)
+async def metrics_prometheus(request: Request):
+    """The router metrics in Prometheus text format (METRICS_ENABLED=0 leaves only caches and readiness)."""
+    retriever = request.app.state.retriever
+    caches = {
+        "classifier": request.app.state.classifier.stats(),
+        "embedding": retriever.embedding_model.cache.stats(),
+        "retrieval": retriever.cache.stats(),
+        "response": request.app.state.response_cache.stats(),
+    }
+    body = request.app.state.metrics.render(caches, request.app.state.model_client.readiness)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.post("/process/")
 async def process_text(request: Request, req: TextRequest):
     try:
         text = req.text
         if text is None or text is undefined:
             return {"error": "No text provided"}
-        logger.info(f"Processing user request: {text}")
-        for char in forbidden_chars:
-            text = text.replace(char, "")
-        state = request.app.state
-        if state.input_state == InputState.REQUEST:
-            result_list = await asyncio.gather(handle_request_state(text, state))
-            return result_list[0]
-        elif state.input_state == InputState.CONFIRM:
-            result_list = await asyncio.gather(handle_confirm_state(text, state))
-            return result_list[0]
-        elif state.input_state == InputState.CHOOSE_MODEL:
-            result_list = await asyncio.gather(handle_choose_model_state(text, state))
-            return result_list[0]
+        return await run_state_machine(request, req)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Error while connecting: {e}")
+
+
+@app.post("/process/stream/")
+async def process_text_stream(request: Request, req: TextRequest):
+    """
+    Same as /process/, but answers with server-sent events.
+    Model responses are proxied token by token; fixed router messages are sent as a single token.
+    """
+    try:
+        result = await run_state_machine(request, req, stream=True)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(e)
-        raise HTTPException(status_code=500, detail=f"Error while connecting: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error while connecting: {e}")
+    if isinstance(result, dict):
+        async def single_event():
+            yield sse_event({"token": result.get("response", "")})
+            yield sse_event({"done": True})
+        return StreamingResponse(single_event(), media_type="text/event-stream")
+    return StreamingResponse(result, media_type="text/event-stream")
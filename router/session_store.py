@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("router")
+
+
+class SessionStore:
+    """
+    Key-value store for per-session conversation state.
+    Values are plain JSON-serializable dicts, so every backend can persist them the same way.
+    The router calls the async variants; backends that do blocking I/O run them off the event loop.
+    """
+
+    def load(self, session_id: str):
+        raise NotImplementedError
+
+    def save(self, session_id: str, data: dict):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def aload(self, session_id: str):
+        return self.load(session_id)
+
+    async def asave(self, session_id: str, data: dict):
+        self.save(session_id, data)
+
+    async def adelete(self, session_id: str):
+        self.delete(session_id)
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    In-process LRU backend. Only valid while the router runs as a single worker process.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600.0):
+        self.cache = TTLCache(max_size=max_sessions, ttl=ttl)
+
+    def load(self, session_id: str):
+        data = self.cache.get(session_id)
+        return dict(data) if data is not None else None
+
+    def save(self, session_id: str, data: dict):
+        self.cache.set(session_id, dict(data))
+
+    def delete(self, session_id: str):
+        self.cache.pop(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Shared backend on a SQLite file, so several uvicorn workers see the same sessions.
+    Expired sessions and sessions beyond `max_sessions` (oldest first) are pruned on write.
+    """
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl: float = 3600.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str):
+        row = self._connection().execute(
+            "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if time.time() - updated_at > self.ttl:
+            self.delete(session_id)
+            return None
+        return json.loads(data)
+
+    def save(self, session_id: str, data: dict):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (session_id, json.dumps(data), now)
+        )
+        conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        )
+
+    def delete(self, session_id: str):
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    # Queries can wait up to 5 s for the write lock of another worker, so they run in a worker thread
+    # (with its own connection, see _connection) instead of blocking the event loop.
+    async def aload(self, session_id: str):
+        return await asyncio.to_thread(self.load, session_id)
+
+    async def asave(self, session_id: str, data: dict):
+        await asyncio.to_thread(self.save, session_id, data)
+
+    async def adelete(self, session_id: str):
+        await asyncio.to_thread(self.delete, session_id)
+
+
+def create_session_store():
+    """
+    Builds the session store configured via environment variables:
+      SESSION_STORE        "memory" (default) or "sqlite"
+      SESSION_DB_PATH      SQLite file shared by all workers (sqlite backend only)
+      SESSION_TTL_SECONDS  idle time after which a session is dropped
+      SESSION_MAX          maximum number of stored sessions
+    """
+    backend = os.environ.get("SESSION_STORE", "memory").lower()
+    ttl = float(os.environ.get("SESSION_TTL_SECONDS", 3600))
+    max_sessions = int(os.environ.get("SESSION_MAX", 10000))
+    if backend == "sqlite":
+        path = os.environ.get("SESSION_DB_PATH", "/tmp/router_sessions.db")
+        logger.debug(f"Using SQLite session store at {path}")
+        return SQLiteSessionStore(path, max_sessions=max_sessions, ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
+    logger.debug("Using in-memory session store")
+    return InMemorySessionStore(max_sessions=max_sessions, ttl=ttl)
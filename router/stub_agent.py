@@ -0,0 +1,87 @@
+"""
+Stand-in for the model agents, to run the router and its tracing without models or GPUs:
+
+    TRACE_DIR=./traces TRACE_SERVICE=stub_llama STUB_LABEL=structure uvicorn stub_agent:app --port 8101
+    TRACE_DIR=./traces TRACE_SERVICE=stub_mistral STUB_DECODE_SECONDS=2 uvicorn stub_agent:app --port 8102
+    TRACE_DIR=./traces TRACE_SERVICE=router LLAMA_API_URL=http://localhost:8101 \
+        MISTRAL_API_URL=http://localhost:8102 uvicorn router:app --port 8080
+    python trace_report.py traces/*.jsonl
+
+Every stub needs its own port, because the router tells the models apart by their URL.
+The stub sleeps through the queue, tokenize, prefill and decode stages and records them as spans
+the way the real agents do, so the report shows which hop a slow request spent its time in.
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from tracing import tracer
+
+LABELS = ["citation", "structure", "grammar", "none"]
+STUB_LABEL = os.environ.get("STUB_LABEL", "none")
+STUB_RESPONSE = os.environ.get("STUB_RESPONSE", "Antwort des Stub-Agenten.")
+STAGE_SECONDS = {
+    "queue": float(os.environ.get("STUB_QUEUE_SECONDS", 0.01)),
+    "tokenize": float(os.environ.get("STUB_TOKENIZE_SECONDS", 0.005)),
+    "prefill": float(os.environ.get("STUB_PREFILL_SECONDS", 0.1)),
+    "decode": float(os.environ.get("STUB_DECODE_SECONDS", 0.5)),
+}
+
+app = FastAPI()
+tracer.install(app)
+
+
+class TextInput(BaseModel):
+    text: str
+    context: str = ""
+
+
+async def run_stages(stages=("queue", "tokenize", "prefill", "decode")):
+    for stage in stages:
+        with tracer.span(stage, stub=True):
+            await asyncio.sleep(STAGE_SECONDS[stage])
+
+
+@app.get("/health/")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready/")
+async def ready():
+    return {"ready": True, "stage": "ready"}
+
+
+@app.post("/process/")
+async def process(input: TextInput):
+    await run_stages()
+    return {"response": STUB_RESPONSE}
+
+
+@app.post("/classify/")
+async def classify(input: TextInput):
+    await run_stages(("queue", "tokenize", "prefill"))
+    probabilities = {label: 1.0 if label == STUB_LABEL else 0.0 for label in LABELS}
+    return {"response": STUB_LABEL, "probabilities": probabilities}
+
+
+@app.post("/stream/")
+async def stream(input: TextInput):
+    await run_stages(("queue", "tokenize", "prefill"))
+    trace = tracer.current()
+    words = STUB_RESPONSE.split()
+
+    async def events():
+        start = time.time()
+        for word in words:
+            await asyncio.sleep(STAGE_SECONDS["decode"] / max(len(words), 1))
+            yield f"data: {json.dumps({'token': word + ' '})}\n\n"
+        tracer.record("decode", trace, start, time.time(), stub=True)
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,45 @@
+"""
+Token-budget packing and near-duplicate removal of the ContextBuilder. Tokens are counted per character, so
+the budgets below are plain string lengths. Run with `python -m pytest` from this directory.
+"""
+from context_builder import ContextBuilder, TokenCounter
+
+APA = "Zitate werden nach APA belegt."                                       # 30 tokens
+LONG = "Die Gliederung folgt dem Schema Einleitung, Hauptteil und Schluss."  # 66 tokens
+SHORT = "Seitenzahlen sind Pflicht."                                         # 26 tokens
+
+
+def results(*pairs):
+    return {"documents": [[document for document, _ in pairs]], "distances": [[distance for _, distance in pairs]]}
+
+
+def builder(budget, input_limit=None):
+    limits = {"MISTRAL": input_limit} if input_limit is not None else {}
+    return ContextBuilder({"MISTRAL": TokenCounter(chars_per_token=1)}, {"MISTRAL": budget}, limits)
+
+
+def test_documents_are_packed_by_distance_into_the_budget():
+    context, report = builder(60).build("MISTRAL", "Frage", results((SHORT, 0.3), (LONG, 0.2), (APA, 0.1)))
+    # LONG would exceed the budget after APA, the farther SHORT still fits.
+    assert context == f"{APA}\n\n{SHORT}"
+    assert (report["used"], report["context_tokens"], report["retrieved_tokens"]) == (2, 56, 122)
+    assert report["saved_tokens"] == 66 and not report["exact"]
+
+
+def test_near_duplicates_are_dropped_before_packing():
+    duplicate = APA.replace("belegt", "belegt!")
+    context, report = builder(200).build("MISTRAL", "Frage", results((APA, 0.1), (duplicate, 0.2), (SHORT, 0.3)))
+    assert context == f"{APA}\n\n{SHORT}"
+    assert report["duplicates"] == 1
+
+
+def test_input_limit_leaves_room_for_the_user_text():
+    text = "x" * 40
+    context_builder = builder(200, input_limit=70)
+    assert context_builder.budget("MISTRAL", text) == 30
+    context, report = context_builder.build("MISTRAL", text, results((LONG, 0.1), (APA, 0.2)))
+    assert context == APA
+    assert report["budget"] == 30
+    # A text longer than the limit leaves no context at all instead of a negative budget.
+    assert context_builder.build("MISTRAL", "x" * 100, results((APA, 0.1)))[0] == ""
+    assert context_builder.stats()["requests"] == 2
@@ -0,0 +1,58 @@
+"""
+Slot reuse, LRU eviction and persistence of the memory-mapped EmbeddingCache. embedding_cache.py is shared
+with the DataLoader (chromaDB/), so this covers both copies. Run with `python -m pytest` from this directory.
+"""
+import numpy as np
+
+from embedding_cache import EmbeddingCache, text_key
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def vector(value):
+    return np.full(3, value, dtype=np.float32)
+
+
+def slots(cache):
+    return dict(cache._connection().execute("SELECT key, slot FROM entries").fetchall())
+
+
+def test_full_cache_evicts_least_recently_used_and_reuses_its_slot(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), MODEL, dim=3, max_entries=2)
+    cache.put_many(["Quelle", "Seite"], [vector(1), vector(2)])
+    seite_slot = slots(cache)[text_key("Seite")]
+    assert cache.get_many(["Quelle"])[0] is not None  # "Seite" is now the least recently used entry
+
+    cache.put_many(["Autor"], [vector(3)])
+    assert slots(cache) == {text_key("Quelle"): 1 - seite_slot, text_key("Autor"): seite_slot}
+    quelle, seite, autor = cache.get_many(["Quelle", "Seite", "Autor"])
+    assert seite is None
+    np.testing.assert_array_equal(quelle, vector(1))
+    np.testing.assert_array_equal(autor, vector(3))
+    assert bytes(cache.keys[seite_slot]) == text_key("Autor")
+
+
+def test_encode_only_computes_missing_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), MODEL, dim=3)
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return [vector(len(text)) for text in texts]
+
+    cache.encode(["Quelle"], encode)
+    result = cache.encode(["Quelle", "Seite", "  Seite "], encode)
+    # Texts that only differ in whitespace share one entry.
+    assert calls == [["Quelle"], ["Seite"]]
+    np.testing.assert_array_equal(result, np.stack([vector(6), vector(5), vector(5)]))
+    assert cache.stats()["entries"] == 2
+
+
+def test_index_and_vectors_persist_across_instances(tmp_path):
+    EmbeddingCache(str(tmp_path), MODEL, dim=3, max_entries=4).put_many(["Quelle"], [vector(1)])
+
+    reopened = EmbeddingCache(str(tmp_path), MODEL, dim=3, max_entries=4)
+    np.testing.assert_array_equal(reopened.get_many(["Quelle"])[0], vector(1))
+    # Another model gets its own directory, another size invalidates the stored slots.
+    assert EmbeddingCache(str(tmp_path), "other-model", dim=3, max_entries=4).get_many(["Quelle"]) == [None]
+    assert EmbeddingCache(str(tmp_path), MODEL, dim=3, max_entries=8).get_many(["Quelle"]) == [None]
@@ -0,0 +1,63 @@
+"""
+Load test for the router's fan-out to the agents: concurrent /process/ calls against stub_agent.py must
+overlap instead of waiting for each other. Router and stub run in-process over ASGI transports, so no
+ports or models are needed; run with `python -m pytest test_load.py -s` from this directory.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+import router
+import stub_agent
+from metrics import RouterMetrics
+from response_cache import ResponseCache
+from session_store import InMemorySessionStore
+from test_router import FixedClassifier
+
+REQUESTS = int(os.environ.get("LOAD_TEST_REQUESTS", 16))
+DECODE_SECONDS = 0.3
+
+
+async def fan_out(requests):
+    state = router.app.state
+    state.sessions = InMemorySessionStore()
+    state.retriever = None
+    state.classifier = FixedClassifier("grammar")
+    state.metrics = RouterMetrics()
+    state.model_client = router.ModelClient(state.metrics)
+    state.response_cache = ResponseCache()
+    # The agent calls go to the stub app instead of the network; every agent counts as ready.
+    await state.model_client.http.aclose()
+    state.model_client.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_agent.app),
+                                                base_url="http://stub")
+    for event in state.model_client.ready.values():
+        event.set()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=router.app), base_url="http://router") as client:
+        async def call(i):
+            start = time.perf_counter()
+            response = await client.post("/process/", json={"text": f"Verbessere: Satz {i}", "session_id": f"load-{i}",
+                                                            "no_cache": True})
+            assert response.status_code == 200, response.text
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(call(i) for i in range(requests)))
+        wall = time.perf_counter() - start
+    await state.model_client.close()
+    return wall, latencies
+
+
+def test_concurrent_requests_overlap(monkeypatch):
+    monkeypatch.setitem(stub_agent.STAGE_SECONDS, "decode", DECODE_SECONDS)
+    wall, latencies = asyncio.run(fan_out(REQUESTS))
+    single = sum(stub_agent.STAGE_SECONDS.values())
+    limit = router.MODEL_CONCURRENCY[router.Model.BLOOM]
+    print(f"\n{REQUESTS} requests: wall {wall:.2f}s, sum of latencies {sum(latencies):.2f}s, "
+          f"serialized would take {REQUESTS * single:.2f}s")
+    # BLOOM admits MODEL_CONCURRENCY requests at a time, so the calls finish in ceil(N / limit) waves.
+    waves = -(-REQUESTS // limit)
+    assert wall < waves * single + 1.0
+    assert wall < REQUESTS * single / 2
@@ -0,0 +1,50 @@
+"""
+Prometheus text exposition of RouterMetrics, for one worker and summed over the worker files in METRICS_DIR.
+Run with `python -m pytest` from this directory.
+"""
+import subprocess
+import sys
+
+from metrics import RouterMetrics
+
+
+def record(metrics, seconds=0.3):
+    metrics.observe("retrieval", seconds)
+    metrics.record_request("MISTRAL", "ok")
+    metrics.record_label("prototype", 'Zitier"weise')
+    metrics.in_flight.inc("MISTRAL")
+
+
+def test_render_exposition_format():
+    metrics = RouterMetrics(enabled=True, directory=None)
+    record(metrics)
+    lines = metrics.render({"response": {"hits": 3, "misses": 1, "hit_rate": 0.75}}, {"MISTRAL": {"ready": True}})
+    lines = lines.splitlines()
+
+    assert "# TYPE router_stage_seconds histogram" in lines
+    assert 'router_stage_seconds_bucket{stage="retrieval",le="0.25"} 0' in lines
+    assert 'router_stage_seconds_bucket{stage="retrieval",le="0.5"} 1' in lines
+    assert 'router_stage_seconds_bucket{stage="retrieval",le="+Inf"} 1' in lines
+    assert 'router_stage_seconds_count{stage="retrieval"} 1' in lines
+    assert "# TYPE router_model_requests_total counter" in lines
+    assert 'router_model_requests_total{model="MISTRAL",outcome="ok"} 1.0' in lines
+    assert 'router_classifier_labels_total{source="prototype",label="Zitier\\"weise"} 1.0' in lines
+    assert 'router_cache_lookups_total{cache="response",result="hits"} 3.0' in lines
+    assert 'router_cache_hit_rate{cache="response"} 0.75' in lines
+    assert 'router_backend_ready{model="MISTRAL"} 1.0' in lines
+
+
+def test_render_sums_the_workers_sharing_a_directory(tmp_path):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    workers = [RouterMetrics(enabled=True, directory=str(tmp_path), flush_seconds=3600) for _ in range(2)]
+    workers[1].pid = int(exited.stdout)
+    for worker in workers:
+        record(worker)
+    workers[1].flush()
+
+    lines = workers[0].render().splitlines()
+    assert 'router_stage_seconds_count{stage="retrieval"} 2' in lines
+    assert 'router_model_requests_total{model="MISTRAL",outcome="ok"} 2.0' in lines
+    # The second worker has exited: its requests still count, its in-flight gauge does not.
+    assert 'router_backend_in_flight{model="MISTRAL"} 1.0' in lines
@@ -0,0 +1,72 @@
+"""
+Thresholds of the prototype classifier, with an embedding model that maps every example phrase of a label to
+that label's axis. Run with `python -m pytest` from this directory.
+"""
+import numpy as np
+import pytest
+
+from prototype_classifier import LABEL_EXAMPLES, PrototypeClassifier
+
+AXES = {label: i for i, label in enumerate(LABEL_EXAMPLES)}
+
+
+class AxisEmbeddingModel:
+    """Example phrases lie on the axis of their label; queries are looked up in `queries`."""
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def encode(self, texts, normalize_embeddings=False):
+        vectors = []
+        for text in texts:
+            if text in self.queries:
+                vector = np.asarray(self.queries[text], dtype=np.float32)
+            else:
+                label = next(label for label, examples in LABEL_EXAMPLES.items() if text in examples)
+                vector = np.eye(len(AXES), dtype=np.float32)[AXES[label]]
+            vectors.append(vector / np.linalg.norm(vector) if normalize_embeddings else vector)
+        return np.stack(vectors)
+
+
+@pytest.fixture
+def classifier():
+    queries = {
+        "Zitiere das": [1.0, 0.1, 0.0, 0.0],
+        "Zitat oder Gliederung?": [1.0, 0.95, 0.0, 0.0],
+    }
+    return PrototypeClassifier(AxisEmbeddingModel(queries), margin=0.1, min_similarity=0.5)
+
+
+def test_confident_label_is_returned(classifier):
+    label, scores = classifier.classify("Zitiere das")
+    assert label == "citation"
+    assert scores["citation"] > scores["structure"]
+    assert classifier.stats()["hits"] == 1
+
+
+def test_close_runner_up_falls_through(classifier):
+    label, scores = classifier.classify("Zitat oder Gliederung?")
+    assert label is None
+    assert scores["citation"] - scores["structure"] < classifier.margin
+    assert classifier.stats()["hits"] == 0
+
+
+def test_low_similarity_falls_through():
+    model = AxisEmbeddingModel({"Hallo": [0.4, 0.0, 0.0, 0.0, 1.0]})
+    # A fifth dimension no label uses: the best label scores only ~0.37 although it clearly leads.
+    for label in AXES:
+        model.queries.update({example: np.eye(5)[AXES[label]] for example in LABEL_EXAMPLES[label]})
+    classifier = PrototypeClassifier(model, margin=0.1, min_similarity=0.5)
+    label, scores = classifier.classify("Hallo")
+    assert label is None
+    assert scores["citation"] - scores["structure"] >= classifier.margin
+    assert max(scores.values()) < classifier.min_similarity
+
+
+def test_fallbacks_are_counted_in_stats(classifier):
+    classifier.classify("Zitiere das")
+    classifier.record_fallback(2.0)
+    stats = classifier.stats()
+    assert (stats["requests"], stats["hits"], stats["fallbacks"]) == (2, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["avg_fallback_seconds"] == 2.0
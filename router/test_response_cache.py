@@ -0,0 +1,21 @@
+import numpy as np
+
+from response_cache import ResponseCache
+
+
+def test_key_keeps_case_and_normalizes_whitespace():
+    cache = ResponseCache(max_size=8, ttl=60)
+    cache.set("BLOOM", "ich habe das buch gelesen", "", {"response": "Ich habe das Buch gelesen."}, 1.0)
+    assert cache.get("BLOOM", "ich  habe das buch\ngelesen", "") == {"response": "Ich habe das Buch gelesen."}
+    assert cache.get("BLOOM", "Ich habe das Buch gelesen", "") is None
+
+
+def test_similar_queries_only_match_on_opted_in_routes():
+    cache = ResponseCache(max_size=8, ttl=60, similarity=0.98, similar_routes=["MISTRAL"])
+    embedding = np.array([1.0, 0.0, 0.0])
+    close = np.array([1.0, 0.01, 0.0])
+    for route in ("MISTRAL", "ZEPHYR"):
+        cache.set(route, "Zitat von S. 12", "", {"response": route}, 1.0, embedding)
+        assert cache.matches_similar(route) == (route == "MISTRAL")
+    assert cache.get("MISTRAL", "Zitat von S. 45", "", close) == {"response": "MISTRAL"}
+    assert cache.get("ZEPHYR", "Zitat von S. 45", "", close) is None
@@ -0,0 +1,58 @@
+"""
+Lookup and corpus-version invalidation of the RetrievalCache. Run with `python -m pytest` from this directory.
+"""
+from retrieval_cache import RetrievalCache
+
+SCOPE = (5, None)
+RESULT = {"ids": [["a"]], "documents": [["Zitierweise nach APA"]]}
+
+
+def make_cache(versions):
+    return RetrievalCache(lambda: versions[0], max_size=16, ttl=60, similarity=0.95, check_interval=0)
+
+
+def test_exact_and_neighbour_hits_stay_within_their_scope():
+    cache = make_cache(["v1"])
+    cache.set("Wie zitiere ich?", [1.0, 0.0], SCOPE, RESULT)
+    assert cache.get("  wie ZITIERE ich? ", [0.0, 1.0], SCOPE) == RESULT
+    assert cache.get("Wie zitiere ich richtig?", [0.99, 0.05], SCOPE) == RESULT
+    assert cache.get("Wie zitiere ich richtig?", [0.99, 0.05], (3, None)) is None
+    assert cache.get("Gliederung", [0.0, 1.0], SCOPE) is None
+    assert (cache.hits, cache.neighbour_hits, cache.misses) == (1, 1, 2)
+
+
+def test_changed_corpus_version_clears_the_cache():
+    versions = ["v1"]
+    cache = make_cache(versions)
+    cache.check_version()
+    cache.set("Wie zitiere ich?", [1.0, 0.0], SCOPE, RESULT)
+
+    cache.check_version()
+    assert cache.get("Wie zitiere ich?", [1.0, 0.0], SCOPE) == RESULT
+
+    versions[0] = "v2"
+    cache.check_version()
+    assert cache.get("Wie zitiere ich?", [1.0, 0.0], SCOPE) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["corpus_version"] == "v2"
+
+
+def test_version_is_checked_at_most_every_interval():
+    versions = ["v1"]
+    cache = RetrievalCache(lambda: versions[0], similarity=0.95, check_interval=3600)
+    cache.check_version()
+    cache.set("Wie zitiere ich?", [1.0, 0.0], SCOPE, RESULT)
+    versions[0] = "v2"
+    cache.check_version()
+    assert cache.get("Wie zitiere ich?", [1.0, 0.0], SCOPE) == RESULT
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_unreadable_version_keeps_the_cache():
+    def version():
+        raise ConnectionError("Chroma is down")
+
+    cache = RetrievalCache(version, similarity=0.95, check_interval=0)
+    cache.set("Wie zitiere ich?", [1.0, 0.0], SCOPE, RESULT)
+    cache.check_version()
+    assert cache.get("Wie zitiere ich?", [1.0, 0.0], SCOPE) == RESULT
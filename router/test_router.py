@@ -0,0 +1,70 @@
+"""
+Endpoint checks for the router with the classifier replaced by a test double and no agents running.
+Needs the router requirements; run with `python -m pytest` from this directory.
+"""
+import json
+
+import chromadb
+import pytest
+from fastapi.testclient import TestClient
+
+import router
+from metrics import RouterMetrics
+from response_cache import ResponseCache
+from session_store import InMemorySessionStore
+
+
+class FixedClassifier:
+    """Prototype classifier stand-in that always answers with the same label."""
+
+    def __init__(self, label):
+        self.label = label
+
+    def classify(self, text):
+        return self.label, {}
+
+    def record_fallback(self, seconds):
+        pass
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(router, "READY_WAIT_SECONDS", 0.05)
+    state = router.app.state
+    state.sessions = InMemorySessionStore()
+    state.retriever = None
+    state.classifier = FixedClassifier("grammar")
+    state.metrics = RouterMetrics()
+    # The readiness watcher is not started, so every agent counts as still loading.
+    state.model_client = router.ModelClient(state.metrics)
+    state.response_cache = ResponseCache()
+    # Used without `with`, so the lifespan (embedding model, Chroma) is not run.
+    return TestClient(router.app)
+
+
+def test_not_ready_agent_returns_503(client):
+    response = client.post("/process/", json={"text": "Verbessere: Main Nahme isd Mike.", "session_id": "ready"})
+    assert response.status_code == 503
+    assert "BLOOM" in response.json()["detail"]
+
+
+def test_not_ready_agent_streams_error_event(client):
+    response = client.post("/process/stream/", json={"text": "Verbessere: Main Nahme isd Mike.", "session_id": "stream"})
+    assert response.status_code == 200
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert "error" in events[0]
+    assert events[-1] == {"done": True}
+
+
+def test_chroma_backend_queries_with_precomputed_embeddings(monkeypatch):
+    client = chromadb.EphemeralClient()
+    monkeypatch.setattr(chromadb, "HttpClient", lambda host, port: client)
+    backend = router.ChromaBackend("dhbw_rules_test")
+    backend.collection.add(ids=["a", "b"], documents=["A", "B"], embeddings=[[1.0, 0.0], [0.0, 1.0]],
+                           metadatas=[{"tag_Gliederung": True}, {"tag_Zitierweise": True}])
+    assert backend.query([[0.9, 0.1]], 1)["ids"] == [["a"]]
+    assert backend.query([[0.9, 0.1]], 1, where={"tag_Zitierweise": True})["ids"] == [["b"]]
+    client.delete_collection("dhbw_rules_test")
@@ -0,0 +1,68 @@
+"""
+Eviction and persistence of the session stores, and that the SQLite store does not block the event loop.
+Run with `python -m pytest` from this directory.
+"""
+import asyncio
+import threading
+import time
+
+from session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = InMemorySessionStore(max_sessions=2)
+    store.save("a", {"input_state": "REQUEST"})
+    store.save("b", {"input_state": "CONFIRM"})
+    assert store.load("a") == {"input_state": "REQUEST"}
+    store.save("c", {"input_state": "CHOOSE_MODEL"})
+    assert store.load("b") is None
+    assert store.load("a") is not None and store.load("c") is not None
+
+
+def test_memory_store_returns_copies():
+    store = InMemorySessionStore()
+    data = {"input_state": "REQUEST"}
+    store.save("a", data)
+    data["input_state"] = "CONFIRM"
+    store.load("a")["input_state"] = "CHOOSE_MODEL"
+    assert store.load("a") == {"input_state": "REQUEST"}
+
+
+def test_sqlite_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).save("a", {"input_state": "CONFIRM", "text": "Wie zitiere ich?"})
+    other = SQLiteSessionStore(path)
+    assert other.load("a") == {"input_state": "CONFIRM", "text": "Wie zitiere ich?"}
+    other.delete("a")
+    assert SQLiteSessionStore(path).load("a") is None
+
+
+def test_sqlite_store_prunes_oldest_and_expired_sessions(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_sessions=2, ttl=0.2)
+    for session_id in ["a", "b", "c"]:
+        store.save(session_id, {"id": session_id})
+    assert store.load("a") is None
+    assert store.load("b") == {"id": "b"} and store.load("c") == {"id": "c"}
+    time.sleep(0.3)
+    assert store.load("c") is None
+
+
+def test_sqlite_store_runs_queries_off_the_event_loop(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    threads = []
+    load = store.load
+
+    def recording_load(session_id):
+        threads.append(threading.get_ident())
+        return load(session_id)
+
+    store.load = recording_load
+
+    async def round_trip():
+        await store.asave("a", {"input_state": "REQUEST"})
+        data = await store.aload("a")
+        await store.adelete("a")
+        return data, await store.aload("a")
+
+    assert asyncio.run(round_trip()) == ({"input_state": "REQUEST"}, None)
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,84 @@
+"""
+Trace propagation from the router to an agent: one /process/ call against stub_agent.py must reach the agent
+with the router's trace id in the traceparent header, and both sides must write their spans to TRACE_DIR.
+Router and stub run in-process over ASGI transports; run with `python -m pytest` from this directory.
+"""
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+import router
+import stub_agent
+from metrics import RouterMetrics
+from response_cache import ResponseCache
+from session_store import InMemorySessionStore
+from test_router import FixedClassifier
+from tracing import HEADER, SpanContext, Tracer, format_header, new_id, parse_header
+
+TRACE_ID = new_id(128)
+
+
+def traced(app, tracer):
+    """`app` behind the tracing middleware of `tracer`; the apps were created while tracing was off."""
+    outer = FastAPI()
+    tracer.install(outer)
+    outer.mount("/", app)
+    return outer
+
+
+def read_spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+async def process(router_app, agent_app, sent_headers):
+    state = router.app.state
+    state.sessions = InMemorySessionStore()
+    state.retriever = None
+    state.classifier = FixedClassifier("grammar")
+    state.metrics = RouterMetrics()
+    state.model_client = router.ModelClient(state.metrics)
+    state.response_cache = ResponseCache()
+    await state.model_client.http.aclose()
+
+    async def remember_headers(request):
+        sent_headers.append(dict(request.headers))
+
+    state.model_client.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=agent_app), base_url="http://stub",
+                                                event_hooks={"request": [remember_headers]})
+    for event in state.model_client.ready.values():
+        event.set()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=router_app), base_url="http://router") as client:
+        response = await client.post("/process/", json={"text": "Verbessere: Main Nahme isd Mike.",
+                                                        "session_id": "trace", "no_cache": True},
+                                     headers={HEADER: format_header(SpanContext(TRACE_ID, new_id(64)))})
+    await state.model_client.close()
+    return response
+
+
+def test_trace_id_reaches_the_agent_and_both_record_spans(tmp_path, monkeypatch):
+    router_tracer = Tracer("router", str(tmp_path))
+    agent_tracer = Tracer("stub_bloom", str(tmp_path))
+    monkeypatch.setattr(router, "tracer", router_tracer)
+    monkeypatch.setattr(stub_agent, "tracer", agent_tracer)
+    for stage in stub_agent.STAGE_SECONDS:
+        monkeypatch.setitem(stub_agent.STAGE_SECONDS, stage, 0.0)
+
+    sent_headers = []
+    response = asyncio.run(process(traced(router.app, router_tracer), traced(stub_agent.app, agent_tracer),
+                                   sent_headers))
+    assert response.status_code == 200, response.text
+    assert parse_header(response.headers[HEADER]).trace_id == TRACE_ID
+
+    router_spans = read_spans(tmp_path / "router.jsonl")
+    agent_spans = read_spans(tmp_path / "stub_bloom.jsonl")
+    assert {span["trace_id"] for span in router_spans + agent_spans} == {TRACE_ID}
+
+    call = next(span for span in router_spans if span["name"] == "call BLOOM")
+    assert [parse_header(headers[HEADER]) for headers in sent_headers] == [SpanContext(TRACE_ID, call["span_id"])]
+    agent_request = next(span for span in agent_spans if span["name"] == "POST /process/")
+    assert agent_request["parent_id"] == call["span_id"]
+    assert {"queue", "tokenize", "prefill", "decode"} <= {span["name"] for span in agent_spans}
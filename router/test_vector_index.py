@@ -0,0 +1,35 @@
+import numpy as np
+
+from vector_index import VectorIndex, write_vector_index
+
+METADATAS = [
+    {"headings": "7 Modul Bachelorarbeit, 7.1 Anforderungen", "tag_Gliederung": True},
+    {"headings": "7 Modul Bachelorarbeit, 7.2 Zitierweise", "tag_Zitierweise": True},
+    {"headings": "7 Modul Bachelorarbeit"},
+]
+
+
+def write_index(directory, version="v1"):
+    embeddings = np.eye(3, dtype=np.float32)
+    write_vector_index(directory, ["a", "b", "c"], ["A", "B", "C"], METADATAS, embeddings, version)
+
+
+def test_missing_index_is_empty_until_exported(tmp_path, caplog):
+    index = VectorIndex(str(tmp_path))
+    assert len(index) == 0 and index.version is None
+    assert "No vector index" in caplog.text
+    assert index.query([[1.0, 0.0, 0.0]], 2) == {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    write_index(str(tmp_path))
+    assert index.reload()
+    assert index.version == "v1"
+    assert index.query([[1.0, 0.0, 0.0]], 1)["ids"] == [["a"]]
+
+
+def test_where_compares_exact_values(tmp_path):
+    write_index(str(tmp_path))
+    index = VectorIndex(str(tmp_path))
+    query = [[0.0, 0.0, 1.0]]
+    assert index.query(query, 3, where={"tag_Gliederung": True})["ids"] == [["a"]]
+    # Comma-joined headings are one string, not a list: only the whole value matches.
+    assert index.query(query, 3, where={"headings": "7 Modul Bachelorarbeit"})["ids"] == [["c"]]
+    assert index.query(query, 3, where={"headings": "7.2 Zitierweise"})["ids"] == [[]]
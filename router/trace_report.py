@@ -0,0 +1,91 @@
+"""
+Merges the span files written with TRACE_DIR (one JSON-lines file per service) and shows where the
+time of a request went:
+
+    python trace_report.py traces/*.jsonl                  # the slowest traces and their slowest span
+    python trace_report.py traces/*.jsonl --trace <id>     # span tree of a single trace
+
+The trace id of a request is logged by the router and returned in its traceparent response header.
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def load_spans(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def end(span):
+    return span["start"] + span["duration_ms"] / 1000
+
+
+def duration_ms(spans):
+    return (max(end(span) for span in spans) - min(span["start"] for span in spans)) * 1000
+
+
+def slowest_leaf(spans):
+    """The longest span without children, i.e. the innermost place the time was spent."""
+    parents = {span["parent_id"] for span in spans}
+    leaves = [span for span in spans if span["span_id"] not in parents] or spans
+    return max(leaves, key=lambda span: span["duration_ms"])
+
+
+def print_summary(traces, limit):
+    print(f"{'trace id':<34}{'ms':>10}{'spans':>7}  slowest span")
+    ranked = sorted(traces.items(), key=lambda item: duration_ms(item[1]), reverse=True)[:limit]
+    for trace_id, spans in ranked:
+        leaf = slowest_leaf(spans)
+        print(f"{trace_id:<34}{duration_ms(spans):>10.1f}{len(spans):>7}  "
+              f"{leaf['service']}/{leaf['name']} {leaf['duration_ms']:.1f} ms")
+
+
+def print_tree(spans):
+    children = defaultdict(list)
+    ids = {span["span_id"] for span in spans}
+    for span in spans:
+        # Spans whose parent was not exported (e.g. by a caller without TRACE_DIR) are shown as roots.
+        children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+    origin = min(span["start"] for span in spans)
+
+    def walk(parent_id, depth):
+        for span in sorted(children[parent_id], key=lambda s: s["start"]):
+            attributes = " ".join(f"{key}={value}" for key, value in span.get("attributes", {}).items())
+            print(f"{(span['start'] - origin) * 1000:>9.1f} {span['duration_ms']:>9.1f}  "
+                  f"{'  ' * depth}{span['service']}/{span['name']} {attributes}".rstrip())
+            walk(span["span_id"], depth + 1)
+
+    print(f"{'start ms':>9} {'ms':>9}  span")
+    walk(None, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--trace", help="print the span tree of this trace id")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    traces = load_spans(args.files)
+    if args.trace:
+        if args.trace not in traces:
+            parser.error(f"trace {args.trace} not found")
+        print_tree(traces[args.trace])
+    else:
+        print_summary(traces, args.limit)
+
+
+if __name__ == "__main__":
+    main()
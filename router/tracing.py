@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+# Spans are appended as JSON lines to TRACE_DIR/<TRACE_SERVICE>.jsonl; without TRACE_DIR tracing is off
+# and every call returns right away.
+TRACE_DIR = os.environ.get("TRACE_DIR", "")
+TRACE_SERVICE = os.environ.get("TRACE_SERVICE", "service")
+# W3C trace context header: 00-<trace id>-<parent span id>-<flags>
+HEADER = "traceparent"
+
+_DISABLED = nullcontext()
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+
+
+def new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_header(value: Optional[str]) -> Optional[SpanContext]:
+    """SpanContext of a traceparent header, or None if the header is missing or malformed."""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+def format_header(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-01"
+
+
+# The span of the code currently running, and the request spans of the batch a worker thread is processing.
+_current = ContextVar("trace_span", default=None)
+_batch = ContextVar("trace_batch", default=())
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "parent", "attributes", "context", "token", "start")
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = self.parent or _current.get()
+        self.parent = parent
+        self.context = SpanContext(parent.trace_id if parent else new_id(128), new_id(64))
+        self.token = _current.set(self.context)
+        self.start = time.time()
+        return self.context
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.export(self.name, self.context, self.parent, self.start, time.time(), self.attributes)
+        return False
+
+
+class Tracer:
+    """
+    Minimal request tracing across the router and the agents.
+
+    The router opens a root span per request (or continues the trace of an incoming traceparent
+    header) and sends the current span as traceparent to the agents, which record their spans as
+    children. Every service appends its finished spans to its own JSON-lines file; trace_report.py
+    merges the files and shows where the time of a single request went.
+    """
+
+    def __init__(self, service: str = TRACE_SERVICE, directory: str = TRACE_DIR):
+        self.service = service
+        self.path = os.path.join(directory, f"{service}.jsonl") if directory else ""
+        self.enabled = bool(directory)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[SpanContext]:
+        return _current.get() if self.enabled else None
+
+    def span(self, name: str, parent: SpanContext = None, **attributes):
+        """Context manager for a child span of `parent` or of the current span; yields its SpanContext."""
+        if not self.enabled:
+            return _DISABLED
+        return _Span(self, name, parent, attributes)
+
+    def record(self, name: str, parent: Optional[SpanContext], start: float, end: float, **attributes):
+        """Exports an already measured interval (time.time() values) as a child span of `parent`."""
+        if self.enabled and parent is not None:
+            self.export(name, SpanContext(parent.trace_id, new_id(64)), parent, start, end, attributes)
+
+    def batch(self, parents):
+        """Context manager marking the requests of a batch; record_batch() attributes spans to all of them."""
+        if not self.enabled:
+            return _DISABLED
+        return _BatchScope(tuple(parent for parent in parents if parent is not None))
+
+    def record_batch(self, name: str, start: float, end: float, **attributes):
+        """Records the interval once for every request of the running batch, or for the current span."""
+        if not self.enabled:
+            return
+        parents = _batch.get() or ((_current.get(),) if _current.get() else ())
+        for parent in parents:
+            self.record(name, parent, start, end, batch_size=len(parents), **attributes)
+
+    def traced(self) -> bool:
+        """True if spans recorded now would belong to at least one trace."""
+        return self.enabled and bool(_batch.get() or _current.get())
+
+    def headers(self) -> dict:
+        """traceparent header carrying the current span, for requests to the next hop."""
+        context = self.current()
+        return {HEADER: format_header(context)} if context else {}
+
+    def install(self, app):
+        """Adds a middleware that records a span per HTTP request, continuing the caller's trace."""
+        if not self.enabled:
+            return
+
+        @app.middleware("http")
+        async def trace_requests(request, call_next):
+            parent = parse_header(request.headers.get(HEADER))
+            # Streaming responses are still being sent when this span ends; their spans are recorded separately.
+            with self.span(f"{request.method} {request.url.path}", parent=parent) as context:
+                response = await call_next(request)
+                response.headers[HEADER] = format_header(context)
+                return response
+
+    def export(self, name, context, parent, start, end, attributes):
+        record = {
+            "trace_id": context.trace_id,
+            "span_id": context.span_id,
+            "parent_id": parent.span_id if parent else None,
+            "service": self.service,
+            "name": name,
+            "start": round(start, 6),
+            "duration_ms": round((end - start) * 1000, 3),
+            "attributes": attributes,
+        }
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logging.warning(f"Could not write span to {self.path}: {e}")
+
+
+class _BatchScope:
+    __slots__ = ("parents", "token")
+
+    def __init__(self, parents):
+        self.parents = parents
+
+    def __enter__(self):
+        self.token = _batch.set(self.parents)
+
+    def __exit__(self, *exc):
+        _batch.reset(self.token)
+        return False
+
+
+tracer = Tracer()
@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache with a time-to-live per entry.
+
+    Entries older than `ttl` seconds are treated as missing and dropped on access.
+    If more than `max_size` entries are stored, the least recently used ones are evicted.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if self._expired(stored_at, now):
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Returns a snapshot of all live (key, value) pairs, most recently used last."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (stored_at, _) in self._data.items() if self._expired(stored_at, now)]:
+                del self._data[key]
+            return [(key, value) for key, (_, value) in self._data.items()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)